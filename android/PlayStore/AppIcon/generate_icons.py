@@ -3,27 +3,46 @@
 ephenotes Android Icon Generator
 
 This script generates all required Android icon sizes from a source 512x512 image.
-It creates icons for all density buckets (mdpi through xxxhdpi) and the Play Store.
+It creates icons for all density buckets (mdpi through xxxhdpi) and the Play Store:
+the launcher icon, the adaptive icon layers and XML (with the monochrome layer for
+themed icons) and a legacy round icon. Icons that are already up to date are skipped.
 
 Requirements:
-    - Python 3.6+
+    - Python 3.8+
     - Pillow (PIL): pip install Pillow
+    - NumPy for --resampler linear, --mask-report and --qa (optional): pip install numpy
+    - CairoSVG for SVG sources (optional): pip install cairosvg
 
 Usage:
-    python generate_icons.py [source_image.png]
+    python generate_icons.py [source_image.png] [--jobs N]
     
     If no source image is provided, it looks for 'icon-512.png' in the current directory.
+    See --help for every option and scripts/README.md for how they work.
 """
 
+import argparse
+import functools
+import importlib.util
 import os
+import re
 import sys
+import time
 from pathlib import Path
-try:
-    from PIL import Image
-except ImportError:
-    print("Error: Pillow library not found.")
-    print("Install it with: pip install Pillow")
-    sys.exit(1)
+
+# Shared icon pipeline helpers live in scripts/icon_pipeline
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'scripts'))
+from icon_pipeline import trace
+from icon_pipeline.cache import MANIFEST_NAME, IconCache, file_digest
+from icon_pipeline.encode import DEFAULT_STRATEGY, DETERMINISTIC, STRATEGIES, describe, encoder_fingerprint
+from icon_pipeline.graph import action_node, build, image_node, metadata_nodes, print_targets, select
+from icon_pipeline.ingest import decode_estimate, ingest, peak_rss
+from icon_pipeline.layers import ADAPTIVE_CANVAS_DP, ADAPTIVE_VIEWPORT_DP, legacy_foreground_size, safe_zone_size
+from icon_pipeline.pyramid import DEFAULT_MIN_RATIO, draft_master, print_quality_report, quality_report
+from icon_pipeline.render import DEFAULT_RESAMPLER, RESAMPLERS, RenderJob, Renderer, render_targets
+from icon_pipeline.sinks import ARCHIVE_SUFFIXES, FileSink, archive_suffix, open_sink
+from icon_pipeline.svg import SvgMaster, as_image, is_svg, rasterizer_available, svg_source_key
+from icon_pipeline.verify import expected_icons, verify_icons
+from icon_pipeline.watch import watch
 
 
 # Android icon sizes for different density buckets
@@ -35,7 +54,7 @@ ANDROID_ICON_SIZES = {
     'xxxhdpi': 192,  # 4.0x
 }
 
-# Adaptive icon sizes (foreground and background layers)
+# Adaptive icon sizes (foreground, background and monochrome layers)
 ADAPTIVE_ICON_SIZES = {
     'mdpi': 108,     # 1.0x
     'hdpi': 162,     # 1.5x
@@ -44,30 +63,87 @@ ADAPTIVE_ICON_SIZES = {
     'xxxhdpi': 432,  # 4.0x
 }
 
+# Default adaptive icon background color (Material Blue 500)
+DEFAULT_BACKGROUND_COLOR = '#2196F3'
+
+# Adaptive icon definition, shared by ic_launcher.xml and ic_launcher_round.xml
+ADAPTIVE_ICON_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<adaptive-icon xmlns:android="http://schemas.android.com/apk/res/android">
+    <background android:drawable="@color/ic_launcher_background"/>
+    <foreground android:drawable="@mipmap/ic_launcher_foreground"/>
+    <monochrome android:drawable="@mipmap/ic_launcher_monochrome"/>
+</adaptive-icon>
+'''
+ADAPTIVE_ICON_XML_NAMES = ('ic_launcher.xml', 'ic_launcher_round.xml')
+
+# Play Console rejects hi-res icons larger than this
+PLAY_STORE_MAX_BYTES = 1024 * 1024
+
+# Smallest side kept when --memory-budget reduces a huge source (2x the largest icon)
+WORKING_SIZE = 1024
 
-def validate_source_image(image_path):
-    """Validate that the source image meets requirements."""
+# Sources whose decoded frame is larger than this get a --memory-budget hint
+LARGE_SOURCE_BYTES = 512 * 1024 * 1024
+
+
+def load_pillow():
+    """Import Pillow's Image module on first pixel work, exiting with a hint if it is missing."""
+    try:
+        from PIL import Image
+    except ImportError:
+        print("Error: Pillow library not found.")
+        print("Install it with: pip install Pillow")
+        sys.exit(1)
+    return Image
+
+
+def open_source_image(image_path):
+    """Open the source image without decoding its pixel data; an SVG source becomes an SvgMaster."""
+    Image = load_pillow()
     if not os.path.exists(image_path):
         print(f"Error: Source image not found: {image_path}")
-        return False
+        return None
     
     try:
-        img = Image.open(image_path)
-        width, height = img.size
-        
-        if width < 512 or height < 512:
-            print(f"Error: Source image must be at least 512x512 pixels.")
-            print(f"Current size: {width}x{height}")
-            return False
-        
-        if width != height:
-            print(f"Warning: Source image is not square ({width}x{height}).")
-            print("It will be cropped to square.")
-        
-        return True
+        if is_svg(image_path):
+            return SvgMaster(image_path)
+        return Image.open(image_path)
     except Exception as e:
         print(f"Error: Could not open source image: {e}")
+        return None
+
+
+def validate_source_image(source):
+    """Validate that the source image (path or PIL image) meets requirements."""
+    if isinstance(source, (str, os.PathLike)):
+        source = open_source_image(source)
+        if source is None:
+            return False
+    
+    if isinstance(source, SvgMaster):
+        # Vector sources have no minimum size: every icon is drawn at its own
+        if not rasterizer_available():
+            print("Error: SVG sources need CairoSVG.")
+            print("Install it with: pip install cairosvg")
+            return False
+        return True
+    
+    width, height = source.size
+    
+    if width < 512 or height < 512:
+        print(f"Error: Source image must be at least 512x512 pixels.")
+        print(f"Current size: {width}x{height}")
         return False
+    
+    if width != height:
+        print(f"Warning: Source image is not square ({width}x{height}).")
+        print("It will be cropped to square.")
+    
+    if decode_estimate(source) > LARGE_SOURCE_BYTES:
+        print(f"Note: Decoding this {width}x{height} source needs "
+              f"{decode_estimate(source) / 2**20:.0f} MB; use --memory-budget to bound it.")
+    
+    return True
 
 
 def make_square(image):
@@ -86,208 +162,686 @@ def make_square(image):
     return image.crop((left, top, right, bottom))
 
 
-def generate_launcher_icons(source_image_path, output_base_dir):
-    """Generate launcher icons for all density buckets."""
-    print("\n📱 Generating launcher icons...")
+def prepare_master(source, draft_size=None):
+    """
+    Prepare the in-memory master shared by every generation stage.
+    
+    The source (path or PIL image) is decoded, cropped to square, converted
+    to RGBA and upscaled to 512x512 if smaller. Passing an already prepared
+    master returns it unchanged, so stages can be chained without re-decoding.
+    With draft_size, JPEG sources are decoded at a reduced scale of at least
+    that many pixels. An SVG source (path or SvgMaster) is returned as an
+    SvgMaster, which the renderer rasterizes at every icon size.
+    """
+    Image = load_pillow()
+    if is_svg(source):
+        source = SvgMaster(source)
+    if isinstance(source, SvgMaster):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        image = Image.open(source)
+    else:
+        image = source
     
-    # Open and prepare source image
-    source = Image.open(source_image_path)
-    source = make_square(source)
+    if draft_size:
+        draft_master(image, draft_size)
+    
+    with trace.span('decode', size='{}x{}'.format(*image.size)):
+        image.load()
+    
+    with trace.span('make_square'):
+        image = make_square(image)
+    
+    if image.mode != 'RGBA':
+        with trace.span('convert', mode=image.mode):
+            image = image.convert('RGBA')
     
     # Ensure source is at least 512x512
-    if source.size[0] < 512:
-        source = source.resize((512, 512), Image.LANCZOS)
+    if image.size[0] < 512:
+        with trace.span('resize', size='512x512'):
+            image = image.resize((512, 512), Image.LANCZOS)
+    
+    return image
+
+
+def _default_renderer(source):
+    """Serial renderer that only decodes a source path if a target is stale."""
+    if isinstance(source, (str, os.PathLike)):
+        source_key = svg_source_key(source) if is_svg(source) else file_digest(source)
+        return Renderer(lambda: prepare_master(source), source_key=source_key)
+    return Renderer(prepare_master(source))
+
+
+def _report(density, size, output_path, rendered, renderer, job):
+    if rendered:
+        summary = describe(renderer.encoded(job), job.budget)
+        print(f"  ✓ {density:8s} {size:3d}x{size:3d}px → {output_path} ({summary})")
+    else:
+        print(f"  = {density:8s} {size:3d}x{size:3d}px unchanged → {output_path}")
+
+
+def launcher_targets(output_base_dir):
+    """(output_path, RenderJob) pairs of the launcher icons."""
+    targets = []
+    for density, size in ANDROID_ICON_SIZES.items():
+        output_path = os.path.join(output_base_dir, f'mipmap-{density}', 'ic_launcher.png')
+        targets.append((output_path, RenderJob((size, size))))
+    return targets
+
+
+def adaptive_targets(output_base_dir):
+    """(output_path, RenderJob) pairs of the adaptive icon foreground layers."""
+    # For adaptive icons, we need to add padding
+    # The safe zone is 66dp out of 108dp (61%)
+    # So we scale the icon to 61% and center it on a transparent canvas
+    targets = []
+    for density, size in ADAPTIVE_ICON_SIZES.items():
+        foreground_size = safe_zone_size(size)
+        output_path = os.path.join(output_base_dir, f'mipmap-{density}', 'ic_launcher_foreground.png')
+        targets.append((output_path, RenderJob((foreground_size, foreground_size), (size, size))))
+    return targets
+
+
+def monochrome_targets(output_base_dir):
+    """
+    (output_path, RenderJob) pairs of the monochrome layers that Android 13+
+    tints for themed icons: the foreground's silhouette on the same canvas.
+    """
+    targets = []
+    for (output_path, job), density in zip(adaptive_targets(output_base_dir), ADAPTIVE_ICON_SIZES):
+        output_path = os.path.join(output_base_dir, f'mipmap-{density}', 'ic_launcher_monochrome.png')
+        targets.append((output_path, job._replace(layer='monochrome')))
+    return targets
+
+
+def round_targets(output_base_dir, background_color=None):
+    """
+    (output_path, RenderJob) pairs of the legacy round launcher icons used
+    before Android 8.0: the adaptive icon's viewport over the background
+    color, masked to a circle.
+    """
+    background_color = background_color or DEFAULT_BACKGROUND_COLOR
+    targets = []
+    for density, size in ANDROID_ICON_SIZES.items():
+        foreground_size = legacy_foreground_size(size)
+        output_path = os.path.join(output_base_dir, f'mipmap-{density}', 'ic_launcher_round.png')
+        targets.append((output_path, RenderJob((foreground_size, foreground_size), (size, size),
+                                               layer='round', background=background_color)))
+    return targets
+
+
+def play_store_targets(output_dir):
+    """(output_path, RenderJob) pair of the Play Store icon, which must stay under 1 MB."""
+    output_path = os.path.join(output_dir, 'icon-512.png')
+    return [(output_path, RenderJob((512, 512), budget=PLAY_STORE_MAX_BYTES))]
+
+
+def generate_launcher_icons(source, output_base_dir, renderer=None, cache=None, background_color=None,
+                            sink=None):
+    """
+    Generate launcher and legacy round icons for all density buckets from a path or prepared master.
+    
+    Pass a Renderer built from the same master to share its worker pool, and
+    an IconCache to skip icons that are already up to date. The round icons
+    use background_color, by default the one in ic_launcher_colors.xml.
+    With a sink (see scripts/icon_pipeline/sinks.py) the icons go there
+    instead of to disk.
+    """
+    print("\n📱 Generating launcher icons...")
+    
+    if renderer is None:
+        renderer = _default_renderer(source)
+    
+    background_color = adaptive_background_color(output_base_dir, background_color)
+    targets = launcher_targets(output_base_dir) + round_targets(output_base_dir, background_color)
+    rendered = render_targets(renderer, targets, cache, sink=sink)
     
     generated_count = 0
     
-    for density, size in ANDROID_ICON_SIZES.items():
-        # Resize image
-        resized = source.resize((size, size), Image.LANCZOS)
-        
-        # Create output directory
-        output_dir = os.path.join(output_base_dir, f'mipmap-{density}')
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Save icon
-        output_path = os.path.join(output_dir, 'ic_launcher.png')
-        resized.save(output_path, 'PNG', optimize=True)
-        
-        print(f"  ✓ {density:8s} {size:3d}x{size:3d}px → {output_path}")
-        generated_count += 1
+    for (density, size), (output_path, job), was_rendered in zip(
+            list(ANDROID_ICON_SIZES.items()) * 2, targets, rendered):
+        _report(density, size, output_path, was_rendered, renderer, job)
+        generated_count += was_rendered
     
     print(f"\n✅ Generated {generated_count} launcher icons")
     return generated_count
 
 
-def generate_adaptive_icons(source_image_path, output_base_dir):
-    """Generate adaptive icon foreground layers for all density buckets."""
+def generate_adaptive_icons(source, output_base_dir, renderer=None, cache=None, sink=None):
+    """
+    Generate adaptive icon foreground and monochrome layers for all density buckets from a path or prepared master.
+    
+    Pass a Renderer built from the same master to share its worker pool, an
+    IconCache to skip icons that are already up to date and a sink to write
+    somewhere other than disk.
+    """
     print("\n🎨 Generating adaptive icon layers...")
     
-    # Open and prepare source image
-    source = Image.open(source_image_path)
-    source = make_square(source)
+    if renderer is None:
+        renderer = _default_renderer(source)
     
-    # Ensure source is at least 512x512
-    if source.size[0] < 512:
-        source = source.resize((512, 512), Image.LANCZOS)
+    # Both layers of a density share one resize
+    targets = adaptive_targets(output_base_dir) + monochrome_targets(output_base_dir)
+    rendered = render_targets(renderer, targets, cache, sink=sink)
     
     generated_count = 0
     
-    for density, size in ADAPTIVE_ICON_SIZES.items():
-        # For adaptive icons, we need to add padding
-        # The safe zone is 66dp out of 108dp (61%)
-        # So we scale the icon to 61% and center it
-        safe_zone_size = int(size * 0.61)
-        
-        # Resize icon to safe zone size
-        resized = source.resize((safe_zone_size, safe_zone_size), Image.LANCZOS)
-        
-        # Create new image with full size and transparent background
-        adaptive = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-        
-        # Paste resized icon in center
-        offset = (size - safe_zone_size) // 2
-        adaptive.paste(resized, (offset, offset), resized if resized.mode == 'RGBA' else None)
-        
-        # Create output directory
-        output_dir = os.path.join(output_base_dir, f'mipmap-{density}')
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Save adaptive icon foreground
-        output_path = os.path.join(output_dir, 'ic_launcher_foreground.png')
-        adaptive.save(output_path, 'PNG', optimize=True)
-        
-        print(f"  ✓ {density:8s} {size:3d}x{size:3d}px → {output_path}")
-        generated_count += 1
+    for (density, size), (output_path, job), was_rendered in zip(
+            list(ADAPTIVE_ICON_SIZES.items()) * 2, targets, rendered):
+        _report(density, size, output_path, was_rendered, renderer, job)
+        generated_count += was_rendered
     
     print(f"\n✅ Generated {generated_count} adaptive icon layers")
     return generated_count
 
 
-def generate_play_store_icon(source_image_path, output_dir):
-    """Generate 512x512 Play Store icon."""
+def generate_play_store_icon(source, output_dir, renderer=None, cache=None, sink=None):
+    """Generate 512x512 Play Store icon from a path or prepared master, to disk or a sink."""
     print("\n🏪 Generating Play Store icon...")
     
-    # Open and prepare source image
-    source = Image.open(source_image_path)
-    source = make_square(source)
-    
-    # Resize to 512x512 if needed
-    if source.size[0] != 512:
-        source = source.resize((512, 512), Image.LANCZOS)
+    if renderer is None:
+        renderer = _default_renderer(source)
+    sink = sink or FileSink()
     
-    # Save Play Store icon
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, 'icon-512.png')
-    source.save(output_path, 'PNG', optimize=True)
+    # Save Play Store icon, resized to 512x512 if needed
+    (output_path, job), = play_store_targets(output_dir)
+    was_rendered, = render_targets(renderer, [(output_path, job)], cache, sink=sink)
     
-    file_size = os.path.getsize(output_path)
+    file_size = sink.size(output_path)
     file_size_kb = file_size / 1024
     
-    print(f"  ✓ 512x512px → {output_path}")
+    if was_rendered:
+        encoded = renderer.encoded(job)
+        print(f"  ✓ 512x512px → {output_path} ({encoded.strategy}, {encoded.seconds * 1000:.0f} ms)")
+    else:
+        print(f"  = 512x512px unchanged → {output_path}")
     print(f"  ℹ File size: {file_size_kb:.1f} KB")
     
-    if file_size > 1024 * 1024:  # 1 MB
+    if file_size > PLAY_STORE_MAX_BYTES:
         print(f"  ⚠ Warning: File size exceeds 1 MB limit!")
     
     print(f"\n✅ Generated Play Store icon")
-    return 1
+    return int(was_rendered)
 
 
-def create_adaptive_icon_xml(output_base_dir):
-    """Create XML files for adaptive icons."""
-    print("\n📄 Creating adaptive icon XML files...")
-    
-    # Create anydpi-v26 directory
-    anydpi_dir = os.path.join(output_base_dir, 'mipmap-anydpi-v26')
-    os.makedirs(anydpi_dir, exist_ok=True)
-    
-    # ic_launcher.xml
-    launcher_xml = '''<?xml version="1.0" encoding="utf-8"?>
-<adaptive-icon xmlns:android="http://schemas.android.com/apk/res/android">
-    <background android:drawable="@color/ic_launcher_background"/>
-    <foreground android:drawable="@mipmap/ic_launcher_foreground"/>
-</adaptive-icon>
-'''
-    
-    launcher_path = os.path.join(anydpi_dir, 'ic_launcher.xml')
-    with open(launcher_path, 'w') as f:
-        f.write(launcher_xml)
-    print(f"  ✓ Created {launcher_path}")
-    
-    # ic_launcher_round.xml
-    round_path = os.path.join(anydpi_dir, 'ic_launcher_round.xml')
-    with open(round_path, 'w') as f:
-        f.write(launcher_xml)
-    print(f"  ✓ Created {round_path}")
-    
-    # Create colors.xml for background color
-    values_dir = os.path.join(output_base_dir, '..', 'values')
-    os.makedirs(values_dir, exist_ok=True)
+def write_adaptive_icon_xml(output_base_dir, name='ic_launcher.xml', sink=None):
+    """Write mipmap-anydpi-v26/<name> (to sink, if given), returning True if it changed."""
+    xml_path = os.path.join(output_base_dir, 'mipmap-anydpi-v26', name)
+    if (sink or FileSink()).write(xml_path, ADAPTIVE_ICON_XML.encode('utf-8')):
+        print(f"  ✓ Created {xml_path}")
+        return True
+    print(f"  ℹ Skipped {xml_path} (unchanged)")
+    return False
+
+
+def adaptive_background_color(output_base_dir, background_color=None):
+    """
+    The adaptive icon background color: background_color if given, else the
+    one in an existing ../values/ic_launcher_colors.xml, else the default.
+    """
+    if background_color:
+        return background_color
+    colors_path = os.path.join(output_base_dir, '..', 'values', 'ic_launcher_colors.xml')
+    try:
+        with open(colors_path, encoding='utf-8') as f:
+            match = re.search(r'<color name="ic_launcher_background">\s*([^<\s]+)\s*</color>', f.read())
+    except OSError:
+        match = None
+    return match.group(1) if match else DEFAULT_BACKGROUND_COLOR
+
+
+def write_colors_xml(output_base_dir, background_color=None, sink=None):
+    """
+    Write ../values/ic_launcher_colors.xml (to sink, if given), returning
+    True if it changed.
+    
+    Without background_color an existing file is left as is (an archive
+    sink gets a copy) and a missing one gets the default brand blue; with
+    background_color the file is (re)written with that color.
+    """
+    sink = sink or FileSink()
+    colors_path = os.path.join(output_base_dir, '..', 'values', 'ic_launcher_colors.xml')
+    if background_color is None and os.path.exists(colors_path):
+        sink.keep(colors_path)
+        print(f"  ℹ Skipped {colors_path} (already exists)")
+        return False
     
-    colors_path = os.path.join(values_dir, 'ic_launcher_colors.xml')
-    if not os.path.exists(colors_path):
-        colors_xml = '''<?xml version="1.0" encoding="utf-8"?>
+    colors_xml = f'''<?xml version="1.0" encoding="utf-8"?>
 <resources>
     <!-- Adaptive icon background color -->
-    <color name="ic_launcher_background">#2196F3</color>
+    <color name="ic_launcher_background">{background_color or DEFAULT_BACKGROUND_COLOR}</color>
 </resources>
 '''
-        with open(colors_path, 'w') as f:
-            f.write(colors_xml)
+    if sink.write(colors_path, colors_xml.encode('utf-8')):
         print(f"  ✓ Created {colors_path}")
-    else:
-        print(f"  ℹ Skipped {colors_path} (already exists)")
+        return True
+    print(f"  ℹ Skipped {colors_path} (unchanged)")
+    return False
+
+
+def create_adaptive_icon_xml(output_base_dir, background_color=None, sink=None):
+    """
+    Create XML files for adaptive icons, on disk or in sink.
+    
+    Without background_color an existing ic_launcher_colors.xml is left as is
+    and a missing one gets the default brand blue; with background_color the
+    file is (re)written with that color.
+    """
+    print("\n📄 Creating adaptive icon XML files...")
+    
+    # ic_launcher.xml and ic_launcher_round.xml share the same definition
+    for name in ADAPTIVE_ICON_XML_NAMES:
+        write_adaptive_icon_xml(output_base_dir, name, sink)
+    
+    # Create colors.xml for background color
+    write_colors_xml(output_base_dir, background_color, sink)
     
     print(f"\n✅ Created adaptive icon XML files")
 
 
+def build_targets(output_base_dir, play_store_dir, renderer, background_color=None, sink=None):
+    """
+    Describe every output as a node of the build graph (see
+    scripts/icon_pipeline/graph.py), tagged with android, its density and its
+    kind (launcher, round, adaptive, monochrome, play-store, xml) for --only
+    selection. The XML actions write to sink, if given.
+    """
+    nodes = []
+    
+    for (density, size), (output_path, job) in zip(ANDROID_ICON_SIZES.items(),
+                                                   launcher_targets(output_base_dir)):
+        nodes.append(image_node(f'mipmap-{density}/ic_launcher.png',
+                                {'android', 'launcher', density}, renderer, output_path, job))
+    
+    round_color = adaptive_background_color(output_base_dir, background_color)
+    for density, (output_path, job) in zip(ANDROID_ICON_SIZES, round_targets(output_base_dir, round_color)):
+        nodes.append(image_node(f'mipmap-{density}/ic_launcher_round.png',
+                                {'android', 'launcher', 'round', density}, renderer, output_path, job))
+    
+    layers = []
+    for density, (output_path, job) in zip(ADAPTIVE_ICON_SIZES, adaptive_targets(output_base_dir)):
+        layers.append(f'mipmap-{density}/ic_launcher_foreground.png')
+        nodes.append(image_node(layers[-1], {'android', 'adaptive', density},
+                                renderer, output_path, job))
+    
+    for density, (output_path, job) in zip(ADAPTIVE_ICON_SIZES, monochrome_targets(output_base_dir)):
+        layers.append(f'mipmap-{density}/ic_launcher_monochrome.png')
+        nodes.append(image_node(layers[-1], {'android', 'adaptive', 'monochrome', density},
+                                renderer, output_path, job))
+    
+    (output_path, job), = play_store_targets(play_store_dir)
+    nodes.append(image_node('icon-512.png', {'android', 'play-store'}, renderer, output_path, job))
+    
+    colors = 'values/ic_launcher_colors.xml'
+    nodes.append(action_node(colors, {'android', 'adaptive', 'xml'},
+                             lambda: write_colors_xml(output_base_dir, background_color, sink)))
+    
+    # The adaptive icon definitions reference the layers and the color
+    for name in ADAPTIVE_ICON_XML_NAMES:
+        nodes.append(action_node(f'mipmap-anydpi-v26/{name}', {'android', 'adaptive', 'xml', 'anydpi'},
+                                 functools.partial(write_adaptive_icon_xml, output_base_dir, name, sink),
+                                 deps=layers + [colors]))
+    
+    return nodes
+
+
+def build_and_report(nodes, selectors, renderer, cache, icon_budget=None, details=True, fsync=False,
+                     sink=None):
+    """
+    Build the selected nodes (to disk, or to sink) and print a line per icon
+    (unless details is False), the Play Store icon size and the total size.
+    Returns the build() results.
+    """
+    sink = sink or FileSink(fsync)
+    results = build(nodes, selectors, cache, sink=sink)
+    cache.save()
+    
+    built = [node for node in nodes if node.target is not None and node.name in results]
+    for node in built if details else ():
+        _, output_path, job = node.target
+        width, height = job.canvas_size or job.size
+        if results[node.name]:
+            summary = describe(renderer.encoded(job), job.budget)
+            print(f"  ✓ {node.name} {width}x{height}px ({summary})")
+        else:
+            print(f"  = {node.name} {width}x{height}px unchanged")
+    
+    if 'icon-512.png' in results:
+        play_store_path = next(node.target[1] for node in built if node.name == 'icon-512.png')
+        file_size = sink.size(play_store_path)
+        print(f"  ℹ Play Store icon size: {file_size / 1024:.1f} KB")
+        if file_size > PLAY_STORE_MAX_BYTES:
+            print(f"  ⚠ Warning: File size exceeds 1 MB limit!")
+    
+    total_size = sum(sink.size(node.target[1]) for node in built)
+    print(f"  ℹ Total icon size: {total_size / 1024:.1f} KB"
+          + (f" (budget {icon_budget:.0f} KB)" if icon_budget else ""))
+    if icon_budget and total_size > icon_budget * 1024:
+        print("  ⚠ Warning: Icons exceed the total size budget!")
+    return results
+
+
+def verify_icon_set(nodes, names=None, cache=None):
+    """
+    Check the existing icon files of the selected nodes from their PNG
+    headers (and against the cache manifest, if given), printing a line per
+    problem. Returns True if every icon is as expected.
+    """
+    start = time.perf_counter()
+    expected = expected_icons(nodes, names)
+    problems = verify_icons(expected, cache)
+    
+    # Play Console's size limit needs only the file size
+    play_store = next((icon.path for icon in expected if os.path.basename(icon.path) == 'icon-512.png'), None)
+    if play_store and os.path.exists(play_store) and os.path.getsize(play_store) > PLAY_STORE_MAX_BYTES:
+        problems.append((play_store, "exceeds the 1 MB Play Store limit"))
+    
+    for path, problem in problems:
+        print(f"  ❌ {path}: {problem}")
+    elapsed = (time.perf_counter() - start) * 1000
+    if problems:
+        print(f"\n❌ {len(problems)} problem(s) in {len(expected)} icons ({elapsed:.1f} ms)")
+        return False
+    print(f"✅ Verified {len(expected)} icons ({elapsed:.1f} ms)")
+    return True
+
+
+def mask_entry(label, master, background_color=None):
+    """
+    (label, master, platform, sizes, background) entry of a prepared master
+    for icon_pipeline.masks.check_masks(): every legacy icon size and every
+    adaptive icon viewport, over the adaptive background color.
+    """
+    from PIL import ImageColor
+    
+    sizes = set(ANDROID_ICON_SIZES.values())
+    sizes |= {size * ADAPTIVE_VIEWPORT_DP // ADAPTIVE_CANVAS_DP for size in ADAPTIVE_ICON_SIZES.values()}
+    background = ImageColor.getrgb(background_color or DEFAULT_BACKGROUND_COLOR)[:3]
+    return (label, master, 'android', sorted(sizes), background)
+
+
+def report_peak_memory(budget, workers=False):
+    """Print the peak memory of this process (and its workers) against the budget."""
+    peak = peak_rss()
+    if peak is None:
+        print("  ℹ Peak memory is not available on this platform")
+        return
+    workers = peak_rss(children=True) if workers else None
+    print(f"  ℹ Peak memory: {peak / 2**20:.0f} MB"
+          + (f" (workers: {workers / 2**20:.0f} MB)" if workers else "")
+          + f", budget {budget / 2**20:.0f} MB")
+    if max(peak, workers or 0) > budget:
+        print("  ⚠ Warning: Peak memory exceeded the budget!")
+
+
 def main():
     """Main function to generate all icons."""
+    parser = argparse.ArgumentParser(description='Generate Android app icons for ephenotes')
+    parser.add_argument('source_image', nargs='?', default='icon-512.png',
+                        help="Path to source image (default: icon-512.png)")
+    parser.add_argument('--adaptive-background', metavar='COLOR',
+                        help='Write this adaptive icon background color to ic_launcher_colors.xml '
+                             f'(default: keep the existing file, or {DEFAULT_BACKGROUND_COLOR} if missing)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes for resize and PNG encode (0 = all CPUs)')
+    parser.add_argument('--pyramid', type=float, nargs='?', const=DEFAULT_MIN_RATIO,
+                        metavar='RATIO',
+                        help='Resize each icon from the smallest already resized icon at least '
+                             f'RATIO times larger (default ratio: {DEFAULT_MIN_RATIO})')
+    parser.add_argument('--resize-report', action='store_true',
+                        help='Compare pyramid and direct resizing for every size and exit')
+    parser.add_argument('--mask-report', nargs='?', const='', metavar='SHEET',
+                        help='Measure how much of the source each launcher mask clips at every size '
+                             'and exit, failing if artwork leaves the 66dp safe zone; with SHEET also '
+                             'write a contact sheet PNG (needs NumPy)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Regenerate every icon, ignoring the cache manifest')
+    parser.add_argument('--cache-manifest',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), MANIFEST_NAME),
+                        help='Path of the cache manifest (default: next to this script)')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='Decode huge sources reduced so that decoding stays within MB megabytes, '
+                             'and report the peak memory')
+    parser.add_argument('--resampler', choices=RESAMPLERS, default=DEFAULT_RESAMPLER,
+                        help='Resize with Pillow\'s LANCZOS, or with LANCZOS in linear light on '
+                             f'premultiplied alpha (linear, needs NumPy; default: {DEFAULT_RESAMPLER})')
+    parser.add_argument('--png-strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f'PNG encoder strategy tried first (default: {DEFAULT_STRATEGY})')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Encode byte-reproducible icons without ancillary chunks at pinned zlib '
+                             'settings instead of with --png-strategy, and record the encoder '
+                             'fingerprint in the cache manifest')
+    parser.add_argument('--icon-budget', type=float, metavar='KB',
+                        help='Total size budget of all generated icons; the largest are re-encoded '
+                             'with more thorough strategies until it is met')
+    parser.add_argument('--only', action='append', metavar='SELECTOR',
+                        help='Build only matching targets and what they depend on: a tag such as '
+                             'xxhdpi, launcher, adaptive or play-store, tags joined by colons '
+                             '(adaptive:xxhdpi), or a target name pattern (repeatable)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and regenerate the icons whenever the source image changes')
+    parser.add_argument('--list-targets', action='store_true',
+                        help='List the targets (and their tags) that would be built, and exit')
+    parser.add_argument('--metadata-only', action='store_true',
+                        help='Write only the adaptive icon XML and colors, without opening the source')
+    parser.add_argument('--verify', nargs='?', const='', metavar='MANIFEST',
+                        help='Check the existing icons from their PNG headers instead of generating '
+                             'them; with MANIFEST (such as the cache manifest) also compare their hashes')
+    parser.add_argument('--fsync', action='store_true',
+                        help='Flush each batch of icons to disk before moving it into place')
+    parser.add_argument('--archive', metavar='PATH',
+                        help='Write the icons and XML into one archive instead of loose files, named '
+                             f'relative to the repository ({", ".join(ARCHIVE_SUFFIXES)})')
+    parser.add_argument('--qa', nargs='?', const='', metavar='GOLDENS',
+                        help='After building, score every icon (SSIM, PSNR, legibility) against a '
+                             'reference rendering and the golden images in GOLDENS, failing below '
+                             'the thresholds (needs NumPy)')
+    parser.add_argument('--qa-threshold', action='append', metavar='NAME=VALUE',
+                        help='Override a --qa threshold: ssim, psnr, legibility, golden-ssim or '
+                             'golden-psnr (repeatable)')
+    parser.add_argument('--update-goldens', action='store_true',
+                        help='With --qa GOLDENS, store the icons as the new golden images')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write a Chrome/Perfetto trace of every stage and target to FILE (JSON)')
+    parser.add_argument('--trace-summary', action='store_true',
+                        help='Print wall time, CPU time and bytes per stage at the end')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write cProfile stats of the main process to FILE')
+    args = parser.parse_args()
+    
+    # Determine output directories
+    script_dir = Path(__file__).parent
+    repo_root = script_dir.parent.parent.parent
+    android_res_dir = repo_root / 'android' / 'app' / 'src' / 'main' / 'res'
+    play_store_dir = script_dir
+    
+    if args.archive is not None:
+        if archive_suffix(args.archive) is None:
+            print(f"Error: --archive needs one of {', '.join(ARCHIVE_SUFFIXES)}")
+            sys.exit(1)
+        if args.watch or args.qa is not None or args.verify is not None:
+            print("Error: --archive cannot be combined with --watch, --qa or --verify")
+            sys.exit(1)
+    
+    if args.deterministic:
+        if args.icon_budget:
+            print("Error: --icon-budget cannot be combined with --deterministic")
+            sys.exit(1)
+        args.png_strategy = DETERMINISTIC
+        # Archive entries get a fixed timestamp unless one is given
+        os.environ.setdefault('SOURCE_DATE_EPOCH', '0')
+    
+    if args.list_targets or args.metadata_only or args.verify is not None:
+        # None of these needs pixels: the source is not opened and Pillow not imported
+        nodes = build_targets(android_res_dir, play_store_dir, None, args.adaptive_background)
+        if args.metadata_only:
+            nodes = metadata_nodes(nodes)
+        try:
+            selected = select(nodes, args.only)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if args.list_targets:
+            print_targets(nodes, selected)
+        elif args.verify is not None:
+            cache = IconCache(args.verify) if args.verify else None
+            if not verify_icon_set(nodes, selected, cache):
+                sys.exit(1)
+        else:
+            with open_sink(args.archive, repo_root) as sink:
+                nodes = metadata_nodes(build_targets(android_res_dir, play_store_dir, None,
+                                                     args.adaptive_background, sink))
+                build(nodes, args.only, sink=sink)
+        return
+    
     print("=" * 60)
     print("ephenotes Android Icon Generator")
     print("=" * 60)
     
+    if args.resampler == 'linear' and importlib.util.find_spec('numpy') is None:
+        print("❌ Error: --resampler linear needs NumPy")
+        print("Install it with: pip install numpy")
+        sys.exit(1)
+    if args.mask_report is not None and importlib.util.find_spec('numpy') is None:
+        print("❌ Error: --mask-report needs NumPy")
+        print("Install it with: pip install numpy")
+        sys.exit(1)
+    if args.update_goldens and not args.qa:
+        print("❌ Error: --update-goldens needs --qa GOLDENS")
+        sys.exit(1)
+    if args.qa is not None:
+        if importlib.util.find_spec('numpy') is None:
+            print("❌ Error: --qa needs NumPy")
+            print("Install it with: pip install numpy")
+            sys.exit(1)
+        from icon_pipeline.quality import QualityTarget, check_quality, parse_thresholds
+        try:
+            thresholds = parse_thresholds(args.qa_threshold)
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+    
     # Get source image path
-    if len(sys.argv) > 1:
-        source_image = sys.argv[1]
-    else:
-        source_image = 'icon-512.png'
+    source_image = args.source_image
     
     # Validate source image
-    if not validate_source_image(source_image):
+    source = open_source_image(source_image)
+    if source is None or not validate_source_image(source):
         sys.exit(1)
     
     print(f"\n📂 Source image: {source_image}")
     
-    # Determine output directories
-    script_dir = Path(__file__).parent
-    android_res_dir = script_dir.parent.parent.parent / 'android' / 'app' / 'src' / 'main' / 'res'
-    play_store_dir = script_dir
+    vector = isinstance(source, SvgMaster)
+    if vector:
+        if args.pyramid or args.resampler != DEFAULT_RESAMPLER or args.memory_budget:
+            print("  ℹ SVG sources are rasterized at every size; --pyramid, --resampler "
+                  "and --memory-budget do not apply")
+            args.pyramid, args.resampler, args.memory_budget = None, DEFAULT_RESAMPLER, None
+        if source.overrides:
+            print(f"  ℹ Small-size hints: {', '.join(f'≤{size}px' for size in source.overrides)}")
+    
+    draft_size = int(512 * args.pyramid) if args.pyramid else None
+    budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    working_size = max(WORKING_SIZE, draft_size or 0)
+    
+    def current_source_key():
+        if vector:
+            return svg_source_key(source_image)
+        if budget is None:
+            return file_digest(source_image)
+        # Reduced decoding changes the pixels, so it gets its own cache keys
+        return file_digest(source_image) + f':budget{budget}:{working_size}'
+    
+    def load_master():
+        if budget is None:
+            return prepare_master(source, draft_size)
+        result = ingest(source_image, working_size, budget)
+        print(f"  ℹ Source decoded by {result.method}: {result.image.size[0]}x{result.image.size[1]}px")
+        return prepare_master(result.image)
+    
+    if args.mask_report is not None:
+        from icon_pipeline.masks import MASK_CACHE_NAME, check_masks
+        background_color = adaptive_background_color(android_res_dir, args.adaptive_background)
+        print("\n🎭 Checking launcher masks...")
+        entry = mask_entry(os.path.basename(source_image), load_master(), background_color)
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(args.cache_manifest)), MASK_CACHE_NAME)
+        if not check_masks([entry], args.mask_report, cache_dir):
+            print("\n❌ Artwork falls outside the safe zone of a launcher mask")
+            sys.exit(1)
+        print("\n✅ Artwork stays inside the safe zone of every launcher mask")
+        return
+    
+    if args.resize_report:
+        sizes = [(size, size) for size in ANDROID_ICON_SIZES.values()]
+        sizes += [(safe_zone_size(size),) * 2 for size in ADAPTIVE_ICON_SIZES.values()]
+        sizes += [(legacy_foreground_size(size),) * 2 for size in ANDROID_ICON_SIZES.values()]
+        sizes.append((512, 512))
+        master = as_image(load_master())
+        print_quality_report(quality_report(master, sizes, args.pyramid or DEFAULT_MIN_RATIO))
+        return
     
     print(f"📂 Android res directory: {android_res_dir}")
     print(f"📂 Play Store directory: {play_store_dir}")
+    if args.archive:
+        print(f"📦 Archive: {args.archive}")
+    
+    cache = IconCache(args.cache_manifest, enabled=not args.no_cache)
+    sink = open_sink(args.archive, repo_root, args.fsync)
+    if sink.in_place:
+        cache.set_encoder(encoder_fingerprint() if args.deterministic else None)
+    
+    # Decode the source once, and only if some icon is out of date
+    renderer = Renderer(load_master, workers=args.jobs, source_key=current_source_key(),
+                        pyramid=args.pyramid, strategy=args.png_strategy, resampler=args.resampler)
+    nodes = build_targets(android_res_dir, play_store_dir, renderer, args.adaptive_background, sink)
+    try:
+        selected = select(nodes, args.only)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     
-    # Generate all icons
-    total_generated = 0
+    images = [node for node in nodes if node.target is not None]
+    if args.icon_budget:
+        renderer.set_total_budget(int(args.icon_budget * 1024), [node.target[2] for node in images])
     
     try:
-        # Generate launcher icons
-        total_generated += generate_launcher_icons(source_image, android_res_dir)
-        
-        # Generate adaptive icons
-        total_generated += generate_adaptive_icons(source_image, android_res_dir)
-        
-        # Generate Play Store icon
-        total_generated += generate_play_store_icon(source_image, play_store_dir)
-        
-        # Create adaptive icon XML files
-        create_adaptive_icon_xml(android_res_dir)
+        print(f"\n🔨 Building {len(selected)} of {len(nodes)} targets...")
+        with renderer, sink, trace.tracing(args.trace, args.trace_summary, args.profile):
+            results = build_and_report(nodes, args.only, renderer, cache, args.icon_budget,
+                                       fsync=args.fsync, sink=sink)
+            
+            # Summary
+            total_generated = sum(results[node.name] for node in images if node.name in results)
+            print("\n" + "=" * 60)
+            print(f"✅ SUCCESS! Generated {total_generated} icon files"
+                  + (f" into {args.archive}" if args.archive else ""))
+            print("=" * 60)
+            if budget is not None:
+                report_peak_memory(budget, workers=args.jobs != 1)
+            
+            if args.qa is not None:
+                print("\n🔍 Checking icon quality...")
+                targets = [QualityTarget('', node.name, node.target[1], node.target[2], renderer.master)
+                           for node in images if node.name in selected]
+                if not check_quality(targets, args.qa, thresholds, args.update_goldens):
+                    print("\n❌ Some icons are below the quality thresholds")
+                    sys.exit(1)
+            
+            if args.watch:
+                def rebuild(changed):
+                    nonlocal source
+                    source = open_source_image(source_image)
+                    if source is None or not validate_source_image(source):
+                        raise ValueError(f"{source_image} is not a usable source image")
+                    renderer.replace_master(load_master, current_source_key())
+                    # watch() lists the files whose bytes actually changed
+                    build_and_report(nodes, args.only, renderer, cache, args.icon_budget,
+                                     details=False, fsync=args.fsync)
+                
+                outputs = [node.target[1] for node in images if node.name in selected]
+                watch([source_image], rebuild, outputs)
+                return
         
-        # Summary
-        print("\n" + "=" * 60)
-        print(f"✅ SUCCESS! Generated {total_generated} icon files")
-        print("=" * 60)
         print("\nNext steps:")
         print("1. Review generated icons in Android Studio")
         print("2. Test adaptive icons on Android 8.0+ devices")
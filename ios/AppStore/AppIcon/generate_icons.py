@@ -2,21 +2,43 @@
 """
 ephenotes App Icon Generator
 
-This script generates all required iOS app icon sizes from a master 1024x1024 icon.
+This script generates all required iOS app icon sizes from a master 1024x1024 icon,
+or from a master it creates itself (--create-master).
 Requires PIL (Pillow) library: pip install Pillow
+NumPy (optional) draws the created master anti-aliased and is needed for
+--resampler linear, --mask-report and --qa; CairoSVG (optional) reads SVG masters.
 
 Usage:
-    python generate_icons.py master_icon.png
+    python generate_icons.py master_icon.png [--jobs N]
+    python generate_icons.py --create-master [--note-color '#4CAF50']
+
+See --help for every option and scripts/README.md for how they work.
 
 The script will create all required iOS app icon sizes and place them in the
 correct directory structure for Xcode.
 """
 
+import importlib.util
 import os
 import sys
-from PIL import Image, ImageDraw, ImageFilter
+import time
+from pathlib import Path
 import argparse
 
+# Shared icon pipeline helpers live in scripts/icon_pipeline
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'scripts'))
+from icon_pipeline import trace
+from icon_pipeline.cache import MANIFEST_NAME, IconCache, file_digest
+from icon_pipeline.encode import DEFAULT_STRATEGY, DETERMINISTIC, STRATEGIES, describe, encoder_fingerprint
+from icon_pipeline.graph import action_node, build, image_node, metadata_nodes, print_targets, select
+from icon_pipeline.ingest import ingest, peak_rss
+from icon_pipeline.pyramid import DEFAULT_MIN_RATIO, draft_master, print_quality_report, quality_report
+from icon_pipeline.render import DEFAULT_RESAMPLER, RESAMPLERS, RenderJob, Renderer, plan_unique_jobs, render_targets
+from icon_pipeline.sinks import ARCHIVE_SUFFIXES, FileSink, archive_suffix, open_sink
+from icon_pipeline.svg import SvgMaster, as_image, is_svg, rasterizer_available, svg_source_key
+from icon_pipeline.verify import expected_icons, verify_icons
+from icon_pipeline.watch import watch
+
 # iOS App Icon sizes and their purposes
 ICON_SIZES = {
     # App Store and Settings
@@ -49,14 +71,40 @@ ICON_SIZES = {
     "Icon-App-20x20@3x.png": (60, 60),          # iPhone Notification @3x
 }
 
-def create_master_icon(output_path, size=1024):
+# Colors of the created master icon
+DEFAULT_NOTE_COLOR = '#4CAF50'  # Material Green
+DEFAULT_DOT_COLOR = '#FF9800'   # Material Orange
+
+# Smallest side kept when --memory-budget reduces a huge master (2x the largest icon)
+WORKING_SIZE = 2048
+
+def sdf_renderer():
+    """The icon_pipeline.sdf module (imported on first use), or None without NumPy."""
+    try:
+        from icon_pipeline import sdf
+    except ImportError:  # NumPy not installed: fall back to ImageDraw
+        return None
+    return sdf
+
+def create_master_icon(size=1024, samples=1, note_color=DEFAULT_NOTE_COLOR,
+                       dot_color=DEFAULT_DOT_COLOR):
     """
     Create a master app icon for ephenotes.
     This creates a simple design that can be used as the base for all sizes.
+    With NumPy installed the icon is rendered by the anti-aliased SDF renderer
+    in scripts/icon_pipeline/sdf.py (samples > 1 adds NxN supersampling);
+    otherwise it is drawn with ImageDraw.
     """
+    sdf = sdf_renderer()
+    if sdf is not None:
+        return sdf.render_note_icon(size, note_color, dot_color, samples=samples)
+    
+    from PIL import Image, ImageDraw
+    
     # Create a new image with white background
     img = Image.new('RGB', (size, size), '#FFFFFF')
-    draw = ImageDraw.Draw(img)
+    # RGBA drawing mode so translucent fills blend instead of painting opaque
+    draw = ImageDraw.Draw(img, 'RGBA')
     
     # Calculate proportional sizes
     note_width = int(size * 0.7)
@@ -69,8 +117,6 @@ def create_master_icon(output_path, size=1024):
     
     # Draw main note shape (rounded rectangle)
     # Since PIL doesn't have native rounded rectangle, we'll create one
-    note_color = '#4CAF50'  # Material Green
-    
     # Create rounded rectangle by drawing rectangles and circles
     draw.rectangle([x + corner_radius, y, x + note_width - corner_radius, y + note_height], fill=note_color)
     draw.rectangle([x, y + corner_radius, x + note_width, y + note_height - corner_radius], fill=note_color)
@@ -86,7 +132,7 @@ def create_master_icon(output_path, size=1024):
         dot_size = int(size * 0.12)
         dot_x = x + note_width - dot_size - int(size * 0.05)
         dot_y = y + int(size * 0.05)
-        draw.ellipse([dot_x, dot_y, dot_x + dot_size, dot_y + dot_size], fill='#FF9800')
+        draw.ellipse([dot_x, dot_y, dot_x + dot_size, dot_y + dot_size], fill=dot_color)
     
     # Add subtle lines for larger sizes
     if size >= 120:
@@ -106,183 +152,428 @@ def resize_icon(master_image, size, use_lanczos=True):
     """
     Resize the master icon to the specified size with high quality.
     """
+    from PIL import Image
+    
     if use_lanczos:
         return master_image.resize(size, Image.Resampling.LANCZOS)
     else:
         return master_image.resize(size, Image.Resampling.NEAREST)
 
-def generate_all_icons(master_icon_path=None, output_dir="ios/Runner/Assets.xcassets/AppIcon.appiconset"):
+def prepare_master_icon(master_img):
     """
-    Generate all required iOS app icon sizes.
+    Bring a decoded master to the RGB/RGBA 1024x1024 form all sizes are made from.
+    An SvgMaster is returned as is: it is rasterized at every size.
     """
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    from PIL import Image
     
-    # Load or create master icon
+    if isinstance(master_img, SvgMaster):
+        return master_img
+    if master_img.mode not in ('RGB', 'RGBA'):
+        # Palette and grayscale masters would otherwise be resized with NEAREST
+        master_img = master_img.convert('RGBA')
+    if master_img.size != (1024, 1024):
+        print("Resizing master icon to 1024x1024")
+        master_img = master_img.resize((1024, 1024), Image.Resampling.LANCZOS)
+    return master_img
+
+def pyramid_draft_size(pyramid=None):
+    """Size JPEG masters are draft-decoded to for --pyramid RATIO, or None."""
+    return int(1024 * pyramid) if pyramid else None
+
+def ingest_size(draft_size=None):
+    """Size a master over the memory budget is decoded reduced to at least."""
+    return max(WORKING_SIZE, draft_size or 0)
+
+def load_master_icon(master_icon_path=None, draft_size=None, note_color=DEFAULT_NOTE_COLOR,
+                     memory_budget=None):
+    """
+    Load the master icon, or create one if no usable path is given.
+    With draft_size, JPEG masters are decoded at a reduced scale of at least
+    that many pixels.
+    With memory_budget (bytes), masters too large to decode within it are
+    decoded reduced to at least ingest_size(draft_size) pixels.
+    """
     if master_icon_path and os.path.exists(master_icon_path):
         print(f"Loading master icon from {master_icon_path}")
-        master_img = Image.open(master_icon_path)
-        if master_img.size != (1024, 1024):
-            print("Resizing master icon to 1024x1024")
-            master_img = master_img.resize((1024, 1024), Image.Resampling.LANCZOS)
+        if is_svg(master_icon_path):
+            master_img = SvgMaster(master_icon_path)
+        elif memory_budget:
+            result = ingest(master_icon_path, ingest_size(draft_size), memory_budget)
+            print(f"Decoded master by {result.method} ({result.image.size[0]}x{result.image.size[1]})")
+            master_img = result.image
+        else:
+            from PIL import Image
+            master_img = Image.open(master_icon_path)
+            if draft_size:
+                draft_master(master_img, draft_size)
+            with trace.span('decode', size='{}x{}'.format(*master_img.size)):
+                master_img.load()
+        with trace.span('prepare'):
+            master_img = prepare_master_icon(master_img)
     else:
         print("Creating new master icon...")
-        master_img = create_master_icon("temp_master.png")
-        master_img.save("temp_master.png")
-        print("Master icon saved as temp_master.png")
+        with trace.span('create_master'):
+            master_img = create_master_icon(note_color=note_color)
     
-    # Generate all required sizes
-    print(f"Generating {len(ICON_SIZES)} icon sizes...")
+    return master_img
+
+def master_source_key(master_icon_path=None, note_color=DEFAULT_NOTE_COLOR, dot_color=DEFAULT_DOT_COLOR,
+                      memory_budget=None, pyramid=None):
+    """
+    Cache key of the master: the file hash, or for created masters the colors
+    and this script's hash, so editing the design invalidates them.
+    """
+    if master_icon_path and os.path.exists(master_icon_path):
+        if is_svg(master_icon_path):
+            return svg_source_key(master_icon_path)
+        if memory_budget:
+            # Reduced decoding changes the pixels
+            working_size = ingest_size(pyramid_draft_size(pyramid))
+            return file_digest(master_icon_path) + f':budget{memory_budget}:{working_size}'
+        return file_digest(master_icon_path)
     
-    for filename, size in ICON_SIZES.items():
-        output_path = os.path.join(output_dir, filename)
-        
-        # Resize the master image
-        resized_img = resize_icon(master_img, size)
-        
-        # Save the resized image
-        resized_img.save(output_path, "PNG", optimize=True)
-        print(f"Created {filename} ({size[0]}x{size[1]})")
+    source_key = f'create_master_icon:{note_color}:{dot_color}:' + file_digest(__file__)
+    sdf = sdf_renderer()
+    if sdf is not None:
+        source_key += f':sdf{sdf.SDF_VERSION}'
+    return source_key
+
+def master_loader(master_icon_path=None, pyramid=None, note_color=DEFAULT_NOTE_COLOR, memory_budget=None):
+    """Zero-argument callable loading (or creating) the master icon."""
+    draft_size = pyramid_draft_size(pyramid)
+    return lambda: load_master_icon(master_icon_path, draft_size, note_color, memory_budget)
+
+def make_renderer(master_icon_path=None, jobs=1, pyramid=None, note_color=DEFAULT_NOTE_COLOR,
+                  memory_budget=None, strategy=DEFAULT_STRATEGY, resampler=DEFAULT_RESAMPLER):
+    """
+    Renderer that loads (or creates) the master icon only when first needed.
+    An SVG master is rasterized at every size, without pyramid or resampler.
+    """
+    if master_icon_path and is_svg(master_icon_path):
+        pyramid, resampler = None, DEFAULT_RESAMPLER
+    source_key = master_source_key(master_icon_path, note_color, memory_budget=memory_budget, pyramid=pyramid)
+    return Renderer(master_loader(master_icon_path, pyramid, note_color, memory_budget),
+                    workers=jobs, source_key=source_key, pyramid=pyramid, strategy=strategy,
+                    resampler=resampler)
+
+def generate_all_icons(master_icon_path=None, output_dir="ios/Runner/Assets.xcassets/AppIcon.appiconset", jobs=1, cache=None,
+                       pyramid=None, note_color=DEFAULT_NOTE_COLOR, renderer=None, memory_budget=None,
+                       strategy=DEFAULT_STRATEGY, icon_budget=None, sink=None):
+    """
+    Generate all required iOS app icon sizes, on disk or (with a sink, see
+    scripts/icon_pipeline/sinks.py) wherever the sink puts them.
+    With jobs > 1 the resize and PNG encode work runs in a process pool.
+    With pyramid set, smaller sizes are resized from larger ones that are at
+    least that many times bigger.
+    With an IconCache, up-to-date icons are skipped and the master is only
+    loaded if at least one icon has to be regenerated.
+    With memory_budget (bytes), a huge master is decoded reduced to fit it.
+    strategy is the PNG encoder strategy tried first; with icon_budget (KB)
+    the largest icons are re-encoded with more thorough strategies until
+    the total size of all icons fits.
+    Pass a Renderer to share an already prepared master (and its resize
+    results) with other callers; master_icon_path, jobs, pyramid,
+    note_color, memory_budget, strategy and icon_budget are then ignored.
+    """
+    sink = sink or FileSink()
+    if sink.in_place:
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+    
+    own_renderer = renderer is None
+    if own_renderer:
+        renderer = make_renderer(master_icon_path, jobs, pyramid, note_color, memory_budget, strategy)
+    
+    # Generate all required sizes; filenames sharing a pixel size are encoded once
+    targets = [(os.path.join(output_dir, filename), RenderJob(size))
+               for filename, size in ICON_SIZES.items()]
+    if own_renderer and icon_budget:
+        renderer.set_total_budget(int(icon_budget * 1024), [job for _, job in targets])
+    unique_count = len(plan_unique_jobs(job for _, job in targets))
+    print(f"Generating {len(ICON_SIZES)} icon sizes ({unique_count} unique)...")
+    
+    # Resize and encode every stale size, serially or across worker processes
+    try:
+        rendered = render_targets(renderer, targets, cache, sink=sink)
+    finally:
+        if own_renderer:
+            renderer.close()
+    
+    for (filename, size), (_, job), was_rendered in zip(ICON_SIZES.items(), targets, rendered):
+        if was_rendered:
+            summary = describe(renderer.encoded(job), job.budget)
+            print(f"Created {filename} ({size[0]}x{size[1]}, {summary})")
+        else:
+            print(f"Unchanged {filename} ({size[0]}x{size[1]})")
+    
+    total_size = sum(sink.size(path) for path, _ in targets)
+    print(f"Total icon size: {total_size / 1024:.1f} KB"
+          + (f" (budget {icon_budget:.0f} KB)" if own_renderer and icon_budget else ""))
+    if own_renderer and icon_budget and total_size > icon_budget * 1024:
+        print("Warning: icons exceed the total size budget")
     
     print(f"\nAll icons generated successfully in {output_dir}")
     print("\nNext steps:")
     print("1. Open ios/Runner.xcworkspace in Xcode")
     print("2. Verify all icons appear correctly in Assets.xcassets")
     print("3. Build and test the app to ensure icons display properly")
+    
+    return sum(rendered)
 
-def update_contents_json(output_dir="ios/Runner/Assets.xcassets/AppIcon.appiconset"):
-    """
-    Update the Contents.json file with the correct icon mappings.
-    """
-    contents_json = {
-        "images": [
-            {
-                "size": "20x20",
-                "idiom": "iphone",
-                "filename": "Icon-App-20x20@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "20x20",
-                "idiom": "iphone",
-                "filename": "Icon-App-20x20@3x.png",
-                "scale": "3x"
-            },
-            {
-                "size": "29x29",
-                "idiom": "iphone",
-                "filename": "Icon-App-29x29@1x.png",
-                "scale": "1x"
-            },
-            {
-                "size": "29x29",
-                "idiom": "iphone",
-                "filename": "Icon-App-29x29@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "29x29",
-                "idiom": "iphone",
-                "filename": "Icon-App-29x29@3x.png",
-                "scale": "3x"
-            },
-            {
-                "size": "40x40",
-                "idiom": "iphone",
-                "filename": "Icon-App-40x40@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "40x40",
-                "idiom": "iphone",
-                "filename": "Icon-App-40x40@3x.png",
-                "scale": "3x"
-            },
-            {
-                "size": "60x60",
-                "idiom": "iphone",
-                "filename": "Icon-App-60x60@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "60x60",
-                "idiom": "iphone",
-                "filename": "Icon-App-60x60@3x.png",
-                "scale": "3x"
-            },
-            {
-                "size": "20x20",
-                "idiom": "ipad",
-                "filename": "Icon-App-20x20@1x.png",
-                "scale": "1x"
-            },
-            {
-                "size": "20x20",
-                "idiom": "ipad",
-                "filename": "Icon-App-20x20@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "29x29",
-                "idiom": "ipad",
-                "filename": "Icon-App-29x29@1x.png",
-                "scale": "1x"
-            },
-            {
-                "size": "29x29",
-                "idiom": "ipad",
-                "filename": "Icon-App-29x29@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "40x40",
-                "idiom": "ipad",
-                "filename": "Icon-App-40x40@1x.png",
-                "scale": "1x"
-            },
-            {
-                "size": "40x40",
-                "idiom": "ipad",
-                "filename": "Icon-App-40x40@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "76x76",
-                "idiom": "ipad",
-                "filename": "Icon-App-76x76@1x.png",
-                "scale": "1x"
-            },
-            {
-                "size": "76x76",
-                "idiom": "ipad",
-                "filename": "Icon-App-76x76@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "83.5x83.5",
-                "idiom": "ipad",
-                "filename": "Icon-App-83.5x83.5@2x.png",
-                "scale": "2x"
-            },
-            {
-                "size": "1024x1024",
-                "idiom": "ios-marketing",
-                "filename": "Icon-App-1024x1024@1x.png",
-                "scale": "1x"
-            }
-        ],
-        "info": {
-            "version": 1,
-            "author": "xcode"
+# Asset catalog entries of the icons, in the order Xcode writes them
+CONTENTS_JSON = {
+    "images": [
+        {
+            "size": "20x20",
+            "idiom": "iphone",
+            "filename": "Icon-App-20x20@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "20x20",
+            "idiom": "iphone",
+            "filename": "Icon-App-20x20@3x.png",
+            "scale": "3x"
+        },
+        {
+            "size": "29x29",
+            "idiom": "iphone",
+            "filename": "Icon-App-29x29@1x.png",
+            "scale": "1x"
+        },
+        {
+            "size": "29x29",
+            "idiom": "iphone",
+            "filename": "Icon-App-29x29@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "29x29",
+            "idiom": "iphone",
+            "filename": "Icon-App-29x29@3x.png",
+            "scale": "3x"
+        },
+        {
+            "size": "40x40",
+            "idiom": "iphone",
+            "filename": "Icon-App-40x40@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "40x40",
+            "idiom": "iphone",
+            "filename": "Icon-App-40x40@3x.png",
+            "scale": "3x"
+        },
+        {
+            "size": "60x60",
+            "idiom": "iphone",
+            "filename": "Icon-App-60x60@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "60x60",
+            "idiom": "iphone",
+            "filename": "Icon-App-60x60@3x.png",
+            "scale": "3x"
+        },
+        {
+            "size": "20x20",
+            "idiom": "ipad",
+            "filename": "Icon-App-20x20@1x.png",
+            "scale": "1x"
+        },
+        {
+            "size": "20x20",
+            "idiom": "ipad",
+            "filename": "Icon-App-20x20@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "29x29",
+            "idiom": "ipad",
+            "filename": "Icon-App-29x29@1x.png",
+            "scale": "1x"
+        },
+        {
+            "size": "29x29",
+            "idiom": "ipad",
+            "filename": "Icon-App-29x29@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "40x40",
+            "idiom": "ipad",
+            "filename": "Icon-App-40x40@1x.png",
+            "scale": "1x"
+        },
+        {
+            "size": "40x40",
+            "idiom": "ipad",
+            "filename": "Icon-App-40x40@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "76x76",
+            "idiom": "ipad",
+            "filename": "Icon-App-76x76@1x.png",
+            "scale": "1x"
+        },
+        {
+            "size": "76x76",
+            "idiom": "ipad",
+            "filename": "Icon-App-76x76@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "83.5x83.5",
+            "idiom": "ipad",
+            "filename": "Icon-App-83.5x83.5@2x.png",
+            "scale": "2x"
+        },
+        {
+            "size": "1024x1024",
+            "idiom": "ios-marketing",
+            "filename": "Icon-App-1024x1024@1x.png",
+            "scale": "1x"
         }
+    ],
+    "info": {
+        "version": 1,
+        "author": "xcode"
     }
-    
+}
+
+
+def update_contents_json(output_dir="ios/Runner/Assets.xcassets/AppIcon.appiconset", sink=None):
+    """
+    Update the Contents.json file (in sink, if given) with the correct icon
+    mappings. Returns True if the file was written.
+    """
     import json
     contents_path = os.path.join(output_dir, "Contents.json")
-    with open(contents_path, 'w') as f:
-        json.dump(contents_json, f, indent=2)
+    if (sink or FileSink()).write(contents_path, json.dumps(CONTENTS_JSON, indent=2).encode('utf-8')):
+        print(f"Updated {contents_path}")
+        return True
+    print(f"Unchanged {contents_path}")
+    return False
+
+def build_targets(output_dir, renderer, sink=None):
+    """
+    Target graph of the icon set: one node per icon file, tagged ios, its
+    idioms (iphone, ipad, ios-marketing) and its pixel size, plus
+    Contents.json tagged contents, which depends on every icon and is
+    written to sink, if given.
+    """
+    idioms = {}
+    for entry in CONTENTS_JSON["images"]:
+        idioms.setdefault(entry["filename"], set()).add(entry["idiom"])
+    
+    nodes = [image_node(filename, {'ios', f'{size[0]}x{size[1]}'} | idioms.get(filename, set()),
+                        renderer, os.path.join(output_dir, filename), RenderJob(size))
+             for filename, size in ICON_SIZES.items()]
+    nodes.append(action_node("Contents.json", {'ios', 'contents'},
+                             lambda: update_contents_json(output_dir, sink),
+                             deps=[node.name for node in nodes]))
+    return nodes
+
+def check_contents_json(output_dir):
+    """
+    Return the problems of output_dir/Contents.json: every entry of
+    CONTENTS_JSON must be present, and every listed file must be in
+    ICON_SIZES with a size times scale matching its pixel size.
+    """
+    import json
+    try:
+        with open(os.path.join(output_dir, "Contents.json")) as f:
+            images = json.load(f)["images"]
+    except FileNotFoundError:
+        return ["missing"]
+    except (ValueError, KeyError, TypeError) as e:
+        return [f"unreadable: {e}"]
+    
+    def describe_entry(entry):
+        return f"{entry.get('idiom')} {entry.get('size')}@{entry.get('scale')}"
+    
+    problems = []
+    for entry in CONTENTS_JSON["images"]:
+        if not any(all(image.get(key) == value for key, value in entry.items()) for image in images):
+            problems.append(f"no {describe_entry(entry)} entry for {entry['filename']}")
+    for image in images:
+        filename = image.get("filename")
+        if filename is None:
+            continue
+        if filename not in ICON_SIZES:
+            problems.append(f"{describe_entry(image)} references {filename}, which is not generated")
+            continue
+        try:
+            points = float(image["size"].split("x")[0])
+            pixels = round(points * float(image["scale"].rstrip("x")))
+        except (KeyError, ValueError, AttributeError):
+            problems.append(f"{filename} has an invalid size or scale")
+            continue
+        if (pixels, pixels) != ICON_SIZES[filename]:
+            problems.append(f"{filename} is listed as {describe_entry(image)} ({pixels}x{pixels}), "
+                            f"but is {ICON_SIZES[filename][0]}x{ICON_SIZES[filename][1]}")
+    return problems
+
+def mask_entry(label, master):
+    """
+    (label, master, platform, sizes, background) entry of a prepared master
+    for icon_pipeline.masks.check_masks(), at every pixel size of ICON_SIZES.
+    """
+    sizes = sorted({width for width, _ in ICON_SIZES.values()})
+    # iOS shows transparent pixels of an icon as black
+    return (label, master, 'ios', sizes, (0, 0, 0))
+
+def verify_icon_set(nodes, names, output_dir, cache=None):
+    """
+    Check the existing icons of the selected nodes from their PNG headers
+    (and against the cache manifest, if given), plus Contents.json if it is
+    selected, printing a line per problem. Returns True if all is well.
+    """
+    start = time.perf_counter()
+    expected = expected_icons(nodes, names, opaque_tag='ios-marketing')
+    problems = verify_icons(expected, cache)
+    if "Contents.json" in names:
+        contents_path = os.path.join(output_dir, "Contents.json")
+        problems += [(contents_path, problem) for problem in check_contents_json(output_dir)]
+    
+    for path, problem in problems:
+        print(f"{path}: {problem}")
+    elapsed = (time.perf_counter() - start) * 1000
+    if problems:
+        print(f"\n{len(problems)} problem(s) in {len(expected)} icons ({elapsed:.1f} ms)")
+        return False
+    print(f"Verified {len(expected)} icons ({elapsed:.1f} ms)")
+    return True
+
+def build_and_report(nodes, selectors, renderer, cache, icon_budget=None, details=True, fsync=False,
+                     sink=None):
+    """
+    Build the selected nodes (to disk, or to sink) and print a line per icon
+    (unless details is False) and the total size. Returns the build()
+    results.
+    """
+    sink = sink or FileSink(fsync)
+    results = build(nodes, selectors, cache, sink=sink)
+    cache.save()
     
-    print(f"Updated {contents_path}")
+    built = [node for node in nodes if node.target is not None and node.name in results]
+    for node in built if details else ():
+        _, output_path, job = node.target
+        if results[node.name]:
+            summary = describe(renderer.encoded(job), job.budget)
+            print(f"Created {node.name} ({job.size[0]}x{job.size[1]}, {summary})")
+        else:
+            print(f"Unchanged {node.name} ({job.size[0]}x{job.size[1]})")
+    
+    total_size = sum(sink.size(node.target[1]) for node in built)
+    print(f"Total icon size: {total_size / 1024:.1f} KB"
+          + (f" (budget {icon_budget:.0f} KB)" if icon_budget else ""))
+    if icon_budget and total_size > icon_budget * 1024:
+        print("Warning: icons exceed the total size budget")
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description='Generate iOS app icons for ephenotes')
@@ -291,16 +582,224 @@ def main():
                        help='Output directory for generated icons')
     parser.add_argument('--create-master', action='store_true',
                        help='Create a new master icon instead of using existing one')
+    parser.add_argument('--note-color', default=DEFAULT_NOTE_COLOR,
+                       help=f'Note color of a created master icon (default: {DEFAULT_NOTE_COLOR})')
+    parser.add_argument('--jobs', type=int, default=1,
+                       help='Worker processes for resize and PNG encode (0 = all CPUs)')
+    parser.add_argument('--pyramid', type=float, nargs='?', const=DEFAULT_MIN_RATIO,
+                       metavar='RATIO',
+                       help='Resize each icon from the smallest already resized icon at least '
+                            f'RATIO times larger (default ratio: {DEFAULT_MIN_RATIO})')
+    parser.add_argument('--resize-report', action='store_true',
+                       help='Compare pyramid and direct resizing for every size and exit')
+    parser.add_argument('--mask-report', nargs='?', const='', metavar='SHEET',
+                       help='Measure how much of the master the icon mask clips at every size and '
+                            'exit, failing if artwork leaves its safe area; with SHEET also write a '
+                            'contact sheet PNG (needs NumPy)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Regenerate every icon, ignoring the cache manifest')
+    parser.add_argument('--cache-manifest',
+                       default=os.path.join(os.path.dirname(os.path.abspath(__file__)), MANIFEST_NAME),
+                       help='Path of the cache manifest (default: next to this script)')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                       help='Decode a huge master reduced so that decoding stays within MB megabytes, '
+                            'and report the peak memory')
+    parser.add_argument('--resampler', choices=RESAMPLERS, default=DEFAULT_RESAMPLER,
+                       help='Resize with Pillow\'s LANCZOS, or with LANCZOS in linear light on '
+                            f'premultiplied alpha (linear, needs NumPy; default: {DEFAULT_RESAMPLER})')
+    parser.add_argument('--png-strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                       help=f'PNG encoder strategy tried first (default: {DEFAULT_STRATEGY})')
+    parser.add_argument('--deterministic', action='store_true',
+                       help='Encode byte-reproducible icons without ancillary chunks at pinned zlib '
+                            'settings instead of with --png-strategy, and record the encoder '
+                            'fingerprint in the cache manifest')
+    parser.add_argument('--icon-budget', type=float, metavar='KB',
+                       help='Total size budget of all generated icons; the largest are re-encoded '
+                            'with more thorough strategies until it is met')
+    parser.add_argument('--only', action='append', metavar='SELECTOR',
+                       help='Build only matching targets and what they depend on: a tag such as '
+                            'iphone, ipad, ios-marketing, contents or a pixel size (120x120), '
+                            'tags joined by colons (ipad:152x152), or a file name pattern (repeatable)')
+    parser.add_argument('--watch', action='store_true',
+                       help='Keep running and regenerate the icons whenever the master icon changes')
+    parser.add_argument('--list-targets', action='store_true',
+                       help='List the targets (and their tags) that would be built, and exit')
+    parser.add_argument('--metadata-only', action='store_true',
+                       help='Write only Contents.json, without loading the master icon')
+    parser.add_argument('--verify', nargs='?', const='', metavar='MANIFEST',
+                       help='Check the existing icons and Contents.json instead of generating them; '
+                            'with MANIFEST (such as the cache manifest) also compare their hashes')
+    parser.add_argument('--fsync', action='store_true',
+                       help='Flush each batch of icons to disk before moving it into place')
+    parser.add_argument('--archive', metavar='PATH',
+                       help='Write the icons and Contents.json into one archive instead of loose files, '
+                            f'named relative to the repository ({", ".join(ARCHIVE_SUFFIXES)})')
+    parser.add_argument('--qa', nargs='?', const='', metavar='GOLDENS',
+                       help='After building, score every icon (SSIM, PSNR, legibility) against a '
+                            'reference rendering and the golden images in GOLDENS, failing below '
+                            'the thresholds (needs NumPy)')
+    parser.add_argument('--qa-threshold', action='append', metavar='NAME=VALUE',
+                       help='Override a --qa threshold: ssim, psnr, legibility, golden-ssim or '
+                            'golden-psnr (repeatable)')
+    parser.add_argument('--update-goldens', action='store_true',
+                       help='With --qa GOLDENS, store the icons as the new golden images')
+    parser.add_argument('--trace', metavar='FILE',
+                       help='Write a Chrome/Perfetto trace of every stage and target to FILE (JSON)')
+    parser.add_argument('--trace-summary', action='store_true',
+                       help='Print wall time, CPU time and bytes per stage at the end')
+    parser.add_argument('--profile', metavar='FILE',
+                       help='Write cProfile stats of the main process to FILE')
     
     args = parser.parse_args()
+    repo_root = Path(__file__).resolve().parents[3]
     
-    try:
-        if args.create_master:
-            generate_all_icons(None, args.output_dir)
+    if args.archive is not None:
+        if archive_suffix(args.archive) is None:
+            print(f"Error: --archive needs one of {', '.join(ARCHIVE_SUFFIXES)}")
+            sys.exit(1)
+        if args.watch or args.qa is not None or args.verify is not None:
+            print("Error: --archive cannot be combined with --watch, --qa or --verify")
+            sys.exit(1)
+    
+    if args.deterministic:
+        if args.icon_budget:
+            print("Error: --icon-budget cannot be combined with --deterministic")
+            sys.exit(1)
+        args.png_strategy = DETERMINISTIC
+        # Archive entries get a fixed timestamp unless one is given
+        os.environ.setdefault('SOURCE_DATE_EPOCH', '0')
+    
+    if args.list_targets or args.metadata_only or args.verify is not None:
+        # None of these needs pixels: the master is not loaded and Pillow not imported
+        nodes = build_targets(args.output_dir, None)
+        if args.metadata_only:
+            nodes = metadata_nodes(nodes)
+        try:
+            selected = select(nodes, args.only)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if args.list_targets:
+            print_targets(nodes, selected)
+        elif args.verify is not None:
+            cache = IconCache(args.verify) if args.verify else None
+            if not verify_icon_set(nodes, selected, args.output_dir, cache):
+                sys.exit(1)
+        elif args.archive:
+            with open_sink(args.archive, repo_root) as sink:
+                build(metadata_nodes(build_targets(args.output_dir, None, sink)), args.only, sink=sink)
         else:
-            generate_all_icons(args.master_icon, args.output_dir)
+            os.makedirs(args.output_dir, exist_ok=True)
+            build(nodes, args.only)
+        return
+    
+    cache = IconCache(args.cache_manifest, enabled=not args.no_cache)
+    master_icon = None if args.create_master else args.master_icon
+    if args.watch and not (master_icon and os.path.exists(master_icon)):
+        print("Error: --watch needs an existing master icon file to watch")
+        sys.exit(1)
+    if master_icon and is_svg(master_icon) and not rasterizer_available():
+        print("Error: SVG masters need CairoSVG: pip install cairosvg")
+        sys.exit(1)
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    if args.resampler == 'linear' and importlib.util.find_spec('numpy') is None:
+        print("Error: --resampler linear needs NumPy: pip install numpy")
+        sys.exit(1)
+    if args.mask_report is not None and importlib.util.find_spec('numpy') is None:
+        print("Error: --mask-report needs NumPy: pip install numpy")
+        sys.exit(1)
+    if args.update_goldens and not args.qa:
+        print("Error: --update-goldens needs --qa GOLDENS")
+        sys.exit(1)
+    if args.qa is not None:
+        if importlib.util.find_spec('numpy') is None:
+            print("Error: --qa needs NumPy: pip install numpy")
+            sys.exit(1)
+        from icon_pipeline.quality import QualityTarget, check_quality, parse_thresholds
+        try:
+            thresholds = parse_thresholds(args.qa_threshold)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    
+    try:
+        if args.resize_report:
+            master_img = as_image(load_master_icon(master_icon, memory_budget=memory_budget))
+            print_quality_report(quality_report(master_img, ICON_SIZES.values(),
+                                                args.pyramid or DEFAULT_MIN_RATIO))
+            return
+        
+        if args.mask_report is not None:
+            from icon_pipeline.masks import MASK_CACHE_NAME, check_masks
+            master_img = load_master_icon(master_icon, note_color=args.note_color, memory_budget=memory_budget)
+            entry = mask_entry(os.path.basename(master_icon or 'created master'), master_img)
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(args.cache_manifest)), MASK_CACHE_NAME)
+            if not check_masks([entry], args.mask_report, cache_dir):
+                print("\nArtwork falls outside the safe area of the icon mask")
+                sys.exit(1)
+            print("\nArtwork stays inside the safe area of the icon mask")
+            return
+        
+        sink = open_sink(args.archive, repo_root, args.fsync)
+        if sink.in_place:
+            os.makedirs(args.output_dir, exist_ok=True)
+            cache.set_encoder(encoder_fingerprint() if args.deterministic else None)
+        renderer = make_renderer(master_icon, args.jobs, args.pyramid, args.note_color,
+                                 memory_budget, args.png_strategy, args.resampler)
+        nodes = build_targets(args.output_dir, renderer, sink)
+        try:
+            selected = select(nodes, args.only)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        
+        images = [node for node in nodes if node.target is not None]
+        if args.icon_budget:
+            renderer.set_total_budget(int(args.icon_budget * 1024), [node.target[2] for node in images])
+        
+        print(f"Building {len(selected)} of {len(nodes)} targets...")
+        with renderer, sink, trace.tracing(args.trace, args.trace_summary, args.profile):
+            build_and_report(nodes, args.only, renderer, cache, args.icon_budget, fsync=args.fsync, sink=sink)
+            
+            if args.qa is not None:
+                print("\nChecking icon quality...")
+                targets = [QualityTarget('', node.name, node.target[1], node.target[2], renderer.master)
+                           for node in images if node.name in selected]
+                if not check_quality(targets, args.qa, thresholds, args.update_goldens):
+                    print("\nSome icons are below the quality thresholds")
+                    sys.exit(1)
+            
+            if args.watch:
+                def rebuild(changed):
+                    renderer.replace_master(
+                        master_loader(master_icon, args.pyramid, args.note_color, memory_budget),
+                        master_source_key(master_icon, args.note_color, memory_budget=memory_budget,
+                                          pyramid=args.pyramid))
+                    # watch() lists the files whose bytes actually changed
+                    build_and_report(nodes, args.only, renderer, cache, args.icon_budget,
+                                     details=False, fsync=args.fsync)
+                
+                outputs = [node.target[1] for node in images if node.name in selected]
+                watch([master_icon], rebuild, outputs)
+                return
+        
+        print(f"\nAll icons generated successfully in {args.archive or args.output_dir}")
+        print("\nNext steps:")
+        print("1. Open ios/Runner.xcworkspace in Xcode")
+        print("2. Verify all icons appear correctly in Assets.xcassets")
+        print("3. Build and test the app to ensure icons display properly")
         
-        update_contents_json(args.output_dir)
+        if memory_budget:
+            peak = peak_rss()
+            if peak is None:
+                print("Peak memory is not available on this platform")
+            else:
+                workers = peak_rss(children=True) if args.jobs != 1 else 0
+                print(f"Peak memory: {peak / 2**20:.0f} MB"
+                      + (f" (workers: {workers / 2**20:.0f} MB)" if workers else "")
+                      + f", budget {args.memory_budget} MB")
+                if max(peak, workers) > memory_budget:
+                    print("Warning: peak memory exceeded the budget")
         
     except ImportError:
         print("Error: PIL (Pillow) library is required.")
@@ -311,4 +810,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+ephenotes Icon Pipeline Benchmarks
+
+Measures the Python icon generators on synthetic masters so pipeline changes
+can be checked for speed-ups and regressions locally, without a network.
+
+Cases, each run for every master size:
+    make_square     center-crop a non-square master (android generator)
+    create_master   render the procedural master icon (ios generator)
+    encode          PNG-encode every Android and iOS target image
+    android         launcher, adaptive and Play Store icons, end to end
+    ios             every App Store icon size, end to end
+
+The android and ios cases run serially and with a process pool, and with a
+cold cache (no manifest, empty output) and a warm one (nothing changed since
+the previous run). Every case runs in its own child process so its peak RSS
+is its own; results record wall time, CPU time (including worker
+processes), peak RSS and bytes written, keeping the best of --repeat runs.
+
+Requirements:
+    - Python 3.8+
+    - Pillow (PIL): pip install Pillow
+    - NumPy (optional, used by create_master and the palette encoders)
+
+Usage:
+    python scripts/benchmark_icons.py run [--sizes 512 1024] [--jobs N] [--output bench.json]
+    python scripts/benchmark_icons.py compare baseline.json bench.json [--threshold 0.15]
+    python scripts/benchmark_icons.py startup [--budget-ms 150]
+    python scripts/benchmark_icons.py resample [--sizes 1024 2048]
+    python scripts/benchmark_icons.py reproducible [--size 1024]
+    python scripts/benchmark_icons.py roundtrip [--size 1024]
+
+compare exits with status 1 if any case got slower (wall or CPU time), used
+more memory or wrote more bytes than the threshold allows.
+
+startup runs the pixel-free generator commands (--help, --list-targets,
+--metadata-only) under python -X importtime and exits with status 1 if one
+imports Pillow's Image module or NumPy, or spends more than the budget on
+imports.
+
+resample compares the linear-light NumPy resampler (icon_pipeline/resample.py)
+with Pillow's LANCZOS over every Android and iOS target size: the time to
+resize a master to all of them (the linear one with cold and with cached
+weights), how far each strays from the physically correct average on a
+black and white stripe pattern, and how much the two differ on a real icon.
+
+reproducible runs the Android and iOS generators and the variant driver
+(with web and desktop targets) twice with --deterministic into archives:
+the second time with all CPUs instead of one, another time zone and hash
+seed and without SOURCE_DATE_EPOCH. It exits with status 1 unless both runs
+are byte-identical, every PNG holds only IHDR, IDAT and IEND chunks and the
+working directory is left empty.
+
+roundtrip generates the Android and iOS icons of a flat-color master with
+every PNG strategy (--png-strategy) and checks them as --verify MANIFEST
+does, exiting with status 1 if it rejects any of them. The palette
+strategies write such icons with 1, 2 or 4 bits per palette index.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import PIL
+    from PIL import Image
+except ImportError:
+    print("Error: Pillow library not found.")
+    print("Install it with: pip install Pillow")
+    sys.exit(1)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from generate_icon_variants import REPO_ROOT, load_generator
+from icon_pipeline.cache import IconCache, file_digest
+from icon_pipeline.encode import DEFAULT_STRATEGY, STRATEGIES, encode_png
+from icon_pipeline.graph import select
+from icon_pipeline.ingest import peak_rss
+from icon_pipeline.render import Renderer, render_image
+
+
+DEFAULT_SIZES = (512, 1024, 4096, 8192)
+CASES = ('make_square', 'create_master', 'encode', 'android', 'ios')
+
+# Format version of the results file
+RESULTS_VERSION = 1
+
+# Cases faster than this are too noisy to flag on time alone
+DEFAULT_MIN_SECONDS = 0.05
+
+# Pixel-free generator commands checked by `startup`; {tmp} is a scratch directory
+STARTUP_COMMANDS = {
+    'android --help': ['android/PlayStore/AppIcon/generate_icons.py', '--help'],
+    'android --list-targets': ['android/PlayStore/AppIcon/generate_icons.py', '--list-targets'],
+    'ios --help': ['ios/AppStore/AppIcon/generate_icons.py', '--help'],
+    'ios --list-targets': ['ios/AppStore/AppIcon/generate_icons.py', '--list-targets'],
+    'ios --metadata-only': ['ios/AppStore/AppIcon/generate_icons.py', '--metadata-only',
+                            '--output-dir', '{tmp}'],
+}
+
+# Modules those commands must not import
+HEAVY_MODULES = ('PIL.Image', 'numpy')
+
+DEFAULT_STARTUP_BUDGET_MS = 150
+
+# Generator runs compared by `reproducible`; {master} is a synthetic master,
+# {spec} a variant spec naming every platform and {out} the run's output directory
+REPRODUCIBLE_COMMANDS = {
+    'android': ['android/PlayStore/AppIcon/generate_icons.py', '{master}', '--archive', '{out}/android.zip'],
+    'ios': ['ios/AppStore/AppIcon/generate_icons.py', '--create-master', '--no-cache',
+            '--output-dir', 'AppIcon.appiconset', '--archive', '{out}/ios.tar.gz'],
+    'variants': ['scripts/generate_icon_variants.py', '{spec}', '--no-cache', '--bundle-dir', '{out}'],
+}
+
+# The only chunks a deterministic PNG may have
+CRITICAL_CHUNKS = ('IHDR', 'IDAT', 'IEND')
+
+# Generators whose output `roundtrip` checks with --verify
+ROUNDTRIP_PLATFORMS = ('android', 'ios')
+
+
+def _generators():
+    android = load_generator('android/PlayStore/AppIcon/generate_icons.py', 'android_generate_icons')
+    ios = load_generator('ios/AppStore/AppIcon/generate_icons.py', 'ios_generate_icons')
+    return android, ios
+
+
+def make_synthetic_master(path, size):
+    """Write a size x size master: the app icon over a gradient, so it is not flat."""
+    _, ios = _generators()
+    icon = ios.create_master_icon(size).convert('RGBA')
+    gradient = Image.linear_gradient('L').resize((size, size))
+    background = Image.merge('RGBA', (gradient, gradient.rotate(90), gradient.rotate(180),
+                                      Image.new('L', (size, size), 255)))
+    Image.blend(background, icon, 0.8).save(path, compress_level=1)
+
+
+def _snapshot(directory):
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _bytes_written(before, after):
+    return sum(size for path, (mtime, size) in after.items() if before.get(path) != (mtime, size))
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the generators' progress output."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _generate_android(android, master_path, out_dir, manifest, jobs):
+    cache = IconCache(manifest)
+    res_dir = os.path.join(out_dir, 'res')
+    renderer = Renderer(lambda: android.prepare_master(master_path), workers=jobs,
+                        source_key=file_digest(master_path))
+    with renderer:
+        android.generate_launcher_icons(None, res_dir, renderer, cache)
+        android.generate_adaptive_icons(None, res_dir, renderer, cache)
+        android.generate_play_store_icon(None, out_dir, renderer, cache)
+    cache.save()
+
+
+def _generate_ios(ios, master_path, out_dir, manifest, jobs):
+    cache = IconCache(manifest)
+    ios.generate_all_icons(master_path, os.path.join(out_dir, 'AppIcon.appiconset'), jobs, cache)
+    cache.save()
+
+
+def _run_child(spec, command='_case'):
+    """Run one case in a child process and return its result dict."""
+    completed = subprocess.run([sys.executable, __file__, command, json.dumps(spec)],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip())
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_case(spec):
+    """Run one benchmark case in this process and return its result dict."""
+    android, ios = _generators()
+    case, size, jobs = spec['case'], spec['size'], spec['jobs']
+    master_path = spec['master']
+    best = None
+    bytes_written = 0
+
+    for _ in range(spec['repeat']):
+        with tempfile.TemporaryDirectory() as out_dir:
+            out_dir = spec.get('out_dir') or out_dir
+            manifest = os.path.join(out_dir, '.icon_cache.json')
+            work = None
+
+            if case == 'make_square':
+                image = Image.open(master_path).resize((size, size * 5 // 4))
+                work = lambda: android.make_square(image)
+            elif case == 'create_master':
+                work = lambda: ios.create_master_icon(size)
+            elif case == 'encode':
+                master = android.prepare_master(master_path)
+                targets = android.launcher_targets(out_dir) + android.adaptive_targets(out_dir)
+                images = [render_image(master, job) for _, job in targets]
+                images += [master.resize(icon_size, Image.LANCZOS) for icon_size in set(ios.ICON_SIZES.values())]
+                work = lambda: [encode_png(image, spec['strategy']) for image in images]
+            elif case in ('android', 'ios'):
+                generate = _generate_android if case == 'android' else _generate_ios
+                generator = android if case == 'android' else ios
+                work = lambda: generate(generator, master_path, out_dir, manifest, jobs)
+            else:
+                raise ValueError(f"unknown benchmark case '{case}'")
+
+            before = _snapshot(out_dir)
+            cpu = _cpu_seconds()
+            start = time.perf_counter()
+            with _quiet():
+                work()
+            wall = time.perf_counter() - start
+            cpu = _cpu_seconds() - cpu
+            bytes_written = _bytes_written(before, _snapshot(out_dir))
+
+        if best is None or wall < best[0]:
+            best = (wall, cpu)
+
+    peaks = [peak for peak in (peak_rss(), peak_rss(children=True)) if peak]
+    return {
+        'wall_s': round(best[0], 4),
+        'cpu_s': round(best[1], 4),
+        'peak_rss_mb': round(max(peaks) / 2**20, 1) if peaks else None,
+        'bytes_written': bytes_written,
+    }
+
+
+def plan_cases(sizes, cases, jobs):
+    """(name, spec) pairs of every case to run, in run order."""
+    planned = []
+    for size in sizes:
+        for case in cases:
+            if case in ('android', 'ios'):
+                for mode, workers in (('serial', 1), ('parallel', jobs)):
+                    for cache in ('cold', 'warm'):
+                        planned.append((f'{case}/{size}/{mode}/{cache}',
+                                        {'case': case, 'size': size, 'jobs': workers, 'cache': cache}))
+            else:
+                planned.append((f'{case}/{size}', {'case': case, 'size': size, 'jobs': 1, 'cache': None}))
+    return planned
+
+
+def environment():
+    """Versions and hardware that results depend on."""
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'numpy': numpy_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def command_run(args):
+    jobs = args.jobs or os.cpu_count() or 1
+    results = {}
+
+    with tempfile.TemporaryDirectory() as masters_dir:
+        masters = {}
+        for size in args.sizes:
+            masters[size] = os.path.join(masters_dir, f'master-{size}.png')
+            print(f"🖼  Creating synthetic {size}x{size} master...")
+            # In a child process: Linux carries a parent's peak RSS over
+            # into the children it spawns, which would skew every case
+            _run_child({'size': size, 'path': masters[size]}, command='_master')
+
+        for name, spec in plan_cases(args.sizes, args.cases, jobs):
+            spec.update(master=masters[spec['size']], repeat=args.repeat, strategy=args.png_strategy)
+            try:
+                with tempfile.TemporaryDirectory() as out_dir:
+                    if spec['cache'] == 'warm':
+                        # Prime the output in a separate process, so the measured
+                        # process's peak RSS only reflects warm runs
+                        spec['out_dir'] = out_dir
+                        _run_child(dict(spec, cache='cold', repeat=1))
+                    result = results[name] = _run_child(spec)
+            except RuntimeError as e:
+                print(f"❌ {name} failed:\n{e}")
+                sys.exit(1)
+            print(f"  {name:32s} {result['wall_s'] * 1000:9.1f} ms wall  {result['cpu_s'] * 1000:9.1f} ms cpu  "
+                  f"{result['peak_rss_mb'] or 0:7.1f} MB  {result['bytes_written']:>10d} B")
+
+    report = {
+        'version': RESULTS_VERSION,
+        'environment': environment(),
+        'settings': {'jobs': jobs, 'repeat': args.repeat, 'png_strategy': args.png_strategy},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"\n✅ Wrote {len(results)} results to {args.output}")
+
+
+def compare(baseline, current, threshold, min_seconds=DEFAULT_MIN_SECONDS):
+    """
+    Compare two results files, returning (rows, regressions).
+
+    Each row is (name, metric, baseline, current, ratio). A time metric
+    regresses when it grew by more than threshold and by more than
+    min_seconds; peak RSS and bytes written regress when they grew by more
+    than threshold.
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        before, after = baseline['results'][name], current['results'][name]
+        for metric in ('wall_s', 'cpu_s', 'peak_rss_mb', 'bytes_written'):
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            ratio = new / old if old else (1.0 if new == old else float('inf'))
+            rows.append((name, metric, old, new, ratio))
+            if ratio > 1 + threshold and not (metric.endswith('_s') and new - old <= min_seconds):
+                regressions.append(rows[-1])
+    return rows, regressions
+
+
+def command_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    if baseline.get('environment') != current.get('environment'):
+        print("⚠ Warning: results were recorded in different environments:")
+        for key in sorted(set(baseline.get('environment', {})) | set(current.get('environment', {}))):
+            old, new = baseline['environment'].get(key), current['environment'].get(key)
+            if old != new:
+                print(f"    {key}: {old} → {new}")
+
+    rows, regressions = compare(baseline, current, args.threshold, args.min_seconds)
+    print(f"{'case':32s} {'metric':14s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for name, metric, old, new, ratio in rows:
+        flag = '  ⚠' if (name, metric, old, new, ratio) in regressions else ''
+        print(f"{name:32s} {metric:14s} {old:>12} {new:>12} {(ratio - 1) * 100:>+7.1f}%{flag}")
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"\nℹ Not in current results: {', '.join(missing)}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) over {args.threshold * 100:.0f}%")
+        sys.exit(1)
+    print(f"\n✅ No regressions over {args.threshold * 100:.0f}%")
+
+
+def parse_importtime(stderr):
+    """
+    Return (total import seconds, imported module names) from the
+    -X importtime output of a process.
+    """
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):
+            # Top-level imports include the time of everything they import
+            total_us += int(cumulative)
+    return total_us / 1e6, modules
+
+
+def measure_startup(argv, repeat):
+    """Best import time and wall time of a command, and the modules it imported."""
+    best_imports = best_wall = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=REPO_ROOT,
+                                capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stdout}{result.stderr}")
+        imports, modules = parse_importtime(result.stderr)
+        best_imports = imports if best_imports is None else min(best_imports, imports)
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+    return best_imports, best_wall, modules
+
+
+def command_startup(args):
+    print(f"{'command':28s} {'imports':>10s} {'wall':>10s}  heavy modules")
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, argv in STARTUP_COMMANDS.items():
+            argv = [arg.format(tmp=tmp) for arg in argv]
+            imports, wall, modules = measure_startup(argv, args.repeat)
+            heavy = sorted(module for module in HEAVY_MODULES if module in modules)
+            print(f"{name:28s} {imports * 1000:>8.1f}ms {wall * 1000:>8.1f}ms  {', '.join(heavy) or '-'}")
+            if heavy or imports * 1000 > args.budget_ms:
+                failures.append(name)
+
+    if failures:
+        print(f"\n❌ Over the {args.budget_ms:.0f} ms import budget or importing "
+              f"{' / '.join(HEAVY_MODULES)}: {', '.join(failures)}")
+        sys.exit(1)
+    print(f"\n✅ Every pixel-free command imports in under {args.budget_ms:.0f} ms "
+          f"without {' or '.join(HEAVY_MODULES)}")
+
+
+def target_sizes():
+    """Every distinct icon size the Android and iOS generators resize to."""
+    android, ios = _generators()
+    jobs = android.launcher_targets('') + android.adaptive_targets('') + android.play_store_targets('')
+    sizes = {job.size for _, job in jobs} | set(ios.ICON_SIZES.values())
+    return sorted(sizes, reverse=True)
+
+
+def stripe_error(resized):
+    """
+    Mean distance (in sRGB steps) of a resized 1px black and white stripe
+    pattern from 50% linear light, its physically correct average.
+    """
+    import numpy as np
+
+    ideal = 255 * (1.055 * 0.5 ** (1 / 2.4) - 0.055)
+    return float(np.abs(np.asarray(resized.convert('RGB'), dtype=np.float64) - ideal).mean())
+
+
+def _best_time(function, repeat, before=None):
+    best = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def command_resample(args):
+    try:
+        import numpy as np
+        from icon_pipeline import resample
+    except ImportError:
+        print("Error: the resample benchmark needs NumPy: pip install numpy")
+        sys.exit(1)
+    from icon_pipeline.pyramid import channel_delta
+
+    sizes = target_sizes()
+    print(f"Resizing to {len(sizes)} target sizes, best of {args.repeat}")
+    print(f"\n{'master':>8s} {'resampler':10s} {'cold ms':>9s} {'warm ms':>9s} "
+          f"{'stripes':>9s} {'vs pillow max/mean':>20s}")
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'master.png')
+            make_synthetic_master(path, size)
+            master = Image.open(path)
+            master.load()
+        stripes = np.zeros((size, size, 3), np.uint8)
+        stripes[:, ::2] = 255
+        stripes = Image.fromarray(stripes)
+
+        def pillow(image):
+            return {target: image.resize(target, Image.LANCZOS) for target in sizes}
+
+        def linear(image):
+            return resample.resize_many(image, sizes)
+
+        pillow_time = _best_time(lambda: pillow(master), args.repeat)
+        cold = _best_time(lambda: linear(master), args.repeat, before=resample.lanczos_weights.cache_clear)
+        warm = _best_time(lambda: linear(master), args.repeat)
+
+        pillow_icons, linear_icons = pillow(master), linear(master)
+        deltas = [channel_delta(pillow_icons[target], linear_icons[target]) for target in sizes]
+        max_delta = max(high for high, _ in deltas)
+        mean_delta = sum(mean for _, mean in deltas) / len(deltas)
+
+        # Only reductions average the stripes
+        reduced = [target for target in sizes if target[0] < size]
+        pillow_stripes, linear_stripes = pillow(stripes), linear(stripes)
+        pillow_error = sum(stripe_error(pillow_stripes[t]) for t in reduced) / len(reduced)
+        linear_error = sum(stripe_error(linear_stripes[t]) for t in reduced) / len(reduced)
+
+        print(f"{size:>8d} {'pillow':10s} {pillow_time * 1000:>9.1f} {pillow_time * 1000:>9.1f} "
+              f"{pillow_error:>9.1f} {'-':>20s}")
+        print(f"{size:>8d} {'linear':10s} {cold * 1000:>9.1f} {warm * 1000:>9.1f} "
+              f"{linear_error:>9.1f} {f'{max_delta} / {mean_delta:.2f}':>20s}")
+
+
+def png_chunks(data):
+    """The chunk types of PNG bytes, in order."""
+    chunks = []
+    offset = 8
+    while offset + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        chunks.append(kind.decode('latin-1'))
+        offset += length + 12
+    return chunks
+
+
+def archive_files(path):
+    """{name: bytes} of the regular files in a zip or tar archive."""
+    import tarfile
+    import zipfile
+
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(path) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive if member.isfile()}
+
+
+def _directory_files(directory):
+    return {os.path.relpath(os.path.join(root, name), directory): Path(root, name).read_bytes()
+            for root, _, names in os.walk(directory) for name in names}
+
+
+def write_reproducible_spec(path, master):
+    """A variant spec with a bitmap and a created master, naming every platform."""
+    def targets(name):
+        return {
+            'android_res': f'{name}/android/res',
+            'play_store': f'{name}/play',
+            'ios_appiconset': f'{name}/ios/AppIcon.appiconset',
+            'web': f'{name}/web',
+            'windows_icon': f'{name}/windows/app_icon.ico',
+            'macos_icon': f'{name}/macos/AppIcon.icns',
+        }
+
+    spec = {'variants': [
+        dict(name='app', source=master, **targets('app')),
+        dict(name='work', colors={'note': '#3F51B5', 'dot': '#FFC107'}, **targets('work')),
+    ]}
+    with open(path, 'w') as f:
+        json.dump(spec, f, indent=2)
+
+
+def run_reproducible(argv, work_dir, out_dir, env):
+    """Run a generator with --deterministic in work_dir, returning {name: bytes} of what it wrote to out_dir."""
+    os.makedirs(out_dir)
+    argv = [str(REPO_ROOT / argv[0])] + [arg.format(out=out_dir) for arg in argv[1:]] + ['--deterministic']
+    result = subprocess.run([sys.executable] + argv, cwd=work_dir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stdout}{result.stderr}")
+    files = {}
+    for name, data in _directory_files(out_dir).items():
+        files[name] = data
+        files.update((f'{name}:{member}', content) for member, content in archive_files(os.path.join(out_dir, name)).items())
+    return files
+
+
+def command_reproducible(args):
+    env = {key: value for key, value in os.environ.items() if key != 'SOURCE_DATE_EPOCH'}
+    # The second run differs in everything the output must not depend on
+    runs = [(dict(env, TZ='UTC', PYTHONHASHSEED='1'), '1'),
+            (dict(env, TZ='Pacific/Chatham', PYTHONHASHSEED='2'), '0')]
+
+    print(f"{'generator':10s} {'files':>6s} {'PNGs':>6s}  result")
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        master = os.path.join(tmp, 'master.png')
+        make_synthetic_master(master, args.size)
+        spec = os.path.join(tmp, 'spec', 'flavors.json')
+        os.makedirs(os.path.dirname(spec))
+        write_reproducible_spec(spec, master)
+        work_dir = os.path.join(tmp, 'work')
+        os.makedirs(work_dir)
+
+        for name, argv in REPRODUCIBLE_COMMANDS.items():
+            argv = [arg.replace('{master}', master).replace('{spec}', spec) for arg in argv]
+            outputs = []
+            for index, (run_env, jobs) in enumerate(runs):
+                out_dir = os.path.join(tmp, name, str(index))
+                outputs.append(run_reproducible(argv + ['--jobs', jobs], work_dir, out_dir, run_env))
+
+            problems = []
+            first, second = outputs
+            changed = sorted(path for path in set(first) | set(second) if first.get(path) != second.get(path))
+            if changed:
+                problems.append(f"{len(changed)} files differ ({', '.join(changed[:3])}"
+                                + (', ...)' if len(changed) > 3 else ')'))
+            pngs = {path: data for path, data in first.items() if path.endswith('.png')}
+            extra = sorted(path for path, data in pngs.items() if set(png_chunks(data)) - set(CRITICAL_CHUNKS))
+            if extra:
+                problems.append(f"{len(extra)} PNGs have ancillary chunks ({extra[0]}: "
+                                f"{', '.join(png_chunks(pngs[extra[0]]))})")
+            stray = sorted(_directory_files(work_dir)) + sorted(set(os.listdir(os.path.dirname(spec))) - {'flavors.json'})
+            if stray:
+                problems.append(f"left files behind: {', '.join(stray)}")
+
+            print(f"{name:10s} {len(first):>6d} {len(pngs):>6d}  " + ('; '.join(problems) or 'identical'))
+            if problems:
+                failures.append(name)
+
+    if failures:
+        print(f"\n❌ Not reproducible: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n✅ Every generator wrote byte-identical output, with only critical PNG chunks")
+
+
+def make_flat_master(path, size):
+    """Write a size x size master of two flat colors, which the palette strategies pack below 8 bits."""
+    image = Image.new('RGB', (size, size), '#2196F3')
+    image.paste('#FFFFFF', (size // 4, size // 4, size * 3 // 4, size * 3 // 4))
+    image.save(path)
+
+
+def roundtrip(platform_name, master_path, out_dir, strategy):
+    """
+    Generate one platform's icons into out_dir with a PNG strategy, then
+    check them as --verify MANIFEST does. Returns (icons, problem lines).
+    """
+    android, ios = _generators()
+    cache = IconCache(os.path.join(out_dir, 'manifest.json'))
+    if platform_name == 'android':
+        generator = android
+        renderer = Renderer(lambda: android.prepare_master(master_path), source_key=file_digest(master_path),
+                            strategy=strategy)
+        nodes = android.build_targets(os.path.join(out_dir, 'res'), out_dir, renderer)
+    else:
+        generator = ios
+        renderer = ios.make_renderer(master_path, strategy=strategy)
+        nodes = ios.build_targets(out_dir, renderer)
+    with _quiet(), renderer:
+        generator.build_and_report(nodes, None, renderer, cache)
+
+    report = io.StringIO()
+    names = select(nodes, None)
+    with contextlib.redirect_stdout(report):
+        if platform_name == 'android':
+            verified = android.verify_icon_set(nodes, names, cache)
+        else:
+            verified = ios.verify_icon_set(nodes, names, out_dir, cache)
+    icons = sum(1 for node in nodes if node.target is not None)
+    return icons, [] if verified else report.getvalue().strip().splitlines()[:-2]
+
+
+def command_roundtrip(args):
+    print(f"{'strategy':12s} {'platform':10s} {'icons':>6s}  result")
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        master = os.path.join(tmp, 'master.png')
+        make_flat_master(master, args.size)
+        for strategy in STRATEGIES:
+            for platform_name in ROUNDTRIP_PLATFORMS:
+                out_dir = os.path.join(tmp, strategy, platform_name)
+                os.makedirs(out_dir)
+                icons, problems = roundtrip(platform_name, master, out_dir, strategy)
+                print(f"{strategy:12s} {platform_name:10s} {icons:>6d}  "
+                      + (f"{len(problems)} problem(s)" if problems else 'verified'))
+                for line in problems:
+                    print(f"    {line.strip()}")
+                if problems:
+                    failures.append(f'{strategy}/{platform_name}')
+
+    if failures:
+        print(f"\n❌ --verify rejects generated icons: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n✅ Icons of every PNG strategy pass --verify")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] in ('_case', '_master'):
+        # Child process of `run`: one case (or master), result as JSON on stdout
+        spec = json.loads(sys.argv[2])
+        if sys.argv[1] == '_master':
+            make_synthetic_master(spec['path'], spec['size'])
+            print(json.dumps({}))
+        else:
+            print(json.dumps(run_case(spec)))
+        return
+
+    parser = argparse.ArgumentParser(description='Benchmark the ephenotes icon pipeline')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks and write a results file')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                            help=f"Master sizes (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    run_parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES),
+                            help='Cases to run (default: all)')
+    run_parser.add_argument('--jobs', type=int, default=0,
+                            help='Worker processes of the parallel runs (default: all CPUs)')
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per case; the fastest is kept (default: 3)')
+    run_parser.add_argument('--png-strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                            help=f'PNG strategy of the encode case (default: {DEFAULT_STRATEGY})')
+    run_parser.add_argument('--output', default='icon_benchmark.json',
+                            help='Results file (default: icon_benchmark.json)')
+    run_parser.set_defaults(func=command_run)
+
+    compare_parser = commands.add_parser('compare', help='Flag regressions against a baseline results file')
+    compare_parser.add_argument('baseline', help='Results file of the baseline run')
+    compare_parser.add_argument('current', help='Results file of the run to check')
+    compare_parser.add_argument('--threshold', type=float, default=0.15,
+                                help='Allowed relative growth of each metric (default: 0.15)')
+    compare_parser.add_argument('--min-seconds', type=float, default=DEFAULT_MIN_SECONDS,
+                                help='Ignore time changes smaller than this (default: '
+                                     f'{DEFAULT_MIN_SECONDS})')
+    compare_parser.set_defaults(func=command_compare)
+
+    startup_parser = commands.add_parser('startup', help='Check the import time of pixel-free commands')
+    startup_parser.add_argument('--budget-ms', type=float, default=DEFAULT_STARTUP_BUDGET_MS,
+                                help='Allowed import time per command (default: '
+                                     f'{DEFAULT_STARTUP_BUDGET_MS} ms)')
+    startup_parser.add_argument('--repeat', type=int, default=3,
+                                help='Runs per command; the fastest is kept (default: 3)')
+    startup_parser.set_defaults(func=command_startup)
+
+    resample_parser = commands.add_parser('resample', help='Compare the linear-light resampler with Pillow')
+    resample_parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048],
+                                 help='Master sizes (default: 1024 2048)')
+    resample_parser.add_argument('--repeat', type=int, default=3,
+                                 help='Runs per resampler; the fastest is kept (default: 3)')
+    resample_parser.set_defaults(func=command_resample)
+
+    reproducible_parser = commands.add_parser('reproducible',
+                                              help='Check that --deterministic output is byte-identical')
+    reproducible_parser.add_argument('--size', type=int, default=1024,
+                                     help='Size of the synthetic master (default: 1024)')
+    reproducible_parser.set_defaults(func=command_reproducible)
+
+    roundtrip_parser = commands.add_parser('roundtrip',
+                                           help='Check that icons of every PNG strategy pass --verify')
+    roundtrip_parser.add_argument('--size', type=int, default=1024,
+                                  help='Size of the flat-color master (default: 1024)')
+    roundtrip_parser.set_defaults(func=command_roundtrip)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
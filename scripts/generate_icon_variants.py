@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+ephenotes Icon Variant Generator
+
+Builds the Android and iOS icon sets of every flavor listed in a variant spec
+(see scripts/icon_pipeline/variants.py for the format) in a single process,
+plus the web, Windows and macOS icons a variant names. Pillow is imported
+once, each distinct master is decoded or rendered once, and every resize and
+PNG encode is shared by all flavors and platforms that need it. Unchanged
+icons are skipped through the same cache manifest as the platform generators.
+
+Requirements:
+    - Python 3.8+
+    - Pillow (PIL): pip install Pillow
+    - PyYAML for .yaml specs (optional): pip install pyyaml
+    - NumPy for --resampler linear, --mask-report and --qa (optional): pip install numpy
+    - CairoSVG for SVG sources (optional): pip install cairosvg
+
+Usage:
+    python scripts/generate_icon_variants.py flavors.json [--jobs N] [--only NAME] [--watch]
+
+See --help for every option and scripts/README.md for how they work.
+"""
+
+import argparse
+import functools
+import importlib.util
+import itertools
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from icon_pipeline import trace
+from icon_pipeline.cache import MANIFEST_NAME, IconCache, file_digest
+from icon_pipeline.desktop import ICNS_TYPES, ICO_SIZES, shared_jobs, web_targets, write_icns, write_ico, write_manifest
+from icon_pipeline.encode import DEFAULT_STRATEGY, DETERMINISTIC, STRATEGIES, describe, encoder_fingerprint
+from icon_pipeline.ingest import ingest
+from icon_pipeline.pyramid import DEFAULT_MIN_RATIO
+from icon_pipeline.render import DEFAULT_RESAMPLER, RESAMPLERS, Renderer, render_targets
+from icon_pipeline.sinks import ARCHIVE_SUFFIXES, FileSink, open_sink
+from icon_pipeline.svg import SvgMaster, is_svg, rasterizer_available, svg_source_key
+from icon_pipeline.variants import load_variants, master_key
+from icon_pipeline.watch import watch
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_generator(relative_path, module_name):
+    """Import a platform generate_icons.py script as a module."""
+    spec = importlib.util.spec_from_file_location(module_name, REPO_ROOT / relative_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _decode(path, working_size, memory_budget=None):
+    result = ingest(path, working_size, memory_budget)
+    if result.factor > 1:
+        print(f"Decoded {path} by {result.method}")
+    return result.image
+
+
+def load_master(variant, android, ios, memory_budget=None):
+    """
+    Decode a variant's source (an SVG source becomes an SvgMaster), or render
+    its colored master if it has none.
+    """
+    if is_svg(variant.source):
+        return SvgMaster(variant.source)
+    if variant.source:
+        # One decode serves both platforms, so keep enough pixels for iOS
+        return _decode(variant.source, max(android.WORKING_SIZE, ios.WORKING_SIZE), memory_budget)
+    return ios.create_master_icon(note_color=variant.colors.get('note', ios.DEFAULT_NOTE_COLOR),
+                                  dot_color=variant.colors.get('dot', ios.DEFAULT_DOT_COLOR))
+
+
+def bundle_sink(variant, bundle_dir, bundle_format, root):
+    """The archive sink of a variant's bundle, bundle_dir/<name>.<format>, named relative to root."""
+    return open_sink(os.path.join(bundle_dir, f'{variant.name}.{bundle_format}'), root)
+
+
+def maskable_background(variant, android):
+    """Fill color of a variant's maskable web icons: its adaptive icon background."""
+    if variant.android_res:
+        return android.adaptive_background_color(variant.android_res, variant.adaptive_background)
+    return variant.adaptive_background or android.DEFAULT_BACKGROUND_COLOR
+
+
+def desktop_shared_jobs(android):
+    """The Android launcher and Play Store jobs the desktop and web icons reuse, by side."""
+    return shared_jobs(job for _, job in android.launcher_targets('') + android.play_store_targets(''))
+
+
+def generate_desktop_icons(variant, android, renderer, cache, sink):
+    """
+    Build a variant's web icons and manifest.json, .ico and .icns with the
+    Android renderer, reusing the launcher and Play Store icons it already
+    encoded. Returns the number of icon files and containers rendered.
+    """
+    shared = desktop_shared_jobs(android)
+    generated = 0
+
+    if variant.web:
+        print("\n🌐 Generating web icons...")
+        targets = web_targets(variant.web, maskable_background(variant, android), shared)
+        for (output_path, job), was_rendered in zip(targets, render_targets(renderer, targets, cache, sink=sink)):
+            width, height = job.canvas_size or job.size
+            if was_rendered:
+                print(f"  ✓ {width}x{height}px → {output_path} ({describe(renderer.encoded(job), job.budget)})")
+            else:
+                print(f"  = {width}x{height}px unchanged → {output_path}")
+            generated += was_rendered
+        manifest_path = os.path.join(variant.web, 'manifest.json')
+        if write_manifest(variant.web, sink):
+            print(f"  ✓ Updated {manifest_path}")
+        else:
+            print(f"  ℹ Skipped {manifest_path} (unchanged)")
+
+    containers = [(variant.windows_icon, write_ico, len(ICO_SIZES)),
+                  (variant.macos_icon, write_icns, len(ICNS_TYPES))]
+    if variant.windows_icon or variant.macos_icon:
+        print("\n🖥 Generating desktop icons...")
+    for output_path, write, count in containers:
+        if not output_path:
+            continue
+        if write(renderer, output_path, cache, sink, shared):
+            print(f"  ✓ {count} images → {output_path} ({sink.size(output_path) / 1024:.1f} KB)")
+            generated += 1
+        else:
+            print(f"  = {count} images unchanged → {output_path}")
+
+    return generated
+
+
+def build_group(variants, android, ios, cache, jobs=1, pyramid=None, memory_budget=None,
+                strategy=DEFAULT_STRATEGY, resampler=DEFAULT_RESAMPLER, quality=None, sink_for=None):
+    """
+    Build every variant sharing one master, decoding or rendering it once.
+    With a quality list, append the QualityTargets of every icon built; with
+    sink_for, write each variant to the sink sink_for(variant) returns
+    instead of to disk.
+    """
+    first = variants[0]
+    master = functools.lru_cache(maxsize=None)(lambda: load_master(first, android, ios, memory_budget))
+
+    if is_svg(first.source):
+        # SVG sources are rasterized at every size: no pyramid, no resampler
+        source_key = ios_source_key = svg_source_key(first.source)
+        pyramid, resampler = None, DEFAULT_RESAMPLER
+    elif first.source:
+        source_key = file_digest(first.source)
+        if memory_budget:
+            source_key += f':budget{memory_budget}:{max(android.WORKING_SIZE, ios.WORKING_SIZE)}'
+        ios_source_key = source_key
+    else:
+        ios_source_key = ios.master_source_key(None, first.colors.get('note', ios.DEFAULT_NOTE_COLOR),
+                                               first.colors.get('dot', ios.DEFAULT_DOT_COLOR))
+        source_key = 'android:' + ios_source_key
+
+    android_renderer = Renderer(lambda: android.prepare_master(master()), workers=jobs,
+                                source_key=source_key, pyramid=pyramid, strategy=strategy,
+                                resampler=resampler)
+    ios_renderer = Renderer(lambda: ios.prepare_master_icon(master()), workers=jobs,
+                            source_key=ios_source_key, pyramid=pyramid, strategy=strategy,
+                            resampler=resampler)
+
+    total = 0
+    with android_renderer, ios_renderer:
+        for variant in variants:
+            print("\n" + "=" * 60)
+            print(f"Variant: {variant.name}")
+            print("=" * 60)
+
+            with (sink_for(variant) if sink_for else FileSink()) as sink:
+                if variant.android_res:
+                    total += android.generate_launcher_icons(None, variant.android_res, android_renderer, cache,
+                                                             variant.adaptive_background, sink)
+                    total += android.generate_adaptive_icons(None, variant.android_res, android_renderer, cache,
+                                                             sink)
+                    android.create_adaptive_icon_xml(variant.android_res, variant.adaptive_background, sink)
+
+                if variant.play_store:
+                    total += android.generate_play_store_icon(None, variant.play_store, android_renderer, cache,
+                                                              sink)
+
+                if variant.ios_appiconset:
+                    total += ios.generate_all_icons(None, variant.ios_appiconset, cache=cache,
+                                                    renderer=ios_renderer, sink=sink)
+                    ios.update_contents_json(variant.ios_appiconset, sink)
+
+                if variant.web or variant.windows_icon or variant.macos_icon:
+                    total += generate_desktop_icons(variant, android, android_renderer, cache, sink)
+            if sink_for:
+                print(f"\n📦 Bundled {len(sink.sizes)} files into {sink.path}")
+
+            if quality is not None:
+                quality += quality_targets(variant, android, ios, android_renderer, ios_renderer)
+
+    return total
+
+
+def variant_outputs(variant, android, ios):
+    """Paths of the icon files a variant writes."""
+    targets = []
+    if variant.android_res:
+        targets += android.launcher_targets(variant.android_res) + android.adaptive_targets(variant.android_res)
+        targets += android.round_targets(variant.android_res) + android.monochrome_targets(variant.android_res)
+    if variant.play_store:
+        targets += android.play_store_targets(variant.play_store)
+    paths = [path for path, _ in targets]
+    if variant.ios_appiconset:
+        paths += [os.path.join(variant.ios_appiconset, filename) for filename in ios.ICON_SIZES]
+    if variant.web:
+        paths += [path for path, _ in web_targets(variant.web, maskable_background(variant, android))]
+    paths += [path for path in (variant.windows_icon, variant.macos_icon) if path]
+    return paths
+
+
+def quality_targets(variant, android, ios, android_renderer, ios_renderer):
+    """
+    icon_pipeline.quality QualityTargets of every icon a variant writes,
+    named relative to its output directories.
+    """
+    from icon_pipeline.quality import QualityTarget
+
+    android_targets = []
+    if variant.android_res:
+        background_color = android.adaptive_background_color(variant.android_res, variant.adaptive_background)
+        android_targets += [(variant.android_res, target) for target in
+                            android.launcher_targets(variant.android_res)
+                            + android.round_targets(variant.android_res, background_color)
+                            + android.adaptive_targets(variant.android_res)
+                            + android.monochrome_targets(variant.android_res)]
+    if variant.play_store:
+        android_targets += [(variant.play_store, target) for target in android.play_store_targets(variant.play_store)]
+
+    targets = [QualityTarget(f'{variant.name}/android', os.path.relpath(path, base), path, job,
+                             android_renderer.master)
+               for base, (path, job) in android_targets]
+    if variant.ios_appiconset:
+        targets += [QualityTarget(f'{variant.name}/ios', filename, os.path.join(variant.ios_appiconset, filename),
+                                  ios.RenderJob(size), ios_renderer.master)
+                    for filename, size in ios.ICON_SIZES.items()]
+    if variant.web:
+        targets += [QualityTarget(f'{variant.name}/web', os.path.relpath(path, variant.web), path, job,
+                                  android_renderer.master)
+                    for path, job in web_targets(variant.web, maskable_background(variant, android),
+                                                 desktop_shared_jobs(android))]
+    return targets
+
+
+def build_all(variants, android, ios, cache, args, memory_budget, quality=None):
+    """
+    Build every variant, one master group at a time. Returns the icons
+    generated; with a quality list, appends their QualityTargets to it.
+    """
+    total_generated = 0
+    sink_for = None
+    if args.bundle_dir:
+        # Variant paths are relative to the spec, and so are the bundle entries
+        sink_for = functools.partial(bundle_sink, bundle_dir=args.bundle_dir, bundle_format=args.bundle_format,
+                                     root=os.path.dirname(os.path.abspath(args.spec)))
+    # Variants sharing a master are built together, then its pool is released
+    ordered = sorted(variants, key=master_key)
+    for _, group in itertools.groupby(ordered, key=master_key):
+        total_generated += build_group(list(group), android, ios, cache, args.jobs, args.pyramid,
+                                       memory_budget, args.png_strategy, args.resampler, quality, sink_for)
+    cache.save()
+    return total_generated
+
+
+def mask_entries(variants, android, ios, memory_budget=None):
+    """
+    icon_pipeline.masks.check_masks() entries of every variant and platform
+    it builds, decoding or rendering each distinct master once.
+    """
+    entries = []
+    for _, group in itertools.groupby(sorted(variants, key=master_key), key=master_key):
+        group = list(group)
+        master = load_master(group[0], android, ios, memory_budget)
+        for variant in group:
+            if variant.android_res or variant.play_store:
+                background_color = None
+                if variant.android_res:
+                    background_color = android.adaptive_background_color(variant.android_res,
+                                                                         variant.adaptive_background)
+                entries.append(android.mask_entry(variant.name, android.prepare_master(master),
+                                                  background_color))
+            if variant.ios_appiconset:
+                entries.append(ios.mask_entry(variant.name, ios.prepare_master_icon(master)))
+    return entries
+
+
+def select_variants(spec, only):
+    """Load the spec and keep the variants named in only (all if empty)."""
+    variants = load_variants(spec)
+    if only:
+        unknown = set(only) - {variant.name for variant in variants}
+        if unknown:
+            raise ValueError(f"unknown variant(s): {', '.join(sorted(unknown))}")
+        variants = [variant for variant in variants if variant.name in only]
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate Android, iOS, web and desktop icons for every flavor')
+    parser.add_argument('spec', help='Variant spec file (.json, or .yaml with PyYAML)')
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        help='Build only this variant (repeatable)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes for resize and PNG encode (0 = all CPUs)')
+    parser.add_argument('--pyramid', type=float, nargs='?', const=DEFAULT_MIN_RATIO, metavar='RATIO',
+                        help='Resize each icon from the smallest already resized icon at least '
+                             f'RATIO times larger (default ratio: {DEFAULT_MIN_RATIO})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Regenerate every icon, ignoring the cache manifest')
+    parser.add_argument('--cache-manifest',
+                        help=f'Path of the cache manifest (default: {MANIFEST_NAME} next to the spec)')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='Decode huge sources reduced so that decoding stays within MB megabytes, '
+                             'and report the peak memory')
+    parser.add_argument('--resampler', choices=RESAMPLERS, default=DEFAULT_RESAMPLER,
+                        help='Resize with Pillow\'s LANCZOS, or with LANCZOS in linear light on '
+                             f'premultiplied alpha (linear, needs NumPy; default: {DEFAULT_RESAMPLER})')
+    parser.add_argument('--mask-report', nargs='?', const='', metavar='SHEET',
+                        help='Measure how much of every variant each launcher and iOS mask clips at '
+                             'every size and exit, failing if artwork leaves a safe area; with SHEET '
+                             'also write a contact sheet PNG (needs NumPy)')
+    parser.add_argument('--qa', nargs='?', const='', metavar='GOLDENS',
+                        help='After building, score every icon (SSIM, PSNR, legibility) against a '
+                             'reference rendering and the golden images in GOLDENS, failing below '
+                             'the thresholds (needs NumPy)')
+    parser.add_argument('--qa-threshold', action='append', metavar='NAME=VALUE',
+                        help='Override a --qa threshold: ssim, psnr, legibility, golden-ssim or '
+                             'golden-psnr (repeatable)')
+    parser.add_argument('--update-goldens', action='store_true',
+                        help='With --qa GOLDENS, store the icons as the new golden images')
+    parser.add_argument('--bundle-dir', metavar='DIR',
+                        help='Write each variant into its own archive DIR/<name>.<format> instead of '
+                             'loose files, with entries named relative to the spec')
+    parser.add_argument('--bundle-format', choices=[suffix[1:] for suffix in ARCHIVE_SUFFIXES], default='zip',
+                        help='Archive format of --bundle-dir (default: zip)')
+    parser.add_argument('--png-strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f'PNG encoder strategy tried first (default: {DEFAULT_STRATEGY})')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Encode byte-reproducible icons without ancillary chunks at pinned zlib '
+                             'settings instead of with --png-strategy, and record the encoder '
+                             'fingerprint in the cache manifest')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and rebuild whenever the spec or a source image changes')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write a Chrome/Perfetto trace of every stage and target to FILE (JSON)')
+    parser.add_argument('--trace-summary', action='store_true',
+                        help='Print wall time, CPU time and bytes per stage at the end')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write cProfile stats of the main process to FILE')
+    args = parser.parse_args()
+
+    try:
+        variants = select_variants(args.spec, args.only)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.resampler == 'linear' and importlib.util.find_spec('numpy') is None:
+        print("Error: --resampler linear needs NumPy: pip install numpy")
+        sys.exit(1)
+    if args.mask_report is not None and importlib.util.find_spec('numpy') is None:
+        print("Error: --mask-report needs NumPy: pip install numpy")
+        sys.exit(1)
+    if args.update_goldens and not args.qa:
+        print("Error: --update-goldens needs --qa GOLDENS")
+        sys.exit(1)
+    if args.bundle_dir and (args.watch or args.qa is not None):
+        print("Error: --bundle-dir cannot be combined with --watch or --qa")
+        sys.exit(1)
+    if args.deterministic:
+        args.png_strategy = DETERMINISTIC
+        # Bundle entries get a fixed timestamp unless one is given
+        os.environ.setdefault('SOURCE_DATE_EPOCH', '0')
+    if args.qa is not None:
+        if importlib.util.find_spec('numpy') is None:
+            print("Error: --qa needs NumPy: pip install numpy")
+            sys.exit(1)
+        from icon_pipeline.quality import check_quality, parse_thresholds
+        try:
+            thresholds = parse_thresholds(args.qa_threshold)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    android = load_generator('android/PlayStore/AppIcon/generate_icons.py', 'android_generate_icons')
+    ios = load_generator('ios/AppStore/AppIcon/generate_icons.py', 'ios_generate_icons')
+    # Every remaining path renders, so fail early without Pillow
+    android.load_pillow()
+
+    # Fail before doing any work if an Android source is unusable
+    if any(is_svg(variant.source) for variant in variants) and not rasterizer_available():
+        print("Error: SVG sources need CairoSVG: pip install cairosvg")
+        sys.exit(1)
+    for variant in variants:
+        if variant.source and (variant.android_res or variant.play_store or variant.web
+                               or variant.windows_icon or variant.macos_icon):
+            if not android.validate_source_image(variant.source):
+                sys.exit(1)
+        elif variant.source and not os.path.exists(variant.source):
+            print(f"Error: Source image not found: {variant.source}")
+            sys.exit(1)
+
+    manifest = args.cache_manifest or os.path.join(os.path.dirname(os.path.abspath(args.spec)), MANIFEST_NAME)
+    cache = IconCache(manifest, enabled=not args.no_cache)
+    if not args.bundle_dir:
+        cache.set_encoder(encoder_fingerprint() if args.deterministic else None)
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+
+    if args.mask_report is not None:
+        from icon_pipeline.masks import MASK_CACHE_NAME, check_masks
+        entries = mask_entries(variants, android, ios, memory_budget)
+        if not check_masks(entries, args.mask_report, os.path.join(os.path.dirname(manifest), MASK_CACHE_NAME)):
+            print("\n❌ Artwork falls outside the safe area of a mask")
+            sys.exit(1)
+        print(f"\n✅ Artwork of {len(variants)} variant(s) stays inside the safe area of every mask")
+        return
+
+    quality = [] if args.qa is not None else None
+    try:
+        with trace.tracing(args.trace, args.trace_summary, args.profile):
+            total_generated = build_all(variants, android, ios, cache, args, memory_budget, quality)
+    except Exception as e:
+        print(f"\n❌ Error generating icons: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+    print("\n" + "=" * 60)
+    print(f"✅ SUCCESS! Built {len(variants)} variant(s), generated {total_generated} icon files")
+    print("=" * 60)
+    if memory_budget:
+        android.report_peak_memory(memory_budget, workers=args.jobs != 1)
+
+    if quality is not None:
+        print("\n🔍 Checking icon quality...")
+        if not check_quality(quality, args.qa, thresholds, args.update_goldens):
+            print("\n❌ Some icons are below the quality thresholds")
+            sys.exit(1)
+
+    if args.watch:
+        def watched(variants):
+            sources = sorted({variant.source for variant in variants if variant.source})
+            outputs = [path for variant in variants for path in variant_outputs(variant, android, ios)]
+            return [args.spec] + sources, outputs
+
+        def rebuild(changed):
+            nonlocal variants
+            # Unchanged masters are skipped through the manifest without decoding
+            variants = select_variants(args.spec, args.only)
+            build_all(variants, android, ios, cache, args, memory_budget)
+            if watched(variants) != (inputs, outputs):
+                print("ℹ The spec now names other files; restart --watch to follow them")
+
+        inputs, outputs = watched(variants)
+        watch(inputs, rebuild, outputs)
+
+
+if __name__ == '__main__':
+    main()
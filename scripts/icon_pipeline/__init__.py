@@ -0,0 +1,17 @@
+"""
+ephenotes icon pipeline
+
+Shared helpers used by the platform icon generators:
+    - android/PlayStore/AppIcon/generate_icons.py
+    - ios/AppStore/AppIcon/generate_icons.py
+
+The generators add the scripts/ directory to sys.path and import from here,
+so this package has no installation step.
+
+Importing the package and its modules is cheap: Pillow and NumPy are only
+imported by the functions that do pixel work. sdf.py, resample.py,
+masks.py and quality.py, which are all pixel work, are the exceptions and
+are imported on first use. Help, target listing and metadata-only runs of the generators
+therefore start without them; scripts/benchmark_icons.py startup checks
+this.
+"""
@@ -0,0 +1,125 @@
+"""
+Content-addressed manifest of generated icon files.
+
+Each output path is recorded with the key it was rendered from (source image
+hash, target geometry, resampling filter and pipeline version, see
+Renderer.cache_key) and the SHA-256 of the bytes written. A target whose key
+is unchanged and whose file on disk still hashes to the recorded value is
+fresh and is skipped entirely, so a no-change run never decodes the master
+and never touches output mtimes.
+
+The manifest only contains content hashes and paths relative to its own
+directory, so it is stable across machines and can be committed or cached
+between CI runs. Runs with the deterministic PNG encoder also record its
+fingerprint (see encode.encoder_fingerprint), so a build cache can tell
+which encoder and zlib produced the bytes.
+"""
+
+import hashlib
+import json
+import os
+
+
+MANIFEST_NAME = '.icon_cache.json'
+MANIFEST_VERSION = 1
+
+
+def bytes_digest(data):
+    """Return the hex SHA-256 of a bytes object."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 of a file's contents, or None if it is missing."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class IconCache:
+    """
+    Manifest of generated outputs keyed by their render inputs.
+
+    Entries are only written back by save(), and only when something changed.
+    A disabled cache reports every target as stale and records nothing.
+    """
+
+    def __init__(self, manifest_path, enabled=True):
+        self.manifest_path = os.path.abspath(manifest_path)
+        self.enabled = enabled
+        self.entries = {}
+        self.encoder = None
+        self._dirty = False
+
+        if enabled:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.entries = manifest.get('entries', {})
+            self.encoder = manifest.get('encoder')
+
+    def _entry_name(self, output_path):
+        base_dir = os.path.dirname(self.manifest_path)
+        return os.path.relpath(os.path.abspath(output_path), base_dir).replace(os.sep, '/')
+
+    def is_fresh(self, output_path, key):
+        """Return True if output_path was built from key and is unchanged on disk."""
+        if not self.enabled:
+            return False
+
+        entry = self.entries.get(self._entry_name(output_path))
+        if entry is None or entry.get('key') != key:
+            return False
+
+        return file_digest(output_path) == entry.get('sha256')
+
+    def recorded_digest(self, output_path):
+        """The SHA-256 recorded for output_path, or None if it has no entry."""
+        entry = self.entries.get(self._entry_name(output_path))
+        return entry.get('sha256') if entry else None
+
+    def record(self, output_path, key, data):
+        """Record that output_path now holds data, rendered from key."""
+        if not self.enabled:
+            return
+
+        entry = {'key': key, 'sha256': bytes_digest(data)}
+        name = self._entry_name(output_path)
+        if self.entries.get(name) != entry:
+            self.entries[name] = entry
+            self._dirty = True
+
+    def set_encoder(self, fingerprint):
+        """Record the fingerprint of the encoder the outputs come from, or None."""
+        if not self.enabled:
+            return
+
+        if self.encoder != fingerprint:
+            self.encoder = fingerprint
+            self._dirty = True
+
+    def save(self):
+        """Write the manifest back to disk if any entry changed."""
+        if not self.enabled or not self._dirty:
+            return
+
+        manifest = {'version': MANIFEST_VERSION, 'entries': self.entries}
+        if self.encoder is not None:
+            manifest['encoder'] = self.encoder
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.write('\n')
+        self._dirty = False
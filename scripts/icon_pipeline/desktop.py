@@ -0,0 +1,193 @@
+"""
+Desktop and web icon targets: the Windows .ico, the macOS .icns and the web
+app icons with their manifest.json entries.
+
+ICO and ICNS are containers of PNG images, one per size, so they are
+assembled from the encoded PNG bytes a Renderer already holds: a size the
+mobile targets also use (the Android launcher and Play Store icons) is the
+very same RenderJob, resized and encoded once for every platform, and no
+container image is decoded again or re-encoded. The Retina ICNS types
+share the bytes of the same pixel size. A container is recorded in the
+cache manifest under a key combining the cache keys of its images, so an
+unchanged one is skipped without rendering anything.
+
+The web icons follow the Flutter web layout: favicon.png and
+icons/Icon-<N>.png, plus icons/Icon-maskable-<N>.png, whose artwork sits
+in the central MASKABLE_SAFE_ZONE of a square filled with the background
+color, since the browser or OS masks it to any shape. write_manifest()
+sets the "icons" list of manifest.json and keeps every other key.
+"""
+
+import json
+import os
+import struct
+
+from .cache import bytes_digest
+from .render import RenderJob
+from .sinks import FileSink
+
+
+# Bump whenever a change to this module alters the container bytes
+CONTAINER_VERSION = 1
+
+# Sizes in a Windows .ico, as Explorer and the taskbar pick them
+ICO_SIZES = (16, 24, 32, 48, 64, 128, 256)
+
+# macOS .icns element types holding PNG data and their pixel size (ic11-ic14 are @2x)
+ICNS_TYPES = (
+    ('icp4', 16),
+    ('icp5', 32),
+    ('icp6', 64),
+    ('ic07', 128),
+    ('ic08', 256),
+    ('ic09', 512),
+    ('ic10', 1024),
+    ('ic11', 32),
+    ('ic12', 64),
+    ('ic13', 256),
+    ('ic14', 512),
+)
+
+# Web icons relative to the web directory and their size
+WEB_ICON_SIZES = {
+    'favicon.png': 16,
+    'icons/Icon-192.png': 192,
+    'icons/Icon-512.png': 512,
+}
+WEB_MASKABLE_SIZES = {
+    'icons/Icon-maskable-192.png': 192,
+    'icons/Icon-maskable-512.png': 512,
+}
+
+# A maskable icon's safe zone is the centered circle 80% of its side across
+MASKABLE_SAFE_ZONE = 0.8
+
+
+def shared_jobs(jobs):
+    """{side: job} of the plain square jobs among jobs, for the targets to reuse."""
+    return {job.size[0]: job for job in jobs
+            if job.size[0] == job.size[1] and job.canvas_size is None and job.layer is None}
+
+
+def icon_job(size, shared=None):
+    """The job of a plain size x size icon: the shared one if there is one."""
+    return (shared or {}).get(size) or RenderJob((size, size))
+
+
+def web_targets(web_dir, background, shared=None):
+    """
+    (output_path, RenderJob) pairs of the web icons; the maskable icons are
+    filled with background (any Pillow color string).
+    """
+    targets = [(os.path.join(web_dir, *name.split('/')), icon_job(size, shared))
+               for name, size in WEB_ICON_SIZES.items()]
+    for name, size in WEB_MASKABLE_SIZES.items():
+        artwork = int(size * MASKABLE_SAFE_ZONE)
+        targets.append((os.path.join(web_dir, *name.split('/')),
+                        RenderJob((artwork, artwork), (size, size), layer='maskable', background=background)))
+    return targets
+
+
+def manifest_icons():
+    """The "icons" entries of manifest.json for the web icons."""
+    icons = [{'src': name, 'sizes': f'{size}x{size}', 'type': 'image/png'}
+             for name, size in WEB_ICON_SIZES.items() if name.startswith('icons/')]
+    icons += [{'src': name, 'sizes': f'{size}x{size}', 'type': 'image/png', 'purpose': 'maskable'}
+              for name, size in WEB_MASKABLE_SIZES.items()]
+    return icons
+
+
+def write_manifest(web_dir, sink=None):
+    """
+    Set the "icons" of web_dir/manifest.json (in sink, if given), keeping
+    the rest of an existing manifest. Returns True if the file changed.
+    Raises ValueError if the existing file is not a JSON object.
+    """
+    manifest_path = os.path.join(web_dir, 'manifest.json')
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    if not isinstance(manifest, dict):
+        raise ValueError(f"{manifest_path}: expected a JSON object")
+    manifest['icons'] = manifest_icons()
+    data = json.dumps(manifest, indent=4, ensure_ascii=False) + '\n'
+    return (sink or FileSink()).write(manifest_path, data.encode('utf-8'))
+
+
+def png_size(data):
+    """(width, height) of encoded PNG bytes, from their IHDR chunk."""
+    return struct.unpack('>II', data[16:24])
+
+
+def encode_ico(images):
+    """
+    A .ico file holding PNG images (encoded bytes), each stored as it is.
+    Windows Vista and later read PNG entries; 256 is written as 0.
+    """
+    header = struct.pack('<HHH', 0, 1, len(images))
+    entries = []
+    offset = len(header) + 16 * len(images)
+    for data in images:
+        width, height = png_size(data)
+        entries.append(struct.pack('<BBBBHHII', width % 256, height % 256, 0, 0, 1, 32, len(data), offset))
+        offset += len(data)
+    return b''.join([header] + entries + list(images))
+
+
+def encode_icns(elements):
+    """A .icns file of (type, PNG bytes) elements, each stored as it is."""
+    body = b''.join(struct.pack('>4sI', kind.encode('ascii'), len(data) + 8) + data for kind, data in elements)
+    return struct.pack('>4sI', b'icns', len(body) + 8) + body
+
+
+def ico_jobs(shared=None):
+    return [icon_job(size, shared) for size in ICO_SIZES]
+
+
+def icns_jobs(shared=None):
+    return [icon_job(size, shared) for _, size in ICNS_TYPES]
+
+
+def container_key(renderer, kind, jobs):
+    """Cache key of a container: its kind and the cache keys of its images."""
+    payload = [CONTAINER_VERSION, kind, [renderer.cache_key(job) for job in jobs]]
+    return bytes_digest(json.dumps(payload).encode())
+
+
+def write_container(renderer, output_path, kind, jobs, cache=None, sink=None):
+    """
+    Render jobs with renderer and write their ('ico' or 'icns') container to
+    output_path, or to sink. Jobs the renderer already encoded are reused
+    as they are. Returns True if the container was rendered, False if the
+    cache reports it fresh.
+    """
+    sink = sink or FileSink()
+    if not sink.in_place:
+        cache = None  # an archive needs every file, fresh or not
+    key = container_key(renderer, kind, jobs) if cache else None
+    if cache is not None and cache.is_fresh(output_path, key):
+        return False
+
+    images = renderer.render(jobs)
+    if kind == 'ico':
+        data = encode_ico(images)
+    elif kind == 'icns':
+        data = encode_icns([(element, image) for (element, _), image in zip(ICNS_TYPES, images)])
+    else:
+        raise ValueError(f"unknown container '{kind}' (choose from ico, icns)")
+    sink.write(output_path, data)
+    if cache is not None:
+        cache.record(output_path, key, data)
+    return True
+
+
+def write_ico(renderer, output_path, cache=None, sink=None, shared=None):
+    """Write the ICO_SIZES .ico to output_path (see write_container)."""
+    return write_container(renderer, output_path, 'ico', ico_jobs(shared), cache, sink)
+
+
+def write_icns(renderer, output_path, cache=None, sink=None, shared=None):
+    """Write the ICNS_TYPES .icns to output_path (see write_container)."""
+    return write_container(renderer, output_path, 'icns', icns_jobs(shared), cache, sink)
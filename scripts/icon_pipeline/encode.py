@@ -0,0 +1,332 @@
+"""
+Lossless PNG encoding strategies for icon targets.
+
+Strategies, from cheapest to most thorough (STRATEGIES):
+
+- 'fast': Pillow at zlib level 1, for quick local iterations.
+- 'max': Pillow with optimize=True, the historical output of the generators.
+- 'palette': like 'max', but icons with at most 256 distinct RGBA colors are
+  first converted to an exact palette image (with tRNS for translucent
+  entries). The pixels decode to exactly the same values.
+- 'exhaustive': 'palette' plus a search over PNG row filters (each fixed
+  filter and a per-row adaptive choice) and zlib strategies at level 9,
+  keeping the smallest result. Needs NumPy; without it this is 'palette'.
+
+encode() takes an optional byte budget. When the chosen strategy's output
+is over budget, the more thorough strategies are tried in order and the
+first one that fits is used, so the expensive search only runs for targets
+that need it. If nothing fits, the smallest result is returned and callers
+report it as over budget.
+
+DETERMINISTIC is an encoder of its own, outside that escalation, for output
+that must be byte-identical on every machine (remote build caches hash the
+icons). Pillow's encoder is not: its zlib (or zlib-ng) build and its
+heuristics vary between releases, and it writes ancillary chunks. The
+deterministic encoder instead:
+
+- normalizes the image to 8-bit RGBA, or RGB when every pixel is opaque,
+  and zeroes the color of fully transparent pixels, which never shows but
+  varies with the resize path,
+- filters every row with the Up filter, computed by Pillow as an exact
+  modulo subtraction of the image shifted down by one row,
+- compresses with Python's zlib at pinned settings (DETERMINISTIC_ZLIB),
+- writes only the IHDR, IDAT and IEND chunks.
+
+encoder_fingerprint() describes everything its bytes depend on; the
+generators record it in the cache manifest and in the icons' cache keys.
+It ignores byte budgets.
+"""
+
+import io
+import struct
+import time
+import functools
+import zlib
+from collections import namedtuple
+
+from . import trace
+
+
+STRATEGIES = ('fast', 'max', 'palette', 'exhaustive')
+DEFAULT_STRATEGY = 'max'
+
+# The reproducible encoder, usable wherever a strategy is
+DETERMINISTIC = 'deterministic'
+
+# Bump whenever a change to the deterministic encoder alters its output
+DETERMINISTIC_VERSION = 1
+
+# zlib.compressobj() arguments of the deterministic encoder: level 9, a 32 KB
+# window, memLevel 9 and the default strategy
+DETERMINISTIC_ZLIB = (9, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY)
+
+# PNG row filter type of the deterministic encoder
+_FILTER_UP = 2
+
+EncodedPNG = namedtuple('EncodedPNG', ['data', 'strategy', 'seconds'])
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# (color type, channels) of the modes the filter search writes itself
+_COLOR_TYPES = {'L': (0, 1), 'RGB': (2, 3), 'P': (3, 1), 'LA': (4, 2), 'RGBA': (6, 4)}
+
+_ZLIB_STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE)
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """NumPy, imported on first use, or None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:  # palette reduction and the filter search need NumPy
+        return None
+    return numpy
+
+
+def _pillow_png(image, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', **params)
+    return buffer.getvalue()
+
+
+def palette_reduce(image):
+    """
+    Return an exact palette version of an image with at most 256 colors,
+    or None if it has more (or is already a palette image, or NumPy is
+    missing). Translucent entries come first so the tRNS chunk stays short.
+    """
+    from PIL import Image
+
+    np = _numpy()
+    if np is None or image.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+        return None
+    if image.getcolors(256) is None:
+        return None
+
+    rgba = np.asarray(image.convert('RGBA')).reshape(-1, 4).astype(np.uint32)
+    packed = rgba[:, 0] << 24 | rgba[:, 1] << 16 | rgba[:, 2] << 8 | rgba[:, 3]
+    colors, indices = np.unique(packed, return_inverse=True)
+    entries = np.stack([colors >> 24, colors >> 16, colors >> 8, colors], axis=1).astype(np.uint8)
+
+    # Translucent entries first, ordered by their packed value for determinism
+    order = np.lexsort((colors, entries[:, 3] == 255))
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    entries = entries[order]
+
+    reduced = Image.frombytes('P', image.size, remap[indices].astype(np.uint8).tobytes())
+    reduced.putpalette(entries[:, :3].tobytes())
+    alpha = entries[:, 3]
+    translucent = int(np.count_nonzero(alpha < 255))
+    if translucent:
+        reduced.info['transparency'] = alpha[:translucent].tobytes()
+    return reduced
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def _palette_alpha(image, colors):
+    """
+    tRNS data of a P image with colors entries: the alpha of an RGBA
+    palette, overridden by a transparency index or bytes, without the
+    trailing opaque entries.
+    """
+    alpha = bytearray(image.getpalette('RGBA')[3:colors * 4:4])
+    transparency = image.info.get('transparency')
+    if isinstance(transparency, int):
+        if transparency < colors:
+            alpha[transparency] = 0
+    elif transparency is not None:
+        transparency = transparency[:colors]
+        alpha[:len(transparency)] = transparency
+    return bytes(alpha).rstrip(b'\xff')
+
+
+def _filter_candidates(rows, bpp):
+    """Yield filtered scanline blocks (filter byte + row) for each filter choice."""
+    np = _numpy()
+    x = rows.astype(np.int16)
+    left = np.zeros_like(x)
+    left[:, bpp:] = x[:, :-bpp]
+    up = np.zeros_like(x)
+    up[1:] = x[:-1]
+    up_left = np.zeros_like(x)
+    up_left[1:, bpp:] = x[:-1, :-bpp]
+
+    # Paeth predictor
+    p = left + up - up_left
+    pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - up_left)
+    paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+
+    filtered = np.stack([x, x - left, x - up, x - (left + up) // 2, x - paeth]).astype(np.uint8)
+
+    for filter_type in range(5):
+        yield np.insert(filtered[filter_type], 0, filter_type, axis=1)
+
+    # Adaptive: per row, the filter with the smallest sum of absolute signed bytes
+    scores = np.abs(filtered.view(np.int8).astype(np.int32)).sum(axis=2)
+    best = scores.argmin(axis=0)
+    chosen = filtered[best, np.arange(rows.shape[0])]
+    yield np.insert(chosen, 0, best.astype(np.uint8), axis=1)
+
+
+def _search_png(image):
+    """Smallest PNG over every row filter and zlib strategy, or None if unsupported."""
+    np = _numpy()
+    if np is None or image.mode not in _COLOR_TYPES:
+        return None
+    if image.mode != 'P' and image.info.get('transparency') is not None:
+        return None  # single-color tRNS is left to Pillow
+
+    color_type, channels = _COLOR_TYPES[image.mode]
+    bit_depth, rawmode = 8, image.mode
+    if image.mode == 'P':
+        colors = len(image.getpalette()) // 3
+        for bits in (1, 2, 4):
+            if colors <= 1 << bits:
+                bit_depth, rawmode = bits, f'P;{bits}'
+                break
+
+    width, height = image.size
+    row_bytes = -(-width * channels * bit_depth // 8)
+    rows = np.frombuffer(image.tobytes('raw', rawmode), np.uint8).reshape(height, row_bytes)
+    bpp = max(1, channels * bit_depth // 8)
+
+    best = None
+    for block in _filter_candidates(rows, bpp):
+        data = block.tobytes()
+        for strategy in _ZLIB_STRATEGIES:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy)
+            compressed = compressor.compress(data) + compressor.flush()
+            if best is None or len(compressed) < len(best):
+                best = compressed
+
+    header = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+    chunks = [_chunk(b'IHDR', header)]
+    if image.mode == 'P':
+        chunks.append(_chunk(b'PLTE', bytes(image.getpalette()[:colors * 3])))
+        alpha = _palette_alpha(image, colors)
+        if alpha:
+            chunks.append(_chunk(b'tRNS', alpha))
+    chunks += [_chunk(b'IDAT', best), _chunk(b'IEND', b'')]
+    return _PNG_SIGNATURE + b''.join(chunks)
+
+
+def normalize(image):
+    """
+    The image as 8-bit RGB if it is fully opaque, else as 8-bit RGBA with
+    the color of every fully transparent pixel set to zero.
+    """
+    from PIL import Image
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    alpha = image.getchannel('A')
+    lowest = alpha.getextrema()[0]
+    if lowest == 255:
+        return image.convert('RGB')
+    if lowest == 0:
+        visible = alpha.point(lambda value: 255 if value else 0)
+        image = Image.composite(image, Image.new('RGBA', image.size, 0), visible)
+    return image
+
+
+def encode_deterministic(image):
+    """Encode an image as PNG bytes that depend only on its pixels (see DETERMINISTIC)."""
+    from PIL import Image, ImageChops
+
+    image = normalize(image)
+    width, height = image.size
+    above = Image.new(image.mode, image.size, 0)
+    above.paste(image.crop((0, 0, width, height - 1)), (0, 1))
+    filtered = ImageChops.subtract_modulo(image, above).tobytes()
+
+    row_bytes = width * len(image.getbands())
+    filter_byte = bytes([_FILTER_UP])
+    compressor = zlib.compressobj(*DETERMINISTIC_ZLIB)
+    compressed = [compressor.compress(filter_byte + filtered[start:start + row_bytes])
+                  for start in range(0, len(filtered), row_bytes)]
+    compressed.append(compressor.flush())
+
+    color_type = _COLOR_TYPES[image.mode][0]
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    return _PNG_SIGNATURE + _chunk(b'IHDR', header) + _chunk(b'IDAT', b''.join(compressed)) + _chunk(b'IEND', b'')
+
+
+def encoder_fingerprint(strategy=DETERMINISTIC):
+    """
+    Everything a strategy's encoded bytes depend on besides the pixels, as
+    a dict: for DETERMINISTIC the encoder version, row filter, zlib
+    settings and zlib version; for the others the Pillow and zlib versions.
+    """
+    if strategy != DETERMINISTIC:
+        from PIL import __version__, features
+
+        return {'encoder': 'pillow', 'strategy': strategy, 'pillow': __version__,
+                'zlib': features.version('zlib')}
+    level, _, window_bits, mem_level, zlib_strategy = DETERMINISTIC_ZLIB
+    return {
+        'encoder': DETERMINISTIC,
+        'version': DETERMINISTIC_VERSION,
+        'filter': 'up',
+        'chunks': ['IHDR', 'IDAT', 'IEND'],
+        'zlib': zlib.ZLIB_RUNTIME_VERSION,
+        'zlib_level': level,
+        'zlib_window_bits': window_bits,
+        'zlib_mem_level': mem_level,
+        'zlib_strategy': zlib_strategy,
+    }
+
+
+def encode_png(image, strategy=DEFAULT_STRATEGY):
+    """Encode an image as PNG bytes with one strategy."""
+    if strategy == 'fast':
+        return _pillow_png(image, compress_level=1)
+    if strategy == 'max':
+        return _pillow_png(image, optimize=True)
+    if strategy == DETERMINISTIC:
+        return encode_deterministic(image)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown PNG strategy '{strategy}' (choose from {', '.join(STRATEGIES)})")
+
+    candidates = [_pillow_png(image, optimize=True)]
+    reduced = palette_reduce(image)
+    if reduced is not None:
+        candidates.append(_pillow_png(reduced, optimize=True))
+    if strategy == 'exhaustive':
+        for source in (image, reduced):
+            if source is not None:
+                candidates.append(_search_png(source))
+    return min((data for data in candidates if data), key=len)
+
+
+def encode(image, strategy=DEFAULT_STRATEGY, budget=None):
+    """
+    Encode an image, escalating to more thorough strategies while the
+    result is larger than budget bytes. Returns an EncodedPNG with the
+    smallest result found and the total encode time. DETERMINISTIC never
+    escalates.
+    """
+    start = time.perf_counter()
+    best = None
+    candidates = [DETERMINISTIC] if strategy == DETERMINISTIC else STRATEGIES[STRATEGIES.index(strategy):]
+    with trace.span('encode', size='{}x{}'.format(*image.size),
+                    bytes_in=image.size[0] * image.size[1] * len(image.getbands())) as span:
+        for candidate in candidates:
+            data = encode_png(image, candidate)
+            if best is None or len(data) < len(best[0]):
+                best = (data, candidate)
+            if budget is None or len(data) <= budget:
+                break
+        span.set(bytes_out=len(best[0]), strategy=best[1])
+    return EncodedPNG(best[0], best[1], time.perf_counter() - start)
+
+
+def describe(encoded, budget=None):
+    """One-line size/strategy/time summary of an EncodedPNG."""
+    text = f"{len(encoded.data) / 1024:.1f} KB, {encoded.strategy}, {encoded.seconds * 1000:.0f} ms"
+    if budget is not None and len(encoded.data) > budget:
+        text += f", over {budget / 1024:.0f} KB budget"
+    return text
@@ -0,0 +1,161 @@
+"""
+Declarative build graph of icon outputs.
+
+Every output file is a Node with a unique name (its path relative to the
+output root), a set of tags used for selection (platform, density, idiom,
+pixel size, ...) and the names of the nodes it depends on. A node either
+renders an image (target is a (renderer, output_path, RenderJob) triple) or
+runs an action (a zero-argument callable returning True if it wrote
+something).
+
+build() runs the requested nodes and their dependencies in dependency
+order. Each wave of ready nodes runs together: image nodes are batched per
+Renderer into one render_targets() call, so they share its worker pool and
+its intermediates (the decoded master, pyramid levels and already encoded
+jobs), and action nodes run concurrently on a thread pool.
+
+Selectors pick nodes by name or tags: 'xxhdpi' selects every node tagged
+xxhdpi, 'ios:ipad' every node tagged both ios and ipad, and a node name
+(or fnmatch pattern such as 'mipmap-*/ic_launcher.png') selects by name.
+
+print_targets() lists nodes and metadata_nodes() keeps only the actions
+(XML, Contents.json), so both can run without Pillow.
+"""
+
+import fnmatch
+from collections import namedtuple
+
+
+Node = namedtuple('Node', ['name', 'tags', 'deps', 'target', 'action'])
+Node.__new__.__defaults__ = ((), None, None)
+
+
+def image_node(name, tags, renderer, output_path, job, deps=()):
+    """Node that renders job with renderer and writes it to output_path."""
+    return Node(name, frozenset(tags), tuple(deps), target=(renderer, output_path, job))
+
+
+def action_node(name, tags, action, deps=()):
+    """Node that runs action(), which returns True if it wrote something."""
+    return Node(name, frozenset(tags), tuple(deps), action=action)
+
+
+def _matches(node, selector):
+    if fnmatch.fnmatchcase(node.name, selector):
+        return True
+    return all(part in node.tags for part in selector.split(':'))
+
+
+def select(nodes, selectors):
+    """
+    Names of the nodes matching any selector, plus all their dependencies.
+
+    No selectors selects every node. Raises ValueError for a selector that
+    matches nothing.
+    """
+    by_name = {node.name: node for node in nodes}
+    if not selectors:
+        return set(by_name)
+
+    selected = set()
+    for selector in selectors:
+        matched = [node.name for node in nodes if _matches(node, selector)]
+        if not matched:
+            tags = sorted(set().union(*(node.tags for node in nodes)))
+            raise ValueError(f"'{selector}' matches no target (tags: {', '.join(tags)})")
+        selected.update(matched)
+
+    pending = list(selected)
+    while pending:
+        for dep in by_name[pending.pop()].deps:
+            if dep not in selected:
+                selected.add(dep)
+                pending.append(dep)
+    return selected
+
+
+def metadata_nodes(nodes):
+    """
+    The action nodes alone, for metadata-only builds: their dependencies on
+    image nodes are dropped, so building them needs no pixels.
+    """
+    actions = {node.name for node in nodes if node.action is not None}
+    return [node._replace(deps=tuple(dep for dep in node.deps if dep in actions))
+            for node in nodes if node.name in actions]
+
+
+def print_targets(nodes, names=None):
+    """Print the name, pixel size and tags of each node (or each named node)."""
+    for node in nodes:
+        if names is not None and node.name not in names:
+            continue
+        size = '-'
+        if node.target is not None:
+            job = node.target[2]
+            size = '{}x{}'.format(*(job.canvas_size or job.size))
+        print(f"{node.name:48s} {size:>9s}  {', '.join(sorted(node.tags))}")
+
+
+def plan_waves(nodes, names):
+    """Split the named nodes into waves whose dependencies are all in earlier waves."""
+    by_name = {node.name: node for node in nodes}
+    missing = {dep for name in names for dep in by_name[name].deps if dep not in by_name}
+    if missing:
+        raise ValueError(f"unknown dependencies: {', '.join(sorted(missing))}")
+
+    done = set()
+    remaining = [node for node in nodes if node.name in names]
+    waves = []
+    while remaining:
+        wave = [node for node in remaining if all(dep in done for dep in node.deps)]
+        if not wave:
+            raise ValueError(f"dependency cycle among: {', '.join(node.name for node in remaining)}")
+        waves.append(wave)
+        done.update(node.name for node in wave)
+        remaining = [node for node in remaining if node.name not in done]
+    return waves
+
+
+def build(nodes, selectors=None, cache=None, threads=4, fsync=False, sink=None):
+    """
+    Build the selected nodes and their dependencies. Image files are
+    written in atomic batches, fsynced first if fsync is set, or to sink
+    (see sinks.py); actions write through the sink they were given.
+
+    Returns {name: result} in node declaration order, where result is True
+    if the node rendered or wrote its output.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from . import trace
+    from .render import render_targets
+
+    def run_action(node):
+        with trace.span('action', 'graph', target=node.name):
+            return node.action()
+
+    names = select(nodes, selectors)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for wave in plan_waves(nodes, names):
+            actions = [node for node in wave if node.action is not None]
+            running = [executor.submit(run_action, node) for node in actions]
+
+            # Image nodes sharing a renderer are rendered as one batch
+            batches = {}
+            for node in wave:
+                if node.target is not None:
+                    batches.setdefault(id(node.target[0]), []).append(node)
+            for batch in batches.values():
+                renderer = batch[0].target[0]
+                targets = [(node.target[1], node.target[2]) for node in batch]
+                with trace.span('render-batch', 'graph', targets=len(batch)):
+                    rendered = render_targets(renderer, targets, cache, fsync, sink)
+                for node, was_rendered in zip(batch, rendered):
+                    results[node.name] = was_rendered
+
+            for node, future in zip(actions, running):
+                results[node.name] = bool(future.result())
+
+    return {node.name: results[node.name] for node in nodes if node.name in results}
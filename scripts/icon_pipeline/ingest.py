@@ -0,0 +1,249 @@
+"""
+Memory-bounded ingest of very large source artwork.
+
+Decoding a 16K x 16K PNG with Image.open().load() holds the full RGBA frame
+(1 GB) in memory, and cropping or converting it makes further copies.
+ingest() brings such sources down to a working resolution without ever
+holding the full frame:
+
+- JPEG sources are decoded at a reduced DCT scale with Image.draft().
+- Non-interlaced 8-bit PNGs are streamed: the IDAT data is inflated a few
+  rows at a time, each strip of rows is unfiltered by Pillow's own PNG
+  decoder (seeded with the last row of the previous strip, which the
+  Up/Average/Paeth filters refer to) and box-reduced with Image.reduce()
+  into the working image.
+- Anything else is decoded in full, but only if the estimated decode size
+  fits the memory budget; otherwise ValueError is raised instead of letting
+  the process be OOM-killed.
+
+Sources whose full decode fits the budget are decoded normally, so the
+budget only changes the output for sources that really are too large.
+peak_rss() reports the actual peak resident set size of the process.
+"""
+
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+from . import trace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Bytes per pixel Pillow uses for a decoded image of each mode
+_PIXEL_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 4, 'RGB': 4, 'RGBA': 4, 'I;16': 2}
+
+# PNG color types whose 8-bit rows Pillow can pack back to raw bytes
+_STREAMABLE_COLOR_TYPES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+
+# Copies of the decoded frame a budget must hold: the frame itself plus the
+# crop, convert and resize copies made while preparing the master
+_FRAME_COPIES = 4
+
+# Target size of one decoded strip of source rows
+_STRIP_BYTES = 8 * 1024 * 1024
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+IngestResult = namedtuple('IngestResult', ['image', 'method', 'factor'])
+
+
+def peak_rss(children=False):
+    """
+    Peak resident set size in bytes of this process (or of its finished
+    worker processes with children=True), or None where unsupported.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def decode_estimate(image):
+    """Bytes needed to hold the decoded frame of an opened, unloaded image."""
+    width, height = image.size
+    return width * height * _PIXEL_BYTES.get(image.mode, 4)
+
+
+def reduction_factor(size, working_size):
+    """Largest integer factor that keeps the shorter side >= working_size."""
+    return max(1, min(size) // working_size)
+
+
+def _png_header(path):
+    """Return (width, height, bit_depth, color_type, interlace) of a PNG."""
+    with open(path, 'rb') as f:
+        if f.read(8) != _PNG_SIGNATURE:
+            return None
+        length, chunk_type = struct.unpack('>I4s', f.read(8))
+        if chunk_type != b'IHDR':
+            return None
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', f.read(13))
+    return width, height, bit_depth, color_type, interlace
+
+
+def _idat_chunks(path, block_size=1 << 16):
+    """Yield the compressed image data of a PNG in blocks of at most block_size."""
+    with open(path, 'rb') as f:
+        f.seek(8)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'IDAT':
+                remaining = length
+                while remaining:
+                    block = f.read(min(block_size, remaining))
+                    if not block:
+                        raise ValueError(f"{path}: truncated IDAT chunk")
+                    remaining -= len(block)
+                    yield block
+                f.seek(4, 1)  # CRC
+            elif chunk_type == b'IEND':
+                return
+            else:
+                f.seek(length + 4, 1)
+
+
+def _filtered_rows(path, row_bytes):
+    """Yield the filtered scanlines (filter byte + row_bytes) of a PNG."""
+    inflater = zlib.decompressobj()
+    line = row_bytes + 1
+    pending = b''
+    for block in _idat_chunks(path):
+        pending += inflater.decompress(block)
+        rows = len(pending) // line
+        for i in range(rows):
+            yield pending[i * line:(i + 1) * line]
+        pending = pending[rows * line:]
+    pending += inflater.flush()
+    for i in range(len(pending) // line):
+        yield pending[i * line:(i + 1) * line]
+
+
+def _can_stream(path, image):
+    header = _png_header(path) if image.format == 'PNG' else None
+    if header is None:
+        return False
+    _, _, bit_depth, color_type, interlace = header
+    return bit_depth == 8 and not interlace and _STREAMABLE_COLOR_TYPES.get(color_type) == image.mode
+
+
+def _decode_strip(image, rows, previous, out_mode, factor):
+    """
+    Unfilter a strip of PNG scanlines and box-reduce it by factor.
+
+    Returns the reduced strip and the last unfiltered row, which the next
+    strip's filters refer to.
+    """
+    from PIL import Image
+
+    width = image.size[0]
+    mode = image.mode
+
+    # The decoder treats the first row as having an all-zero prior row, so
+    # prepend the previous strip's last row, stored unfiltered (filter 0)
+    seed = [b'\x00' + previous] if previous is not None else []
+    strip = Image.new(mode, (width, len(seed) + len(rows)))
+    decoder = Image._getdecoder(mode, 'zip', mode)
+    decoder.setimage(strip.im, (0, 0) + strip.size)
+    decoder.decode(zlib.compress(b''.join(seed + rows), 0))
+    decoder.cleanup()
+
+    last = strip.crop((0, strip.height - 1, width, strip.height)).tobytes('raw', mode)
+    strip = strip.crop((0, len(seed), width, strip.height))
+    if mode == 'P':
+        strip.putpalette(image.getpalette())
+    if 'transparency' in image.info:
+        strip.info['transparency'] = image.info['transparency']
+    if strip.mode != out_mode:
+        strip = strip.convert(out_mode)
+    return strip.reduce(factor), last
+
+
+def _stream_png(path, image, factor):
+    """Box-reduce a non-interlaced 8-bit PNG by factor, one strip at a time."""
+    from PIL import Image
+
+    width, height = image.size
+    row_bytes = width * len(image.getbands())
+    has_alpha = 'A' in image.mode or 'transparency' in image.info
+    out_mode = 'RGBA' if has_alpha else 'RGB'
+
+    # A whole number of output rows per strip, about _STRIP_BYTES of source
+    strip_rows = max(1, _STRIP_BYTES // (width * 4 * factor)) * factor
+    output = Image.new(out_mode, (-(-width // factor), -(-height // factor)))
+
+    previous = None
+    rows = []
+    top = 0
+    for row in _filtered_rows(path, row_bytes):
+        rows.append(row)
+        if len(rows) == strip_rows:
+            reduced, previous = _decode_strip(image, rows, previous, out_mode, factor)
+            output.paste(reduced, (0, top // factor))
+            top += len(rows)
+            rows = []
+    if rows:
+        reduced, previous = _decode_strip(image, rows, previous, out_mode, factor)
+        output.paste(reduced, (0, top // factor))
+        top += len(rows)
+
+    if top != height:
+        raise ValueError(f"{path}: image data ends after {top} of {height} rows")
+    return output
+
+
+def ingest(path, working_size, budget=None):
+    """
+    Decode the image at path at no less than working_size pixels per side.
+
+    budget is the peak memory in bytes allowed for decoding and preparing
+    the master; a quarter of it goes to the decoded frame, the rest to the
+    copies made while cropping and converting it. Sources that fit are
+    decoded in full and unchanged (factor 1); larger ones are
+    reduced by an integer factor through JPEG draft decoding or PNG strip
+    streaming. Returns an IngestResult with the loaded image, a short
+    description of the method used and the reduction factor.
+    """
+    with trace.span('decode', path=os.path.basename(path), bytes_in=os.path.getsize(path)) as span:
+        result = _ingest(path, working_size, budget)
+        span.set(method=result.method, size='{}x{}'.format(*result.image.size))
+    return result
+
+
+def _ingest(path, working_size, budget):
+    from PIL import Image
+
+    image = Image.open(path)
+    estimate = decode_estimate(image)
+    frame_budget = budget // _FRAME_COPIES if budget is not None else None
+    if budget is None or estimate <= frame_budget:
+        image.load()
+        return IngestResult(image, 'full decode', 1)
+
+    width, height = image.size
+    factor = reduction_factor(image.size, working_size)
+
+    if image.format == 'JPEG':
+        image.draft(image.mode, (working_size, working_size))
+        if decode_estimate(image) <= frame_budget:
+            scale = width // image.size[0]
+            image.load()
+            return IngestResult(image, f'JPEG draft 1/{scale}', scale)
+    elif factor > 1 and _can_stream(path, image) and estimate // factor ** 2 <= frame_budget:
+        return IngestResult(_stream_png(path, image, factor), f'PNG strips 1/{factor}', factor)
+
+    hint = '' if image.format == 'JPEG' else ' (only JPEGs and non-interlaced 8-bit PNGs are decoded reduced)'
+    raise ValueError(f"{path}: decoding {width}x{height} needs about "
+                     f"{estimate * _FRAME_COPIES / 2**20:.0f} MB, over the "
+                     f"{budget / 2**20:.0f} MB memory budget{hint}")
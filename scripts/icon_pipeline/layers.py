@@ -0,0 +1,133 @@
+"""
+Compose the layered Android icons from already resized masters.
+
+An adaptive icon is a 108dp canvas whose inner 72dp viewport is shown
+through the launcher's mask, with the artwork kept inside the 66dp safe
+zone. From one resized foreground image this module builds:
+
+- the foreground layer: the image centered on a transparent canvas,
+- the monochrome (themed icon) layer: a white silhouette with the
+  foreground's alpha, which the launcher tints,
+- the legacy round icon for launchers before Android 8.0: the viewport of
+  the foreground over the background color, masked to a circle,
+- the maskable web icon: the foreground over the background color, filling
+  the whole square for the browser or OS to mask (see desktop.py).
+
+Every step is a whole-image Pillow operation (copy, merge, alpha_composite,
+multiply) rather than a masked paste per image; a masked paste onto a
+transparent canvas multiplies the alpha by itself and darkens
+semi-transparent edges. The circle masks and solid color layers depend only
+on the size, so they are drawn once per size and cached.
+"""
+
+import functools
+
+
+# The adaptive icon canvas, its visible viewport and the safe zone, in dp
+ADAPTIVE_CANVAS_DP = 108
+ADAPTIVE_VIEWPORT_DP = 72
+
+# The safe zone is 66dp out of 108dp (61%)
+ADAPTIVE_SAFE_ZONE = 0.61
+
+# Masks are drawn this many times larger and reduced, for anti-aliased edges
+MASK_SUPERSAMPLING = 4
+
+# RenderJob.layer values; None is a plain resize or a foreground layer
+LAYERS = ('monochrome', 'round', 'maskable')
+
+
+def safe_zone_size(canvas_size):
+    """Side of the artwork on an adaptive icon canvas of canvas_size pixels."""
+    return int(canvas_size * ADAPTIVE_SAFE_ZONE)
+
+
+def legacy_foreground_size(icon_size):
+    """
+    Side of the artwork on a legacy icon of icon_size pixels, which shows
+    the viewport of an adaptive canvas 108/72 times larger.
+    """
+    return safe_zone_size(icon_size * ADAPTIVE_CANVAS_DP // ADAPTIVE_VIEWPORT_DP)
+
+
+@functools.lru_cache(maxsize=None)
+def _inset(size, canvas_size):
+    """Top-left corner that centers an image of size on canvas_size."""
+    return ((canvas_size[0] - size[0]) // 2, (canvas_size[1] - size[1]) // 2)
+
+
+@functools.lru_cache(maxsize=32)
+def circle_mask(size):
+    """Anti-aliased 'L' mask of the circle inscribed in size."""
+    from PIL import Image, ImageDraw
+
+    large = (size[0] * MASK_SUPERSAMPLING, size[1] * MASK_SUPERSAMPLING)
+    mask = Image.new('L', large, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, large[0] - 1, large[1] - 1), fill=255)
+    # BOX averages each block, so edge pixels get their covered fraction
+    return mask.resize(size, Image.BOX)
+
+
+@functools.lru_cache(maxsize=32)
+def _solid(mode, size, color):
+    """A cached single-color image; callers must not modify it."""
+    from PIL import Image
+
+    return Image.new(mode, size, color)
+
+
+def center_on_canvas(resized, canvas_size):
+    """The resized image centered on a transparent RGBA canvas."""
+    from PIL import Image
+
+    if resized.mode != 'RGBA':
+        resized = resized.convert('RGBA')
+    canvas = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
+    # Without a mask paste copies the pixels, alpha included
+    canvas.paste(resized, _inset(resized.size, canvas_size))
+    return canvas
+
+
+def monochrome(foreground):
+    """White silhouette of an RGBA foreground layer, keeping its alpha."""
+    from PIL import Image
+
+    white = _solid('L', foreground.size, 255)
+    return Image.merge('RGBA', (white, white, white, foreground.getchannel('A')))
+
+
+def maskable(foreground, background):
+    """The RGBA foreground over a solid background color, unmasked."""
+    from PIL import Image, ImageColor
+
+    color = ImageColor.getrgb(background)[:3] + (255,)
+    return Image.alpha_composite(_solid('RGBA', foreground.size, color), foreground)
+
+
+def legacy_round(foreground, background):
+    """
+    The RGBA foreground over a solid background color (any Pillow color
+    string, such as '#2196F3'), masked to a circle.
+    """
+    from PIL import ImageChops
+
+    icon = maskable(foreground, background)
+    icon.putalpha(ImageChops.multiply(icon.getchannel('A'), circle_mask(foreground.size)))
+    return icon
+
+
+def compose(resized, job):
+    """Build the layer a RenderJob asks for from its resized image."""
+    if job.layer is not None and job.layer not in LAYERS:
+        raise ValueError(f"unknown layer '{job.layer}' (choose from {', '.join(LAYERS)})")
+    if job.canvas_size is None and job.layer is None:
+        return resized
+
+    layer = center_on_canvas(resized, job.canvas_size or resized.size)
+    if job.layer == 'monochrome':
+        return monochrome(layer)
+    if job.layer == 'round':
+        return legacy_round(layer, job.background)
+    if job.layer == 'maskable':
+        return maskable(layer, job.background)
+    return layer
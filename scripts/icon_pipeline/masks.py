@@ -0,0 +1,339 @@
+"""
+Launcher mask previews and safe-zone checks.
+
+The generators never see the mask a launcher applies: Android launchers cut
+the adaptive icon's 72dp viewport to a circle, squircle, rounded square or
+teardrop, and iOS cuts every icon to its superellipse. This module describes
+each mask as a signed distance function and rasterizes it analytically at any
+size, with the coverage of each pixel taken from the distance at its center
+(as in sdf.py), so the edges are anti-aliased without supersampling.
+
+Each mask also has a safe area that artwork should stay inside: the 66dp
+circle Android guarantees on every mask, and the superellipse shrunk by
+IOS_SAFE_SCALE on iOS. mask_report() measures, at every target size, how
+much of the master's artwork (its alpha, or on opaque masters the pixels
+that differ from the corner background color) a mask clips and how much
+falls outside its safe area. contact_sheet() renders the master under every
+mask, with the clipped artwork ghosted in red and the safe area outlined.
+
+Rasterized masks are kept in memory and, with a cache_dir, on disk as .npy
+files, so a MaskLibrary shared by all sizes and variants makes a full
+report a matter of a few array products.
+
+Requires NumPy: pip install numpy
+"""
+
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from . import trace
+from .layers import ADAPTIVE_CANVAS_DP, ADAPTIVE_SAFE_ZONE, ADAPTIVE_VIEWPORT_DP, legacy_foreground_size
+from .svg import as_image
+
+
+# Bump whenever a change to this module alters the rasterized masks
+MASK_VERSION = 1
+
+# Directory of the on-disk mask cache, next to the cache manifest
+MASK_CACHE_NAME = '.icon_masks'
+
+# Android's guaranteed safe zone: a 66dp circle in the 72dp viewport
+ANDROID_SAFE_SCALE = ADAPTIVE_CANVAS_DP * ADAPTIVE_SAFE_ZONE / ADAPTIVE_VIEWPORT_DP
+
+# iOS artwork is kept clear of the outer 10% of the superellipse
+IOS_SAFE_SCALE = 0.9
+
+# Fraction of the artwork allowed outside a safe area before the check fails
+SAFE_TOLERANCE = 0.005
+
+# Channel difference from the corner color that counts as artwork on opaque masters
+ARTWORK_THRESHOLD = 8
+
+# Resizes for the checks box-reduce by an integer factor down to this gap first
+REDUCING_GAP = 2.0
+
+# Side of each icon on a contact sheet
+PREVIEW_SIZE = 192
+
+# distance(x, y) is negative inside, in units of half the icon side, with
+# x and y from -1 to 1 and y pointing down
+Mask = namedtuple('Mask', ['name', 'platform', 'distance', 'safe_distance'])
+
+MaskCheck = namedtuple('MaskCheck', ['platform', 'mask', 'size', 'clipped', 'unsafe'])
+
+
+def circle(x, y):
+    return np.hypot(x, y) - 1.0
+
+
+def superellipse(n):
+    """Distance function of |x|^n + |y|^n = 1, to first order."""
+    def distance(x, y):
+        ax, ay = np.abs(x), np.abs(y)
+        norm = (ax ** n + ay ** n) ** (1.0 / n)
+        # |grad norm| = norm^(1-n) * |(x^(n-1), y^(n-1))|; 0 only at the center
+        gradient = np.hypot(ax ** (n - 1), ay ** (n - 1)) * np.maximum(norm, 1e-6) ** (1.0 - n)
+        return (norm - 1.0) / np.maximum(gradient, 1e-6)
+    return distance
+
+
+def _box(x, y, center, half, radius=0.0):
+    qx = np.abs(x - center[0]) - (half - radius)
+    qy = np.abs(y - center[1]) - (half - radius)
+    return np.hypot(np.maximum(qx, 0), np.maximum(qy, 0)) + np.minimum(np.maximum(qx, qy), 0) - radius
+
+
+def rounded_square(radius):
+    def distance(x, y):
+        return _box(x, y, (0.0, 0.0), 1.0, radius)
+    return distance
+
+
+def teardrop(x, y):
+    """The circle with a square top-right corner."""
+    return np.minimum(circle(x, y), _box(x, y, (0.5, -0.5), 0.5))
+
+
+def scaled(distance, scale):
+    """distance shrunk about the center by scale."""
+    return lambda x, y: distance(x / scale, y / scale) * scale
+
+
+# Shapes as in AOSP's config_icon_mask choices and iOS's continuous corners
+PLATFORM_MASKS = {
+    'android': (
+        Mask('circle', 'android', circle, scaled(circle, ANDROID_SAFE_SCALE)),
+        Mask('squircle', 'android', superellipse(3), scaled(circle, ANDROID_SAFE_SCALE)),
+        Mask('rounded-square', 'android', rounded_square(0.6), scaled(circle, ANDROID_SAFE_SCALE)),
+        Mask('teardrop', 'android', teardrop, scaled(circle, ANDROID_SAFE_SCALE)),
+    ),
+    'ios': (
+        Mask('superellipse', 'ios', superellipse(5), scaled(superellipse(5), IOS_SAFE_SCALE)),
+    ),
+}
+
+
+def rasterize(distance, size):
+    """(height, width) float32 coverage of a distance function at size."""
+    width, height = size
+    half = min(width, height) / 2
+    x = ((np.arange(width, dtype=np.float32) + 0.5) - width / 2) / half
+    y = ((np.arange(height, dtype=np.float32) + 0.5) - height / 2) / half
+    return np.clip(0.5 - distance(x[None, :], y[:, None]) * half, 0.0, 1.0).astype(np.float32)
+
+
+class MaskLibrary:
+    """
+    Rasterized masks by (mask, size), computed once and kept in memory and,
+    with a cache_dir, on disk.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._coverage = {}
+
+    def coverage(self, mask, size, safe=False):
+        """Coverage of a mask (or of its safe area) at size, as float32."""
+        key = (mask.platform, mask.name, safe, tuple(size))
+        if key not in self._coverage:
+            self._coverage[key] = self._load(mask, tuple(size), safe)
+        return self._coverage[key]
+
+    def _load(self, mask, size, safe):
+        path = None
+        if self.cache_dir:
+            kind = '-safe' if safe else ''
+            path = os.path.join(self.cache_dir, f'{mask.platform}-{mask.name}{kind}-'
+                                f'{size[0]}x{size[1]}-v{MASK_VERSION}.npy')
+            try:
+                return np.load(path).astype(np.float32) / 255
+            except (OSError, ValueError):
+                pass
+
+        with trace.span('rasterize-mask', mask=mask.name, size='{}x{}'.format(*size)):
+            coverage = rasterize(mask.safe_distance if safe else mask.distance, size)
+        # Kept in 8 bits like the disk copy, so results do not depend on the cache
+        coverage = np.rint(coverage * 255).astype(np.uint8)
+
+        if path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                np.save(f, coverage)
+            os.replace(temp_path, path)
+        return coverage.astype(np.float32) / 255
+
+
+def artwork_size(platform, size):
+    """Side of the master's artwork in a masked icon of size pixels."""
+    if platform == 'android':
+        # The viewport of the adaptive foreground, as in the legacy icons
+        return legacy_foreground_size(size)
+    return size
+
+
+def artwork_mask(image):
+    """
+    'L' image of an image's artwork: its alpha if the corner is transparent,
+    otherwise the alpha of the pixels that differ from the corner color.
+    """
+    from PIL import ImageChops
+
+    image = image.convert('RGBA')
+    alpha = image.getchannel('A')
+    corner = image.getpixel((0, 0))
+    if corner[3] < 255:
+        return alpha
+    difference = ImageChops.difference(image.convert('RGB'), Image.new('RGB', image.size, corner[:3]))
+    red, green, blue = difference.split()
+    largest = ImageChops.lighter(red, ImageChops.lighter(green, blue))
+    return ImageChops.multiply(largest.point(lambda value: 255 if value > ARTWORK_THRESHOLD else 0), alpha)
+
+
+def artwork_weights(image):
+    """(height, width) float32 artwork_mask() of an image, from 0 to 1."""
+    return np.asarray(artwork_mask(image), np.float32) / 255
+
+
+def _resize(image, size):
+    if image.size == (size, size):
+        return image
+    # Analysis only needs the coverage, so reduce first like pyramid.py
+    return image.resize((size, size), Image.LANCZOS, reducing_gap=REDUCING_GAP)
+
+
+def _pad(array, size):
+    """A (inner, inner) array centered on a size x size canvas of zeros."""
+    before = (size - array.shape[0]) // 2
+    return np.pad(array, ((before, size - array.shape[0] - before),) * 2)
+
+
+def _place(master, platform, size):
+    """
+    The master resized and centered as it appears in a size x size icon,
+    and the artwork_weights() of the master on the same canvas.
+    """
+    inner = artwork_size(platform, size)
+    resized = _resize(master, inner).convert('RGBA')
+    canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    canvas.paste(resized, ((size - inner) // 2,) * 2)
+    # Weighed before padding, so an opaque master's background is not artwork
+    return canvas, _pad(artwork_weights(resized), size)
+
+
+def mask_report(master, platform, sizes, library=None):
+    """
+    MaskCheck of every mask of platform at every size: the fractions of the
+    artwork outside the mask (clipped) and outside its safe area (unsafe).
+    """
+    library = library or MaskLibrary()
+    # Weigh the master once and resize only the single-channel weights
+    weights_image = artwork_mask(master)
+    checks = []
+    for size in sorted(set(sizes)):
+        with trace.span('mask-check', platform=platform, size=f'{size}x{size}'):
+            inner = _resize(weights_image, artwork_size(platform, size))
+            weights = _pad(np.asarray(inner, np.float32) / 255, size)
+            total = float(weights.sum()) or 1.0
+            for mask in PLATFORM_MASKS[platform]:
+                inside = float(np.vdot(weights, library.coverage(mask, (size, size))))
+                safe = float(np.vdot(weights, library.coverage(mask, (size, size), safe=True)))
+                checks.append(MaskCheck(platform, mask.name, size, 1 - inside / total, 1 - safe / total))
+    return checks
+
+
+def failed_checks(checks, tolerance=SAFE_TOLERANCE):
+    """The checks whose unsafe fraction exceeds tolerance."""
+    return [check for check in checks if check.unsafe > tolerance]
+
+
+def print_mask_report(checks, tolerance=SAFE_TOLERANCE):
+    """Print the worst size of every mask as a table; returns True if all pass."""
+    worst = {}
+    for check in checks:
+        key = (check.platform, check.mask)
+        if key not in worst or check.unsafe > worst[key].unsafe:
+            worst[key] = check
+    print(f"{'mask':<24s}  {'clipped':>7s}  {'unsafe':>7s}  {'worst size':>10s}")
+    for check in worst.values():
+        status = 'FAIL' if check.unsafe > tolerance else 'ok'
+        print(f"{check.platform + ' ' + check.mask:<24s}  {check.clipped:>7.2%}  {check.unsafe:>7.2%}  "
+              f"{check.size:>10d}  {status}")
+    return not failed_checks(checks, tolerance)
+
+
+def _preview(master, mask, size, background, library):
+    """One mask applied to the icon over a gray tile, as uint8 RGB."""
+    placed, weights = _place(master, mask.platform, size)
+    icon = np.asarray(placed).astype(np.float32) / 255
+    coverage = library.coverage(mask, (size, size))
+    safe = library.coverage(mask, (size, size), safe=True)
+
+    # The icon over its background, as a launcher composes it
+    alpha = icon[..., 3:]
+    color = icon[..., :3] * alpha + np.asarray(background, np.float32) / 255 * (1 - alpha)
+    tile = np.full((size, size, 3), 0.5, np.float32)
+    tile = color * coverage[..., None] + tile * (1 - coverage[..., None])
+
+    # Clipped artwork ghosted in red, then the safe area's edge in magenta
+    ghost = weights * (1 - coverage) * 0.5
+    tile = tile * (1 - ghost[..., None]) + np.asarray([1.0, 0.0, 0.0], np.float32) * ghost[..., None]
+    edge = (1 - np.abs(safe * 2 - 1))[..., None] * 0.8
+    tile = tile * (1 - edge) + np.asarray([1.0, 0.0, 1.0], np.float32) * edge
+    return np.rint(tile * 255).astype(np.uint8)
+
+
+def contact_sheet(rows, size=PREVIEW_SIZE, library=None):
+    """
+    Render a contact sheet with one row per (label, master, platform,
+    background) entry and one column per mask of the platform. background
+    is the (r, g, b) the icon is composed over (the adaptive icon
+    background color on Android).
+    """
+    library = library or MaskLibrary()
+    gap = 8
+    label_height = 14
+    columns = max(len(PLATFORM_MASKS[platform]) for _, _, platform, _ in rows)
+    sheet = Image.new('RGB', (gap + columns * (size + gap), gap + len(rows) * (size + label_height + gap)),
+                      (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    for row, (label, master, platform, background) in enumerate(rows):
+        top = gap + row * (size + label_height + gap)
+        for column, mask in enumerate(PLATFORM_MASKS[platform]):
+            left = gap + column * (size + gap)
+            with trace.span('mask-preview', mask=mask.name):
+                sheet.paste(Image.fromarray(_preview(master, mask, size, background, library)),
+                            (left, top + label_height))
+            draw.text((left, top), f'{label} {mask.name}', fill=(0, 0, 0))
+    return sheet
+
+
+def check_masks(entries, sheet_path=None, cache_dir=None, tolerance=SAFE_TOLERANCE):
+    """
+    Print a mask report for every (label, master, platform, sizes,
+    background) entry and optionally save their contact sheet to
+    sheet_path, sharing one MaskLibrary. Returns True if every entry
+    keeps its artwork inside the safe areas.
+    """
+    # SVG masters are measured on one rendering at their nominal size
+    entries = [(label, as_image(master), platform, sizes, background)
+               for label, master, platform, sizes, background in entries]
+    library = MaskLibrary(cache_dir)
+    passed = True
+    start = time.perf_counter()
+    checks = 0
+    for label, master, platform, sizes, _ in entries:
+        print(f"\n{label} ({platform}, {len(set(sizes))} sizes):")
+        report = mask_report(master, platform, sizes, library)
+        passed &= print_mask_report(report, tolerance)
+        checks += len(report)
+    print(f"\n{checks} mask checks in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if sheet_path:
+        rows = [(label, master, platform, background) for label, master, platform, _, background in entries]
+        contact_sheet(rows, library=library).save(sheet_path)
+        print(f"\nContact sheet: {sheet_path}")
+    return passed
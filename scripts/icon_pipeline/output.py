@@ -0,0 +1,274 @@
+"""
+File output helpers shared by the icon generators.
+
+Targets that share identical bytes (for example two iOS filenames that are
+both 120x120) are materialized with link_identical(): a copy-on-write
+reflink where the filesystem supports it, otherwise a hardlink, otherwise a
+plain copy of the bytes already in memory.
+
+Every file is written atomically: the bytes go to a hidden temporary file
+next to the target (ignored by Gradle and Xcode), which then replaces the
+target with os.replace(), so a crash never leaves a truncated icon behind.
+
+BatchWriter moves the writes of a whole icon set to a dedicated I/O thread
+fed by a bounded queue, so encoding the next icon overlaps with writing the
+previous one. Its temporary files are only renamed into place once the
+whole batch has been written (optionally fsynced first), so an interrupted
+run leaves the previous icon set untouched.
+"""
+
+import os
+import queue
+import sys
+import threading
+
+from . import trace
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# ioctl request for a Linux copy-on-write clone (btrfs, XFS, overlayfs, ...)
+_FICLONE = 0x40049409
+
+
+def write_if_changed(path, data):
+    """
+    Write bytes to path unless the file already holds exactly those bytes.
+
+    Leaving identical files alone keeps their mtimes, so Gradle and Xcode do
+    not reprocess assets that did not change. Returns True if written.
+    """
+    with trace.span('write', path=os.path.basename(path)) as span:
+        written = _write_if_changed(path, data)
+        span.set(bytes_out=len(data) if written else 0, written=written)
+    return written
+
+
+def _temp_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}.{os.getpid()}.tmp')
+
+
+def _same_content(path, data):
+    try:
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except FileNotFoundError:
+        return False
+
+
+def _write_temp(path, data, fsync=False):
+    """Write data to a temporary file next to path and return its path."""
+    temp = _temp_path(path)
+    with open(temp, 'wb') as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return temp
+
+
+def _write_if_changed(path, data):
+    if _same_content(path, data):
+        return False
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Replacing rather than overwriting also leaves other hardlinks alone
+    os.replace(_write_temp(path, data), path)
+    return True
+
+
+def _reflink(src, dst):
+    """Clone src to dst with copy-on-write, returning False if unsupported."""
+    if fcntl is not None and sys.platform.startswith('linux'):
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return True
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+            return False
+
+    if sys.platform == 'darwin':
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        clonefile = getattr(libc, 'clonefile', None)
+        if clonefile is not None:
+            return clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+
+    return False
+
+
+def link_identical(src, dst, data):
+    """
+    Make dst hold the same bytes as src, which already holds data.
+
+    Tries a reflink, then a hardlink, then writes data. An existing dst with
+    the same content is left alone. Returns True if dst was (re)created.
+    """
+    with trace.span('link', path=os.path.basename(dst)) as span:
+        linked = _link_identical(src, dst, data)
+        span.set(linked=linked)
+    return linked
+
+
+def _link_temp(src, dst, data):
+    """Make a temporary file next to dst holding src's bytes and return its path."""
+    temp = _temp_path(dst)
+    if os.path.lexists(temp):
+        os.remove(temp)
+    if _reflink(src, temp):
+        return temp
+    try:
+        os.link(src, temp)
+        return temp
+    except OSError:
+        pass
+    return _write_temp(dst, data)
+
+
+def _link_identical(src, dst, data):
+    if _same_content(dst, data):
+        return False
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    os.replace(_link_temp(src, dst, data), dst)
+    return True
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:  # Windows cannot open directories
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BatchWriter:
+    """
+    Write a batch of files atomically on a background I/O thread.
+
+    write() and link() queue a file and return at once; the queue holds at
+    most max_pending files, so a producer that outruns the disk blocks
+    instead of buffering a whole icon set. The I/O thread creates each
+    directory once, skips files whose bytes are unchanged and writes the
+    rest to temporary files. commit() waits for the queue, fsyncs the
+    temporary files if asked to and renames them into place; abort()
+    removes them. Used as a context manager, the batch is committed unless
+    the block raised.
+    """
+
+    def __init__(self, fsync=False, max_pending=8):
+        self.fsync = fsync
+        self.written = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._directories = set()
+        self._staged = {}  # target path: temporary path
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='icon-writer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write(self, path, data):
+        """Queue writing data to path."""
+        self._put((None, path, data))
+
+    def link(self, src, dst, data):
+        """Queue making dst a copy of src (written earlier), which holds data."""
+        self._put((src, dst, data))
+
+    def _put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._stage(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _stage(self, src, path, data):
+        name = 'write' if src is None else 'link'
+        with trace.span(name, path=os.path.basename(path)) as span:
+            changed = not _same_content(path, data)
+            span.set(changed=changed)
+            if not changed:
+                return
+            directory = os.path.dirname(path) or '.'
+            if directory not in self._directories:
+                os.makedirs(directory, exist_ok=True)
+                self._directories.add(directory)
+            if src is None:
+                temp = _write_temp(path, data)
+            else:
+                # src may still be staged, or unchanged and already in place
+                temp = _link_temp(self._staged.get(src, src), path, data)
+            self._staged[path] = temp
+
+    def _finish(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def commit(self):
+        """
+        Wait for the queued files and move them into place. Returns the
+        paths that were (re)written.
+        """
+        self._finish()
+        if self._error is not None:
+            self._remove_staged()
+            raise self._error
+
+        with trace.span('commit', files=len(self._staged), fsync=self.fsync):
+            if self.fsync:
+                # Hardlinked copies share their inode, so sync each file once
+                synced = set()
+                for temp in self._staged.values():
+                    inode = os.stat(temp).st_ino
+                    if inode not in synced:
+                        synced.add(inode)
+                        with open(temp, 'rb') as f:
+                            os.fsync(f.fileno())
+            for path, temp in self._staged.items():
+                os.replace(temp, path)
+                self.written.append(path)
+            if self.fsync:
+                for directory in {os.path.dirname(path) or '.' for path in self._staged}:
+                    _fsync_directory(directory)
+        self._staged = {}
+        return self.written
+
+    def abort(self):
+        """Drop the batch, removing its temporary files."""
+        self._finish()
+        self._remove_staged()
+
+    def _remove_staged(self):
+        for temp in self._staged.values():
+            try:
+                os.remove(temp)
+            except FileNotFoundError:
+                pass
+        self._staged = {}
@@ -0,0 +1,144 @@
+"""
+Progressive (pyramid) downscaling for icon targets.
+
+Resizing every target straight from the master re-reads every master pixel
+for every output, even the 20x20 ones. The planner sorts the requested sizes
+from large to small and resizes each one from the smallest level computed so
+far that is still at least min_ratio times larger than the target, so small
+icons are made from an already-resized icon instead of the full master.
+Remaining large integer factors go through Pillow's reduce() fast path via
+resize(..., reducing_gap=...).
+
+min_ratio is the quality bound: the larger it is, the closer the result is to
+resizing the master directly. quality_report() measures the trade-off (max
+and mean per-channel delta against direct LANCZOS resizing, plus timings) on
+a real master.
+
+draft_master() applies Pillow's draft() to JPEG masters so they are decoded
+at a reduced scale that is still large enough for every target.
+"""
+
+import time
+
+from . import trace
+
+
+DEFAULT_MIN_RATIO = 3.0
+DEFAULT_REDUCING_GAP = 3.0
+
+
+def _area_order(sizes):
+    return sorted(set(sizes), key=lambda s: (s[0] * s[1], s), reverse=True)
+
+
+def plan_pyramid(source_size, sizes, min_ratio=DEFAULT_MIN_RATIO, levels=()):
+    """
+    Plan the order and parent level of each resize.
+
+    levels are sizes computed earlier that may be used as parents. Returns
+    (size, parent_size) pairs, largest first, for the sizes not already in
+    levels. parent_size is None when the target is resized from the source.
+    Duplicate sizes are planned once.
+    """
+    available = set(levels)
+    plan = []
+
+    for size in _area_order(sizes):
+        if size in available:
+            continue
+        parent = None
+        # Use the smallest level that is still large enough
+        for level in reversed(_area_order(available)):
+            if level[0] >= size[0] * min_ratio and level[1] >= size[1] * min_ratio:
+                parent = level
+                break
+        plan.append((size, parent))
+        available.add(size)
+
+    return plan
+
+
+def resize_from(image, size, reducing_gap=DEFAULT_REDUCING_GAP):
+    """LANCZOS resize using Pillow's reduce() fast path for large factors."""
+    from PIL import Image
+
+    if image.size == size:
+        return image
+    with trace.span('resize', size='{}x{}'.format(*size), source='{}x{}'.format(*image.size)):
+        return image.resize(size, Image.LANCZOS, reducing_gap=reducing_gap)
+
+
+def render_pyramid(master, sizes, min_ratio=DEFAULT_MIN_RATIO, reducing_gap=DEFAULT_REDUCING_GAP,
+                   levels=None):
+    """
+    Resize the master to every requested size, returning {size: image}.
+
+    levels is an optional {size: image} dict of earlier results from the same
+    master; it is used for parents and extended with the new sizes.
+    """
+    if levels is None:
+        levels = {}
+    for size, parent in plan_pyramid(master.size, sizes, min_ratio, levels):
+        source = master if parent is None else levels[parent]
+        levels[size] = resize_from(source, size, reducing_gap)
+    return {size: levels[size] for size in sizes}
+
+
+def draft_master(image, min_size):
+    """
+    Let JPEG masters decode at a reduced scale of at least min_size pixels.
+
+    Must be called before the image is loaded; other formats are unchanged.
+    """
+    if image.format == 'JPEG':
+        image.draft(image.mode, (min_size, min_size))
+    return image
+
+
+def channel_delta(a, b):
+    """
+    Return (max, mean) absolute per-channel difference between two images.
+
+    RGBA images are compared premultiplied, so color noise under fully
+    transparent pixels does not count.
+    """
+    from PIL import ImageChops, ImageStat
+
+    if a.mode == 'RGBA':
+        a, b = a.convert('RGBa'), b.convert('RGBa')
+    diff = ImageChops.difference(a, b)
+    max_delta = max(high for _, high in diff.getextrema())
+    mean_delta = sum(ImageStat.Stat(diff).mean) / len(diff.getbands())
+    return max_delta, mean_delta
+
+
+def quality_report(master, sizes, min_ratio=DEFAULT_MIN_RATIO, reducing_gap=DEFAULT_REDUCING_GAP):
+    """
+    Compare pyramid resizing with direct LANCZOS resizing of the master.
+
+    Returns a dict with per-size (size, max_delta, mean_delta) rows and the
+    wall time of both approaches in seconds.
+    """
+    from PIL import Image
+
+    sizes = sorted(set(sizes), reverse=True)
+
+    start = time.perf_counter()
+    direct = {size: master.resize(size, Image.LANCZOS) for size in sizes}
+    direct_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pyramid = render_pyramid(master, sizes, min_ratio, reducing_gap)
+    pyramid_time = time.perf_counter() - start
+
+    rows = [(size,) + channel_delta(direct[size], pyramid[size]) for size in sizes]
+    return {'rows': rows, 'direct_time': direct_time, 'pyramid_time': pyramid_time}
+
+
+def print_quality_report(report):
+    """Print a quality_report() result as a table."""
+    print(f"{'size':>11s}  {'max delta':>9s}  {'mean delta':>10s}")
+    for (width, height), max_delta, mean_delta in report['rows']:
+        print(f"{width:>5d}x{height:<5d}  {max_delta:>9d}  {mean_delta:>10.3f}")
+    print(f"direct:  {report['direct_time'] * 1000:.1f} ms")
+    print(f"pyramid: {report['pyramid_time'] * 1000:.1f} ms")
@@ -0,0 +1,278 @@
+"""
+Perceptual quality checks of generated icons.
+
+Every written icon is decoded from disk, exactly as it ships, and compared
+with a reference rendering of the same RenderJob: the master reduced with
+Pillow's BOX filter (an exact area average, free of the ringing and
+aliasing a resampler can add) and composed on its canvas or layer like the
+real target (see layers.py). For each icon this measures:
+
+- SSIM against the reference on the luminance of the icon shown over mid
+  gray (so transparency counts too), and PSNR on the premultiplied RGBA
+  channels. SSIM uses 7x7 uniform windows computed with summed-area
+  tables, so every window of an image is evaluated in a few array
+  operations.
+- For icons up to LEGIBILITY_MAX_SIZE pixels, a legibility score: the edge
+  energy (summed luminance gradient per icon width) of the icon relative to
+  a large reference rendering. Resolved edges keep their energy at any size,
+  while thin lines and small gaps that blur together lose it, so a score
+  well below 1 means detail turned to mush. The RMS contrast of the
+  luminance is reported next to it.
+- With a goldens directory, SSIM and PSNR against the stored golden image of
+  the same target, which catches any drift from a reviewed icon set.
+
+Each measure is checked against a threshold (DEFAULT_THRESHOLDS, each
+configurable). Icons are analyzed on a thread pool; NumPy and Pillow
+release the GIL for the heavy operations.
+
+Requires NumPy: pip install numpy
+"""
+
+import math
+import os
+import shutil
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from . import trace
+from .layers import compose
+from .svg import SvgMaster
+
+
+# Lowest acceptable value of each measure; golden-* apply with a goldens directory
+DEFAULT_THRESHOLDS = {
+    'ssim': 0.95,
+    'psnr': 32.0,
+    'legibility': 0.7,
+    'golden-ssim': 0.99,
+    'golden-psnr': 40.0,
+}
+
+# SSIM window side and the usual stabilizing constants for a dynamic range of 1
+SSIM_WINDOW = 7
+SSIM_C1 = 0.01 ** 2
+SSIM_C2 = 0.03 ** 2
+
+# Side SSIM inputs are averaged down to, as viewers see them at a distance
+SSIM_SCALE = 256
+
+# Icons up to this side get a legibility score
+LEGIBILITY_MAX_SIZE = 64
+
+# Side of the reference the legibility score compares edge energy with
+LEGIBILITY_REFERENCE_SIZE = 256
+
+# SVG masters are rasterized this many times larger for the reference
+SVG_REFERENCE_SCALE = 4
+
+# Rec. 709 luma weights
+LUMA = (0.2126, 0.7152, 0.0722)
+
+# One generated icon to check; its golden is goldens/label/name
+QualityTarget = namedtuple('QualityTarget', ['label', 'name', 'path', 'job', 'master'])
+
+QualityResult = namedtuple('QualityResult', ['target', 'size', 'ssim', 'psnr', 'legibility', 'contrast',
+                                             'golden_ssim', 'golden_psnr', 'problems'])
+
+
+def parse_thresholds(values):
+    """
+    DEFAULT_THRESHOLDS updated with NAME=VALUE strings. Raises ValueError
+    for unknown names and values that are not numbers.
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for value in values or ():
+        name, _, number = value.partition('=')
+        if name not in thresholds:
+            raise ValueError(f"unknown threshold '{name}' (choose from {', '.join(thresholds)})")
+        try:
+            thresholds[name] = float(number)
+        except ValueError:
+            raise ValueError(f"threshold {name} needs a number, got '{number}'") from None
+    return thresholds
+
+
+def to_array(image):
+    """(height, width, 4) float32 premultiplied RGBA of an image, from 0 to 1."""
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    pixels = np.asarray(image, np.float32) / 255
+    return np.concatenate([pixels[..., :3] * pixels[..., 3:], pixels[..., 3:]], axis=2)
+
+
+def luminance(pixels):
+    """Luminance of premultiplied RGBA pixels shown over mid gray."""
+    over_gray = pixels[..., :3] + 0.5 * (1 - pixels[..., 3:])
+    return over_gray @ np.asarray(LUMA, np.float32)
+
+
+def _window_mean(values, window):
+    """Mean of every window x window block (valid positions)."""
+    table = np.pad(values, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    sums = table[window:, window:] - table[:-window, window:] - table[window:, :-window] + table[:-window, :-window]
+    return sums / (window * window)
+
+
+def _downsample(values, factor):
+    height, width = values.shape[0] // factor * factor, values.shape[1] // factor * factor
+    return values[:height, :width].reshape(height // factor, factor, width // factor, factor).mean(axis=(1, 3))
+
+
+def ssim(a, b):
+    """
+    Mean SSIM of two same-sized (height, width) arrays. As in the
+    reference implementation, images over SSIM_SCALE pixels are first
+    averaged down by an integer factor to about that size.
+    """
+    factor = max(1, round(min(a.shape[0], a.shape[1]) / SSIM_SCALE))
+    if factor > 1:
+        a, b = _downsample(a, factor), _downsample(b, factor)
+    window = min(SSIM_WINDOW, a.shape[0], a.shape[1])
+    # Summed-area tables need float64 to keep the window variances exact
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    mean_a, mean_b = _window_mean(a, window), _window_mean(b, window)
+    var_a = _window_mean(a * a, window) - mean_a ** 2
+    var_b = _window_mean(b * b, window) - mean_b ** 2
+    covariance = _window_mean(a * b, window) - mean_a * mean_b
+    index = ((2 * mean_a * mean_b + SSIM_C1) * (2 * covariance + SSIM_C2)
+             / ((mean_a ** 2 + mean_b ** 2 + SSIM_C1) * (var_a + var_b + SSIM_C2)))
+    return float(index.mean())
+
+
+def psnr(a, b):
+    """PSNR in dB of two arrays from 0 to 1; inf if they are equal."""
+    error = float(np.mean((a - b) ** 2))
+    return math.inf if error == 0 else 10 * math.log10(1 / error)
+
+
+def edge_energy(pixels):
+    """Summed luminance gradient magnitude per icon width."""
+    y = luminance(pixels)
+    gy, gx = np.gradient(y)
+    return float(np.hypot(gx, gy).sum()) / y.shape[1]
+
+
+def rms_contrast(pixels):
+    return float(luminance(pixels).std())
+
+
+def reference(master, job):
+    """
+    The job rendered from the master with an exact area-average reduction.
+    An SvgMaster is rasterized at SVG_REFERENCE_SCALE times the job's size
+    and reduced the same way, so the reference is independent of the
+    rasterization being checked.
+    """
+    if isinstance(master, SvgMaster):
+        resized = master.rasterize(_scaled(job, SVG_REFERENCE_SCALE).size).resize(job.size, Image.BOX)
+    elif master.size == tuple(job.size):
+        resized = master
+    else:
+        resized = master.resize(job.size, Image.BOX)
+    return compose(resized, job)
+
+
+def _scaled(job, factor):
+    return job._replace(size=(job.size[0] * factor, job.size[1] * factor),
+                        canvas_size=job.canvas_size and (job.canvas_size[0] * factor, job.canvas_size[1] * factor))
+
+
+def golden_path(goldens, target):
+    return os.path.join(goldens, target.label, target.name)
+
+
+def analyze(target, goldens=None, thresholds=DEFAULT_THRESHOLDS):
+    """The QualityResult of one generated icon."""
+    with trace.span('quality', target=target.name):
+        with Image.open(target.path) as image:
+            output = to_array(image)
+        size = output.shape[1]
+        expected = to_array(reference(target.master, target.job))
+        problems = []
+        if expected.shape != output.shape:
+            problems.append(f"is {output.shape[1]}x{output.shape[0]}, "
+                            f"expected {expected.shape[1]}x{expected.shape[0]}")
+            return QualityResult(target, size, None, None, None, None, None, None, problems)
+
+        result = {'ssim': ssim(luminance(output), luminance(expected)), 'psnr': psnr(output, expected)}
+        result['legibility'] = result['contrast'] = None
+        if size <= LEGIBILITY_MAX_SIZE:
+            factor = -(-LEGIBILITY_REFERENCE_SIZE // size)
+            large = to_array(reference(target.master, _scaled(target.job, factor)))
+            result['legibility'] = edge_energy(output) / max(edge_energy(large), 1e-6)
+            result['contrast'] = rms_contrast(output)
+
+        result['golden-ssim'] = result['golden-psnr'] = None
+        if goldens:
+            try:
+                with Image.open(golden_path(goldens, target)) as image:
+                    golden = to_array(image)
+            except FileNotFoundError:
+                problems.append("no golden image")
+            else:
+                if golden.shape == output.shape:
+                    result['golden-ssim'] = ssim(luminance(output), luminance(golden))
+                    result['golden-psnr'] = psnr(output, golden)
+                else:
+                    problems.append(f"golden is {golden.shape[1]}x{golden.shape[0]}")
+
+        for name, value in result.items():
+            if value is not None and name in thresholds and value < thresholds[name]:
+                problems.append(f"{name} {value:.3f} < {thresholds[name]:g}")
+    return QualityResult(target, size, result['ssim'], result['psnr'], result['legibility'],
+                         result['contrast'], result['golden-ssim'], result['golden-psnr'], problems)
+
+
+def analyze_all(targets, goldens=None, thresholds=DEFAULT_THRESHOLDS, threads=None):
+    """QualityResult of every QualityTarget, analyzed in parallel, in order."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as executor:
+        return list(executor.map(lambda target: analyze(target, goldens, thresholds), targets))
+
+
+def update_goldens(targets, goldens):
+    """Copy every generated icon into the goldens directory."""
+    for target in targets:
+        path = golden_path(goldens, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(target.path, path)
+
+
+def _number(value, digits=3):
+    if value is None:
+        return '-'
+    return 'inf' if math.isinf(value) else f'{value:.{digits}f}'
+
+
+def print_quality_results(results):
+    """Print one row per icon, with its problems; returns True if there are none."""
+    print(f"{'icon':<48s}  {'size':>4s}  {'ssim':>6s}  {'psnr':>6s}  {'legib':>6s}  {'contr':>6s}  "
+          f"{'g-ssim':>6s}  {'g-psnr':>6s}")
+    for result in results:
+        name = os.path.join(result.target.label, result.target.name)
+        print(f"{name:<48s}  {result.size:>4d}  {_number(result.ssim):>6s}  {_number(result.psnr, 1):>6s}  "
+              f"{_number(result.legibility, 2):>6s}  {_number(result.contrast, 2):>6s}  "
+              f"{_number(result.golden_ssim):>6s}  {_number(result.golden_psnr, 1):>6s}"
+              + ('  FAIL: ' + '; '.join(result.problems) if result.problems else ''))
+    return not any(result.problems for result in results)
+
+
+def check_quality(targets, goldens=None, thresholds=DEFAULT_THRESHOLDS, update=False):
+    """
+    Analyze and print every QualityTarget, then (with update) store the
+    icons as the new goldens. Returns True if every icon passed.
+    """
+    targets = list(targets)
+    start = time.perf_counter()
+    results = analyze_all(targets, None if update else goldens, thresholds)
+    passed = print_quality_results(results)
+    print(f"\nAnalyzed {len(results)} icons in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if update and goldens:
+        update_goldens(targets, goldens)
+        print(f"Stored {len(targets)} golden images in {goldens}")
+    return passed
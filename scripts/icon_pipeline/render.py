@@ -0,0 +1,515 @@
+"""
+Resize and PNG-encode icon targets, serially or across a process pool.
+
+A RenderJob describes one output image: the size the master is resized to,
+optionally a larger transparent canvas it is centered on (used for Android
+adaptive icon foregrounds), optionally a byte budget for the encoded file,
+and optionally the layer composed from it (Android monochrome or legacy
+round, or a maskable web icon, see layers.py). A Renderer turns a list of
+jobs into encoded PNG bytes in job order, using one of the PNG strategies
+of encode.py and escalating to a more thorough one for jobs over budget.
+A total budget over a set of jobs (all the icons of an app) is met by
+re-encoding the largest icons first.
+
+With more than one worker the jobs are spread over a ProcessPoolExecutor.
+The master's raw pixels are placed in shared memory once and each worker
+rebuilds the image from them when it starts, so the master is never pickled
+per task. Jobs of the same size go to one task, so the layers sharing a
+size are resized once. Workers run exactly the same resize and encode code
+as the serial path, so the output is byte-identical either way.
+
+With pyramid resizing enabled (see pyramid.py) the resizes are planned
+together in the main process and only the PNG encoding is spread over the
+pool. The same holds for the linear-light NumPy resampler (resampler='linear',
+see resample.py), which resizes a whole batch of sizes at once.
+
+The master may also be an SvgMaster (see svg.py): every size is then
+rasterized from the vector document instead of resized, and workers get the
+document itself rather than pixels in shared memory.
+
+render_targets() ties a Renderer to output files and an optional IconCache:
+only stale targets are rendered, and the master is not even loaded when
+every target is fresh. Targets with identical jobs are rendered and encoded
+once; the remaining files are reflinked, hardlinked or copied from the first.
+The files are written by a BatchWriter (see output.py) while the following
+jobs are still being encoded, and only moved into place once all of them
+have been written; an output sink (see sinks.py) can stream them into an
+archive or keep them in memory instead.
+"""
+
+import hashlib
+import json
+import os
+import signal
+from collections import Counter, namedtuple
+from itertools import chain, groupby, repeat
+
+import PIL
+
+from .cache import bytes_digest
+from .encode import DEFAULT_STRATEGY, DETERMINISTIC, STRATEGIES, EncodedPNG, encode, encoder_fingerprint
+from .layers import compose
+from .pyramid import DEFAULT_REDUCING_GAP, render_pyramid
+from .sinks import FileSink
+from .svg import SvgMaster
+from . import trace
+
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:  # Python < 3.8: fall back to passing bytes at startup
+        return None
+    return shared_memory
+
+
+# Bump whenever a change to this module alters the encoded output
+RENDER_VERSION = 3
+
+# Resize implementations: Pillow's LANCZOS, or resample.py in linear light
+RESAMPLERS = ('pillow', 'linear')
+DEFAULT_RESAMPLER = 'pillow'
+
+# layer and background pick an Android icon layer to compose (see layers.py)
+RenderJob = namedtuple('RenderJob', ['size', 'canvas_size', 'budget', 'layer', 'background'])
+RenderJob.__new__.__defaults__ = (None, None, None, None)
+
+
+def image_digest(image):
+    """Return a hex SHA-256 identifying an image's mode, size and pixels."""
+    digest = hashlib.sha256(f'{image.mode}:{image.size[0]}x{image.size[1]}:'.encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def master_digest(master):
+    """image_digest() of an image master, or the document digest of an SvgMaster."""
+    if isinstance(master, SvgMaster):
+        return master.digest
+    return image_digest(master)
+
+
+def render_image(master, job):
+    """Resize the master for a job and compose its canvas or layer, if any."""
+    return place_on_canvas(_resize(master, job.size), job)
+
+
+def render_images(master, jobs):
+    """
+    Yield (job, image) for each job in order, resizing the master once per
+    distinct size: the layers of one size share a single resize.
+    """
+    resized = {}
+    for job in jobs:
+        if job.size not in resized:
+            resized[job.size] = _resize(master, job.size)
+        yield job, place_on_canvas(resized[job.size], job)
+
+
+def _resize(master, size):
+    from PIL import Image
+
+    if isinstance(master, SvgMaster):
+        return master.rasterize(size)
+    if master.size == size:
+        return master
+    with trace.span('resize', size='{}x{}'.format(*size)):
+        return master.resize(size, Image.LANCZOS)
+
+
+def group_by_size(jobs):
+    """The jobs reordered so that jobs of the same size are adjacent, stably."""
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job.size, []).append(job)
+    return [job for group in groups.values() for job in group]
+
+
+def place_on_canvas(resized, job):
+    """Center an already resized image on the job's canvas and compose its layer."""
+    if job.canvas_size is None and job.layer is None:
+        return resized
+
+    canvas_size = job.canvas_size or resized.size
+    with trace.span('composite', size='{}x{}'.format(*canvas_size), layer=job.layer or 'foreground'):
+        return compose(resized, job)
+
+
+# Master image rebuilt once per worker process by _init_worker
+_worker_master = None
+
+
+def _init_worker(shm_name, length, data, mode, size, info, tracing=False):
+    """Rebuild the master inside a worker from shared memory (or raw bytes)."""
+    global _worker_master
+    from PIL import Image
+
+    # Ctrl+C is handled by the parent (for example to leave watch mode),
+    # which then shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Forked workers start with a copy of the parent's spans
+    trace.drain()
+    trace.enable(tracing)
+
+    if mode is None:
+        # Encode-only pool (pyramid mode): workers never see the master
+        return
+    if mode == 'svg':
+        # data is the SvgMaster itself; each worker parses its documents once
+        _worker_master = data
+        return
+
+    if shm_name is not None:
+        shm = _shared_memory().SharedMemory(name=shm_name)
+        try:
+            data = bytes(shm.buf[:length])
+        finally:
+            shm.close()
+
+    _worker_master = Image.frombytes(mode, size, data)
+    _worker_master.info.update(info)
+
+
+def _render_group_in_worker(jobs, strategy):
+    encoded = [encode(image, strategy, job.budget) for job, image in render_images(_worker_master, jobs)]
+    return encoded, trace.drain()
+
+
+def _encode_in_worker(image, strategy, budget):
+    return encode(image, strategy, budget), trace.drain()
+
+
+def _merge_worker_results(results):
+    """Unpack (result, spans) pairs of pool tasks as they arrive, keeping the spans."""
+    for result, spans in results:
+        trace.merge(spans)
+        yield result
+
+
+class Renderer:
+    """
+    Render jobs against one master image.
+
+    master may be a PIL image, an SvgMaster (see svg.py) or a zero-argument
+    callable returning either; a callable is only invoked when the first job
+    actually has to be rendered. An SvgMaster is rasterized at every size,
+    so it is used without pyramid and with the default resampler.
+    source_key identifies the source for cache keys (for example the hash of
+    the source file) and defaults to a digest of the master's pixels.
+
+    workers=1 renders in-process; workers > 1 uses a process pool and
+    workers=0 uses one process per CPU. pyramid, if set, is the min_ratio
+    quality bound for pyramid resizing (see pyramid.py); None resizes every
+    target directly from the master. resampler='linear' resizes with
+    resample.py (NumPy, linear light, premultiplied alpha) instead of
+    Pillow, always from the master. strategy is the PNG strategy of
+    encode.py tried first (see also set_total_budget), or DETERMINISTIC for
+    reproducible bytes. Use as a context manager so the pool and shared
+    memory are released when generation finishes.
+
+    Encoded results are kept per job, so stages, platforms and variants that
+    share a Renderer never resize or encode the same job twice. close() only
+    releases the pool; the renderer can keep serving from its results.
+    replace_master() swaps in a new master for long-running callers (watch
+    mode), keeping the results when its pixels did not change.
+    """
+
+    def __init__(self, master, workers=1, source_key=None, pyramid=None,
+                 strategy=DEFAULT_STRATEGY, resampler=DEFAULT_RESAMPLER):
+        if resampler not in RESAMPLERS:
+            raise ValueError(f"unknown resampler '{resampler}' (choose from {', '.join(RESAMPLERS)})")
+        self._master = master
+        self.workers = workers or os.cpu_count() or 1
+        self._source_key = source_key
+        self.resampler = resampler
+        # The linear resampler resizes straight from the master
+        self.pyramid = pyramid if resampler == 'pillow' else None
+        self.strategy = strategy
+        self.total_budget = None
+        self._budget_jobs = ()
+        self._tried = {}
+        self._levels = {}
+        self._encoded = {}
+        self._pool = None
+        self._shm = None
+        self._master_digest = None
+
+    @property
+    def master(self):
+        """The master image, loaded on first access."""
+        if callable(self._master):
+            with trace.span('load-master'):
+                self._master = self._master()
+        return self._master
+
+    @property
+    def source_key(self):
+        if self._source_key is None:
+            self._source_key = master_digest(self.master)
+        return self._source_key
+
+    def replace_master(self, master, source_key=None):
+        """
+        Render from now on against master (an image or a callable, as in
+        the constructor) identified by source_key.
+
+        If the new master has exactly the same pixels as the current one,
+        every resized and encoded result is kept; otherwise they are dropped
+        together with the worker processes holding the old master. Returns
+        True if the pixels changed.
+        """
+        if source_key is not None and source_key == self._source_key:
+            return False  # same source, e.g. a save that did not change its bytes
+
+        previous = self._master
+        previous_digest = self._master_digest
+        self._master = master
+        self._source_key = source_key
+        self._master_digest = None
+
+        if not callable(previous):
+            if previous_digest is None:
+                previous_digest = master_digest(previous)
+            self._master_digest = master_digest(self.master)
+            if self._master_digest == previous_digest:
+                return False
+
+        self._levels = {}
+        self._encoded = {}
+        self._tried = {}
+        if not self._resizes_here:
+            # Pools that only encode never saw the master
+            self.close()
+        return True
+
+    def set_total_budget(self, total, jobs):
+        """
+        Keep the encoded size of jobs, counted once per output file, within
+        total bytes.
+
+        The first render() that needs any of these jobs encodes all of them,
+        then re-encodes the largest with the next more thorough strategy
+        until the total fits or every job has had the exhaustive search.
+        Raises ValueError for the DETERMINISTIC encoder, which has no
+        alternatives to escalate to.
+        """
+        if self.strategy == DETERMINISTIC:
+            raise ValueError("a total icon budget cannot be met with the deterministic encoder")
+        self.total_budget = total
+        self._budget_jobs = list(jobs)
+
+    def cache_key(self, job):
+        """Digest of everything that determines the encoded bytes for a job."""
+        resample = 'LANCZOS'
+        if self.pyramid:
+            resample = f'LANCZOS:pyramid:{self.pyramid}:{DEFAULT_REDUCING_GAP}'
+        elif self.resampler == 'linear':
+            from .resample import RESAMPLE_VERSION
+            resample = f'LANCZOS:linear:{RESAMPLE_VERSION}'
+        total = self.total_budget if job in self._budget_jobs else None
+        strategy = self.strategy
+        if strategy == DETERMINISTIC:
+            # A zlib upgrade must invalidate the stable bytes too
+            strategy = encoder_fingerprint(strategy)
+        payload = [RENDER_VERSION, PIL.__version__, self.source_key, resample,
+                   strategy, total, list(job)]
+        return bytes_digest(json.dumps(payload).encode())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def _resizes_here(self):
+        """True if resizes run in this process and the pool only encodes."""
+        return bool(self.pyramid) or self.resampler != 'pillow'
+
+    def _start_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self._resizes_here:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(None, 0, None, None, None, None, trace.enabled()),
+            )
+            return
+
+        master = self.master
+        if isinstance(master, SvgMaster):
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(None, 0, master, 'svg', None, None, trace.enabled()),
+            )
+            return
+
+        data = master.tobytes()
+        length = len(data)
+        shm_name = None
+        shared_memory = _shared_memory()
+
+        if shared_memory is not None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(length, 1))
+            self._shm.buf[:length] = data
+            shm_name = self._shm.name
+            data = None
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(shm_name, length, data, master.mode, master.size, dict(master.info),
+                      trace.enabled()),
+        )
+
+    def render(self, jobs):
+        """Return the encoded PNG bytes for each job, in job order."""
+        jobs = list(jobs)
+        for _ in self.iter_render(jobs):
+            pass
+        return [self._encoded[job].data for job in jobs]
+
+    def iter_render(self, jobs):
+        """
+        Yield (job, encoded PNG bytes) for each distinct job, in order, as
+        soon as it is encoded, so that the caller can write it out while
+        the following jobs are still being encoded.
+        """
+        jobs = plan_unique_jobs(jobs)
+        pending = group_by_size(job for job in jobs if job not in self._encoded)
+        fit_total = any(job in self._budget_jobs for job in pending)
+        if fit_total:
+            # The total can only be balanced with every budgeted job encoded
+            pending = group_by_size(plan_unique_jobs(pending + [job for job in self._budget_jobs
+                                                                if job not in self._encoded]))
+            for job, encoded in zip(pending, self._render(pending)):
+                self._encoded[job] = encoded
+            self._fit_total_budget()
+            results = iter(())
+        else:
+            results = zip(pending, self._render(pending))
+
+        for job in jobs:
+            while job not in self._encoded:
+                done, encoded = next(results)
+                self._encoded[done] = encoded
+            yield job, self._encoded[job].data
+
+    def encoded(self, job):
+        """The EncodedPNG (bytes, strategy used, encode time) of a rendered job."""
+        return self._encoded.get(job)
+
+    def _image(self, job):
+        """The resized image of a job, exactly as _render() produced it."""
+        if self._resizes_here:
+            return place_on_canvas(self._levels[job.size], job)
+        return render_image(self.master, job)
+
+    def _fit_total_budget(self):
+        counts = Counter(self._budget_jobs)
+
+        def weight(job):
+            return len(self._encoded[job].data) * counts[job]
+
+        while sum(weight(job) for job in counts) > self.total_budget:
+            candidates = [job for job in counts
+                          if self._tried.get(job, self._encoded[job].strategy) != STRATEGIES[-1]]
+            if not candidates:
+                return
+            job = max(candidates, key=weight)
+            current = self._encoded[job]
+            tried = self._tried.get(job, current.strategy)
+            next_strategy = STRATEGIES[STRATEGIES.index(tried) + 1]
+            result = encode(self._image(job), next_strategy, job.budget)
+            self._tried[job] = result.strategy
+            best = result if len(result.data) < len(current.data) else current
+            self._encoded[job] = EncodedPNG(best.data, best.strategy, current.seconds + result.seconds)
+
+    def _render(self, jobs):
+        parallel = self.workers > 1 and len(jobs) > 1
+        if parallel and self._pool is None:
+            self._start_pool()
+        budgets = [job.budget for job in jobs]
+
+        if self._resizes_here and jobs:
+            sizes = [job.size for job in jobs]
+            if self.pyramid:
+                resized = render_pyramid(self.master, sizes, self.pyramid, levels=self._levels)
+            else:
+                from .resample import resize_many
+                resized = resize_many(self.master, sizes, levels=self._levels)
+            images = [place_on_canvas(resized[job.size], job) for job in jobs]
+            if parallel:
+                return _merge_worker_results(
+                    self._pool.map(_encode_in_worker, images, repeat(self.strategy), budgets))
+            return (encode(image, self.strategy, budget) for image, budget in zip(images, budgets))
+
+        if parallel:
+            # jobs arrive grouped by size, so the results keep their order
+            groups = [list(group) for _, group in groupby(jobs, key=lambda job: job.size)]
+            return chain.from_iterable(_merge_worker_results(
+                self._pool.map(_render_group_in_worker, groups, repeat(self.strategy))))
+        return (encode(image, self.strategy, job.budget) for job, image in render_images(self.master, jobs))
+
+    def close(self):
+        """Shut down the worker pool and release shared memory."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def plan_unique_jobs(jobs):
+    """Return the distinct jobs in first-seen order."""
+    return list(dict.fromkeys(jobs))
+
+
+def render_targets(renderer, targets, cache=None, fsync=False, sink=None):
+    """
+    Render (output_path, job) targets and write them to disk, or to sink
+    (see sinks.py).
+
+    Targets the cache reports as fresh are skipped without rendering; files
+    whose content did not change are not rewritten. Each distinct job is
+    rendered once and shared by every target that uses it. The files are
+    written as one atomic batch, fsynced first if fsync is set. Returns one
+    boolean per target, True where the target was rendered.
+    """
+    sink = sink or FileSink(fsync)
+    if not sink.in_place:
+        cache = None  # an archive needs every file, fresh or not
+    targets = list(targets)
+    keys = [renderer.cache_key(job) if cache else None for _, job in targets]
+
+    with trace.span('cache-check', targets=len(targets)):
+        stale = [index for index, (output_path, _) in enumerate(targets)
+                 if cache is None or not cache.is_fresh(output_path, keys[index])]
+
+    by_job = {}
+    for index in stale:
+        by_job.setdefault(targets[index][1], []).append(index)
+
+    with sink.batch() as writer:
+        for job, data in renderer.iter_render(by_job):
+            first_path = targets[by_job[job][0]][0]
+            for index in by_job[job]:
+                output_path = targets[index][0]
+                if output_path == first_path:
+                    writer.write(output_path, data)
+                else:
+                    writer.link(first_path, output_path, data)
+
+    # Only record files once they are in place
+    if cache is not None:
+        for index in stale:
+            output_path, job = targets[index]
+            cache.record(output_path, keys[index], renderer.encoded(job).data)
+
+    stale = set(stale)
+    return [index in stale for index in range(len(targets))]
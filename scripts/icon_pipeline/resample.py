@@ -0,0 +1,186 @@
+"""
+Linear-light Lanczos resampling with cached weight matrices.
+
+Pillow's LANCZOS resize works on gamma-encoded sRGB values, which darkens
+fine detail and anti-aliased edges when they are averaged down (a 50% mix of
+black and white comes out as sRGB 128 instead of 188), and it premultiplies
+alpha in 8 bits, which loses color precision in faint edge pixels. This
+resampler decodes the master once to linear-light float32 with
+premultiplied alpha and resizes it in that space:
+
+- The separable Lanczos-3 weights of each (source size, target size) pair
+  are computed once and cached as a block-banded matrix: the output pixels
+  are split into blocks, and each block only stores the weights of the
+  contiguous input span it reads, so a resize costs about the same for
+  every target size instead of growing with it like a dense matrix product.
+- Each resize is two matrix products per block, one per axis, on all
+  channels at once.
+- resize_many() converts the source once for a batch of target sizes, and
+  targets sharing a width share the horizontal pass.
+- Sources more than REDUCING_GAP times larger than the largest target are
+  first box-reduced by an integer factor, in linear light and in strips of
+  rows, so a huge master never exists as a full-size float copy.
+
+The kernel and its support match Pillow's, so the results differ from
+Pillow's only by the color space (and rounding). scripts/benchmark_icons.py
+resample compares throughput and quality with Pillow's LANCZOS.
+
+Requires NumPy: pip install numpy
+"""
+
+import functools
+
+import numpy as np
+from PIL import Image
+
+from . import trace
+
+
+# Bump whenever a change to this module alters the resized pixels
+RESAMPLE_VERSION = 1
+
+# Lanczos lobes, as in Pillow
+LANCZOS_SUPPORT = 3.0
+
+# Output pixels per block of a banded weight matrix
+BLOCK_SIZE = 64
+
+# Box-reduce sources to at least this many times the largest target first
+REDUCING_GAP = 3.0
+
+# Source rows converted to linear light at a time
+STRIP_ROWS = 256
+
+
+def lanczos(x):
+    """The Lanczos-3 kernel."""
+    return np.where(np.abs(x) < LANCZOS_SUPPORT, np.sinc(x) * np.sinc(x / LANCZOS_SUPPORT), 0.0)
+
+
+@functools.lru_cache(maxsize=64)
+def lanczos_weights(in_size, out_size):
+    """
+    Weights resizing in_size pixels to out_size along one axis, as a tuple
+    of (out_start, out_end, in_start, in_end, weights) blocks where weights
+    is an (out_end - out_start) x (in_end - in_start) float32 matrix.
+    """
+    scale = in_size / out_size
+    # Downscaling stretches the kernel over scale source pixels, as in Pillow
+    filter_scale = max(scale, 1.0)
+    support = LANCZOS_SUPPORT * filter_scale
+
+    blocks = []
+    for out_start in range(0, out_size, BLOCK_SIZE):
+        out_end = min(out_start + BLOCK_SIZE, out_size)
+        centers = (np.arange(out_start, out_end) + 0.5) * scale
+        in_start = max(int(centers[0] - support + 0.5), 0)
+        in_end = min(int(centers[-1] + support + 0.5), in_size)
+        offsets = (np.arange(in_start, in_end) + 0.5)[None, :] - centers[:, None]
+        weights = lanczos(offsets / filter_scale)
+        weights /= weights.sum(axis=1, keepdims=True)
+        blocks.append((out_start, out_end, in_start, in_end, weights.astype(np.float32)))
+    return tuple(blocks)
+
+
+@functools.lru_cache(maxsize=None)
+def _decode_table():
+    """sRGB byte value -> linear light, for all 256 values."""
+    values = np.arange(256) / 255.0
+    return np.where(values <= 0.04045, values / 12.92,
+                    ((values + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+
+def _encode_srgb(linear):
+    linear = np.clip(linear, 0.0, 1.0)
+    srgb = np.where(linear <= 0.0031308, linear * 12.92,
+                    1.055 * np.power(linear, 1 / 2.4) - 0.055)
+    return np.rint(srgb * 255).astype(np.uint8)
+
+
+def to_planes(image, factor=1):
+    """
+    (channels, height, width) float32 planes of an RGB or RGBA image in
+    linear light, with the color premultiplied by alpha.
+
+    factor > 1 box-reduces the image by that factor on the way, dropping
+    the last rows and columns beyond a multiple of it.
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    channels = len(image.mode)
+    width, height = image.size[0] // factor, image.size[1] // factor
+    planes = np.empty((channels, height, width), np.float32)
+
+    step = max(1, STRIP_ROWS // factor)
+    for top in range(0, height, step):
+        bottom = min(top + step, height)
+        pixels = np.asarray(image.crop((0, top * factor, width * factor, bottom * factor)))
+        strip = _decode_table()[pixels[..., :3]]
+        if channels == 4:
+            alpha = pixels[..., 3:].astype(np.float32) / 255
+            strip = np.concatenate([strip * alpha, alpha], axis=2)
+        if factor > 1:
+            strip = strip.reshape(bottom - top, factor, width, factor, channels).mean(axis=(1, 3))
+        planes[:, top:bottom, :] = strip.transpose(2, 0, 1)
+    return planes
+
+
+def from_planes(planes):
+    """The RGB or RGBA image (by channel count) of to_planes() output."""
+    if len(planes) == 4:
+        alpha = np.clip(planes[3], 0.0, 1.0)
+        # Un-premultiply; fully transparent pixels keep black
+        color = np.divide(planes[:3], alpha, out=np.zeros_like(planes[:3]), where=alpha > 0)
+        pixels = np.concatenate([_encode_srgb(color), np.rint(alpha * 255).astype(np.uint8)[None]])
+        return Image.fromarray(np.ascontiguousarray(pixels.transpose(1, 2, 0)), 'RGBA')
+    return Image.fromarray(np.ascontiguousarray(_encode_srgb(planes).transpose(1, 2, 0)), 'RGB')
+
+
+def resize_width(planes, width):
+    """Resize (channels, height, width) planes horizontally."""
+    out = np.empty(planes.shape[:2] + (width,), np.float32)
+    for out_start, out_end, in_start, in_end, weights in lanczos_weights(planes.shape[2], width):
+        out[:, :, out_start:out_end] = planes[:, :, in_start:in_end] @ weights.T
+    return out
+
+
+def resize_height(planes, height):
+    """Resize (channels, height, width) planes vertically."""
+    out = np.empty((planes.shape[0], height, planes.shape[2]), np.float32)
+    for out_start, out_end, in_start, in_end, weights in lanczos_weights(planes.shape[1], height):
+        out[:, out_start:out_end, :] = weights @ planes[:, in_start:in_end, :]
+    return out
+
+
+def resize_many(image, sizes, levels=None):
+    """
+    Resize image to every (width, height) in sizes, returning {size: image}.
+
+    levels is an optional {size: image} dict of earlier results from the
+    same image; sizes found there are not resized again, and the new ones
+    are added to it. A size equal to the image's own is the image itself.
+    """
+    if levels is None:
+        levels = {}
+    pending = [size for size in dict.fromkeys(sizes) if size not in levels]
+    for size in pending:
+        if size == image.size:
+            levels[size] = image
+    pending = [size for size in pending if size not in levels]
+
+    if pending:
+        largest = max(width for width, _ in pending), max(height for _, height in pending)
+        factor = max(1, int(min(image.size[0] / largest[0], image.size[1] / largest[1]) / REDUCING_GAP))
+        with trace.span('to-linear', size='{}x{}'.format(*image.size), factor=factor):
+            planes = to_planes(image, factor)
+        heights = {}
+        for width, height in pending:
+            heights.setdefault(width, []).append(height)
+        # Targets of the same width share the horizontal pass
+        for width, target_heights in heights.items():
+            with trace.span('resize', size=f'{width}x*', resampler='linear'):
+                wide = resize_width(planes, width)
+            for height in target_heights:
+                with trace.span('resize', size=f'{width}x{height}', resampler='linear'):
+                    levels[(width, height)] = from_planes(resize_height(wide, height))
+    return {size: levels[size] for size in sizes}
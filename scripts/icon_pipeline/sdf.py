@@ -0,0 +1,167 @@
+"""
+Signed-distance-field renderer for the procedural ephenotes master icon.
+
+Every shape of the icon (rounded note, priority dot, text lines) is described
+by a signed distance function evaluated for all pixels at once with NumPy.
+Coverage is derived analytically from the distance at each pixel center
+(clip(0.5 - d, 0, 1)), which gives smooth anti-aliased edges without drawing
+at a larger size; samples > 1 additionally averages an NxN grid of sub-pixel
+offsets per pixel.
+
+Shapes are composited with the straight-alpha "over" operator into a real
+RGBA buffer, so translucent fills such as the white text lines blend
+correctly. The canvas is processed in horizontal strips and each shape only
+touches its own bounding box, which keeps memory bounded at 4096px and makes
+rendering many color variants cheap.
+
+Requires NumPy: pip install numpy
+"""
+
+import numpy as np
+from PIL import Image, ImageColor
+
+
+# Bump whenever a change to this module alters the rendered pixels
+SDF_VERSION = 1
+
+# Rows rendered per strip; bounds the float32 working set to ~16 MB at 4096px
+STRIP_ROWS = 256
+
+
+def _rgba(color):
+    """Convert a color name, hex string or tuple to an (r, g, b, a) tuple."""
+    if isinstance(color, str):
+        color = ImageColor.getrgb(color)
+    if len(color) == 3:
+        color = tuple(color) + (255,)
+    return tuple(color)
+
+
+def rounded_rect_distance(px, py, box, radius):
+    """Signed distance from points to a rounded rectangle (box = x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = box
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    qx = np.abs(px - cx) - ((x1 - x0) / 2 - radius)
+    qy = np.abs(py - cy) - ((y1 - y0) / 2 - radius)
+    outside = np.hypot(np.maximum(qx, 0), np.maximum(qy, 0))
+    inside = np.minimum(np.maximum(qx, qy), 0)
+    return outside + inside - radius
+
+
+def circle_distance(px, py, center, radius):
+    """Signed distance from points to a circle."""
+    return np.hypot(px - center[0], py - center[1]) - radius
+
+
+def note_icon_shapes(size, note_color='#4CAF50', dot_color='#FF9800',
+                     line_color=(255, 255, 255, 80)):
+    """
+    Describe the ephenotes note icon as (kind, params, rgba, bbox) shapes.
+
+    Proportions match create_master_icon in the iOS generator: a rounded
+    note, a priority dot for sizes >= 60 and three text lines for sizes >= 120.
+    """
+    note_width = int(size * 0.7)
+    note_height = int(size * 0.55)
+    corner_radius = int(size * 0.08)
+    x = (size - note_width) // 2
+    y = (size - note_height) // 2
+
+    note_box = (x, y, x + note_width, y + note_height)
+    shapes = [('rect', (note_box, corner_radius), _rgba(note_color), note_box)]
+
+    if size >= 60:
+        dot_size = int(size * 0.12)
+        dot_x = x + note_width - dot_size - int(size * 0.05)
+        dot_y = y + int(size * 0.05)
+        radius = dot_size / 2
+        center = (dot_x + radius, dot_y + radius)
+        dot_box = (dot_x, dot_y, dot_x + dot_size, dot_y + dot_size)
+        shapes.append(('circle', (center, radius), _rgba(dot_color), dot_box))
+
+    if size >= 120:
+        line_width = max(int(size * 0.004), 1)
+        line_length = int(note_width * 0.6)
+        line_start_x = x + int(note_width * 0.2)
+        for i in range(3):
+            line_y = y + int(note_height * 0.3) + i * int(size * 0.08)
+            line_box = (line_start_x, line_y, line_start_x + line_length, line_y + line_width)
+            shapes.append(('rect', (line_box, 0), _rgba(line_color), line_box))
+
+    return shapes
+
+
+def _coverage(kind, params, px, py, samples):
+    """Anti-aliased coverage of a shape, averaged over samples x samples offsets."""
+    if samples <= 1:
+        offsets = [0.0]
+    else:
+        offsets = (np.arange(samples) + 0.5) / samples - 0.5
+
+    coverage = None
+    for dy in offsets:
+        for dx in offsets:
+            if kind == 'rect':
+                distance = rounded_rect_distance(px + dx, py + dy, *params)
+            else:
+                distance = circle_distance(px + dx, py + dy, *params)
+            sample = np.clip(0.5 - distance, 0.0, 1.0)
+            coverage = sample if coverage is None else coverage + sample
+
+    if len(offsets) > 1:
+        coverage /= len(offsets) ** 2
+    return coverage
+
+
+def render_shapes(size, shapes, background=(255, 255, 255, 255), samples=1):
+    """Render shapes over a background into an RGBA PIL image."""
+    background = np.array(_rgba(background), dtype=np.float32) / 255
+    output = np.empty((size, size, 4), dtype=np.uint8)
+    columns = np.arange(size, dtype=np.float32) + 0.5
+
+    for top in range(0, size, STRIP_ROWS):
+        bottom = min(top + STRIP_ROWS, size)
+        strip = np.empty((bottom - top, size, 4), dtype=np.float32)
+        strip[...] = background
+
+        for kind, params, rgba, (x0, y0, x1, y1) in shapes:
+            # Only evaluate pixels within one pixel of the shape's bounds
+            row0, row1 = max(int(y0) - 1, top), min(int(np.ceil(y1)) + 2, bottom)
+            col0, col1 = max(int(x0) - 1, 0), min(int(np.ceil(x1)) + 2, size)
+            if row0 >= row1 or col0 >= col1:
+                continue
+
+            py = (np.arange(row0, row1, dtype=np.float32) + 0.5)[:, None]
+            px = columns[col0:col1][None, :]
+            alpha = _coverage(kind, params, px, py, samples) * (rgba[3] / 255)
+
+            # Straight-alpha "over": out_a = a + dst_a * (1 - a)
+            region = strip[row0 - top:row1 - top, col0:col1]
+            dst_alpha = region[..., 3]
+            out_alpha = alpha + dst_alpha * (1 - alpha)
+            safe_alpha = np.where(out_alpha > 0, out_alpha, 1)
+            for channel in range(3):
+                src = rgba[channel] / 255
+                region[..., channel] = (src * alpha + region[..., channel] * dst_alpha * (1 - alpha)) / safe_alpha
+            region[..., 3] = out_alpha
+
+        np.multiply(strip, 255, out=strip)
+        np.rint(strip, out=strip)
+        output[top:bottom] = strip.astype(np.uint8)
+
+    return Image.frombuffer('RGBA', (size, size), output, 'raw', 'RGBA', 0, 1)
+
+
+def render_note_icon(size=1024, note_color='#4CAF50', dot_color='#FF9800',
+                     line_color=(255, 255, 255, 80), background='#FFFFFF', samples=1):
+    """
+    Render the ephenotes note icon with anti-aliased edges.
+
+    Returns an RGB image when the background is opaque (App Store icons must
+    not have an alpha channel) and an RGBA image otherwise.
+    """
+    shapes = note_icon_shapes(size, note_color, dot_color, line_color)
+    image = render_shapes(size, shapes, background, samples)
+    if _rgba(background)[3] == 255:
+        return image.convert('RGB')
+    return image
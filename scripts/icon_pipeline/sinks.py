@@ -0,0 +1,309 @@
+"""
+Output sinks: where the generators put the files they produce.
+
+Every icon and metadata file reaches a sink as bytes already in memory (the
+encoded PNG, the rendered XML or JSON), so no sink reads back what was
+generated or goes through temporary files per icon:
+
+- FileSink writes loose files in place, atomically and in batches through a
+  BatchWriter (see output.py). It is the default, and the only sink the
+  cache manifest applies to.
+- MemorySink keeps {name: bytes}, for tooling that post-processes the icons
+  itself.
+- ZipSink and TarSink stream the files into one archive. PNGs are already
+  deflated by the encoder, so the zip stores them as they are and only
+  compresses the text files; the tar can be gzip, bzip2 or xz compressed
+  as a whole, and stores identical icons once, as hard links.
+
+Archive entries are named by their path relative to the sink's root, so an
+archive built with the repository as root unpacks over the repository. A
+path outside the root keeps its absolute path without the leading
+separator, as tar does. Entries, and the header of a gzipped tar, are
+timestamped SOURCE_DATE_EPOCH if it is set, so archives of the same files
+can be byte-identical. An archive is
+written to a hidden temporary file that replaces the target on close(), so
+an interrupted run leaves any previous archive untouched.
+
+open_sink() picks the sink from a path's suffix (ARCHIVE_SUFFIXES).
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+from . import trace
+from .output import BatchWriter, _fsync_directory, _temp_path, write_if_changed
+
+
+# Archive suffixes and the tarfile compression each one uses ('' for none)
+ARCHIVE_SUFFIXES = {
+    '.zip': None,
+    '.tar': '',
+    '.tar.gz': 'gz',
+    '.tgz': 'gz',
+    '.tar.bz2': 'bz2',
+    '.tar.xz': 'xz',
+}
+
+# Entries that are already compressed and stored as they are in a zip
+STORED_SUFFIXES = ('.png', '.ico', '.icns')
+
+
+class FileSink:
+    """
+    Loose files written in place. Image batches go through a BatchWriter;
+    single files are written with write_if_changed(), so unchanged files
+    keep their mtimes.
+    """
+
+    in_place = True
+
+    def __init__(self, fsync=False):
+        self.fsync = fsync
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def batch(self):
+        """A context manager with write() and link() for a batch of images."""
+        return BatchWriter(fsync=self.fsync)
+
+    def write(self, path, data):
+        """Write one file, returning True if it changed."""
+        return write_if_changed(path, data)
+
+    def keep(self, path):
+        """Make the existing file at path part of the output (it already is)."""
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def close(self):
+        pass
+
+
+class MemorySink:
+    """Every file as {name: bytes}, named relative to root."""
+
+    in_place = False
+
+    def __init__(self, root='.'):
+        self.root = os.path.abspath(root)
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def name(self, path):
+        """The entry name of path: relative to root, or absolute without its anchor."""
+        path = os.path.abspath(path)
+        if os.path.commonpath([self.root, path]) == self.root:
+            name = os.path.relpath(path, self.root)
+        else:
+            name = os.path.splitdrive(path)[1].lstrip(os.sep)
+        return name.replace(os.sep, '/')
+
+    def batch(self):
+        return contextlib.nullcontext(self)
+
+    def write(self, path, data):
+        name = self.name(path)
+        with trace.span('write', path=name) as span, self._lock:
+            self._add(name, data)
+            span.set(bytes_out=len(data))
+        return True
+
+    def link(self, src, dst, data):
+        """Add dst, a copy of src (added earlier), which holds data."""
+        return self.write(dst, data)
+
+    def keep(self, path):
+        with open(path, 'rb') as f:
+            self.write(path, f.read())
+
+    def size(self, path):
+        return len(self.files[self.name(path)])
+
+    def _add(self, name, data):
+        self.files[name] = data
+
+    def close(self):
+        pass
+
+
+class _ArchiveSink(MemorySink):
+    """
+    A MemorySink that streams each file into an archive at path instead of
+    keeping its bytes; subclasses open the archive and add the entries. The
+    archive's temporary file is only created by the first file added.
+    """
+
+    def __init__(self, path, root='.', fsync=False):
+        super().__init__(root)
+        self.path = path
+        self.fsync = fsync
+        self.mtime = int(os.environ.get('SOURCE_DATE_EPOCH', time.time()))
+        self.sizes = {}
+        self._temp = _temp_path(path)
+        self._file = None
+        self._archive = None
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self._temp, 'wb')
+            self._archive = self._open_archive(self._file)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def size(self, path):
+        return self.sizes[self.name(path)]
+
+    def _add(self, name, data):
+        if name in self.sizes:
+            raise ValueError(f"{self.path}: {name} was already added")
+        self._open()
+        self._add_entry(name, data)
+        self.sizes[name] = len(data)
+
+    def close(self):
+        """Finish the archive (empty if nothing was added) and move it into place."""
+        if self._temp is None:
+            return
+        self._open()
+        with trace.span('commit', files=len(self.sizes), fsync=self.fsync):
+            self._close_archive()
+            if self.fsync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._temp, self.path)
+            if self.fsync:
+                _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+        self._temp = None
+
+    def _close_archive(self):
+        self._archive.close()
+
+    def abort(self):
+        """Drop the archive, removing its temporary file."""
+        if self._file is not None and self._temp is not None:
+            self._file.close()
+            os.remove(self._temp)
+        self._temp = None
+
+
+class ZipSink(_ArchiveSink):
+    """A zip archive that stores the PNGs and deflates the text files."""
+
+    def __init__(self, path, root='.', fsync=False):
+        import zipfile
+
+        super().__init__(path, root, fsync)
+        self._zipfile = zipfile
+        # Zip timestamps start in 1980
+        self._date_time = time.gmtime(max(self.mtime, 315532800))[:6]
+
+    def _open_archive(self, file):
+        return self._zipfile.ZipFile(file, 'w')
+
+    def _add_entry(self, name, data):
+        info = self._zipfile.ZipInfo(name, self._date_time)
+        info.external_attr = 0o644 << 16
+        if name.lower().endswith(STORED_SUFFIXES):
+            info.compress_type = self._zipfile.ZIP_STORED
+        else:
+            info.compress_type = self._zipfile.ZIP_DEFLATED
+        self._archive.writestr(info, data)
+
+
+class TarSink(_ArchiveSink):
+    """
+    A tar archive written as a stream, compressed as a whole with
+    compression ('', 'gz', 'bz2' or 'xz'). A copy of a file already in the
+    archive is stored as a hard link to it.
+    """
+
+    def __init__(self, path, root='.', fsync=False, compression=''):
+        import tarfile
+
+        super().__init__(path, root, fsync)
+        self._tarfile = tarfile
+        self.compression = compression
+        self._gzip = None
+
+    def _open_archive(self, file):
+        compression = self.compression
+        if compression == 'gz':
+            import gzip
+
+            # tarfile would stamp the gzip header with the current time
+            self._gzip = file = gzip.GzipFile(filename='', mode='wb', fileobj=file, mtime=self.mtime)
+            compression = ''
+        return self._tarfile.open(fileobj=file, mode=f'w|{compression}', format=self._tarfile.PAX_FORMAT)
+
+    def _close_archive(self):
+        self._archive.close()
+        if self._gzip is not None:
+            self._gzip.close()
+
+    def _info(self, name, size):
+        info = self._tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = self.mtime
+        info.mode = 0o644
+        return info
+
+    def _add_entry(self, name, data):
+        import io
+
+        # BytesIO shares the bytes object until it is written to
+        self._archive.addfile(self._info(name, len(data)), io.BytesIO(data))
+
+    def link(self, src, dst, data):
+        source, name = self.name(src), self.name(dst)
+        if source not in self.sizes:
+            return self.write(dst, data)
+        with trace.span('link', path=name), self._lock:
+            if name in self.sizes:
+                raise ValueError(f"{self.path}: {name} was already added")
+            info = self._info(name, 0)
+            info.type = self._tarfile.LNKTYPE
+            info.linkname = source
+            self._archive.addfile(info)
+            self.sizes[name] = len(data)
+        return True
+
+
+def archive_suffix(path):
+    """The ARCHIVE_SUFFIXES key path ends with, or None."""
+    lower = path.lower()
+    return next((suffix for suffix in ARCHIVE_SUFFIXES if lower.endswith(suffix)), None)
+
+
+def open_sink(path=None, root='.', fsync=False):
+    """
+    A FileSink without path, else the archive sink its suffix names
+    (ARCHIVE_SUFFIXES) with entries relative to root. Raises ValueError
+    for other suffixes.
+    """
+    if path is None:
+        return FileSink(fsync)
+    suffix = archive_suffix(path)
+    if suffix is None:
+        raise ValueError(f"{path}: unknown archive type (use {', '.join(ARCHIVE_SUFFIXES)})")
+    if suffix == '.zip':
+        return ZipSink(path, root, fsync)
+    return TarSink(path, root, fsync, ARCHIVE_SUFFIXES[suffix])
@@ -0,0 +1,173 @@
+"""
+SVG masters, rasterized directly at every target size.
+
+An SvgMaster stands in for the master image of a Renderer (see render.py):
+instead of resizing one large bitmap, every job's size is rasterized from
+the vector document at exactly that many pixels. Small icons are drawn on
+their own pixel grid rather than averaged down from 1024 pixels, so 20-48
+pixel icons keep crisp edges, and no large bitmap is decoded or resampled.
+
+Small-size hints are separate documents next to the master named
+<stem>.<N>.svg (icon.48.svg, icon.24.svg, ...): each is drawn instead of
+the master for every size up to N pixels, the smallest such N winning. They
+can use thicker strokes or drop details that would not survive at that
+size.
+
+Documents are rasterized with CairoSVG (pip install cairosvg, which needs
+the Cairo library). Each document is parsed once per process and the
+parsed tree is kept in a small cache, so all sizes drawn from one document
+share a single parse. An SvgMaster pickles as its document bytes, a few
+kilobytes, so a Renderer with worker processes sends it to every worker
+instead of a bitmap in shared memory, and the sizes are rasterized in
+parallel; each worker parses each document once.
+"""
+
+import functools
+import hashlib
+import os
+import re
+import sys
+
+from . import trace
+
+
+# Bump whenever a change to this module alters the rasterized pixels
+SVG_VERSION = 1
+
+# Nominal size of an SvgMaster, for code that needs the master as an image
+MASTER_SIZE = 1024
+
+# CairoSVG's CSS pixel density; output sizes are given in pixels anyway
+DPI = 96
+
+# <stem>.<N>.svg: a hint drawn for sizes up to N pixels
+_OVERRIDE_RE = re.compile(r'^(?P<stem>.+)\.(?P<size>\d+)\.svg$', re.IGNORECASE)
+
+
+def is_svg(path):
+    """True if path names an SVG document."""
+    return isinstance(path, (str, os.PathLike)) and os.fspath(path).lower().endswith('.svg')
+
+
+def rasterizer_available():
+    """True if the CairoSVG rasterizer can be imported."""
+    import importlib.util
+
+    return importlib.util.find_spec('cairosvg') is not None
+
+
+def rasterizer_version():
+    try:
+        from importlib.metadata import version
+        return f'cairosvg {version("cairosvg")}'
+    except Exception:  # Python < 3.8 or not installed
+        return 'cairosvg'
+
+
+def find_overrides(path):
+    """{N: path} of the <stem>.<N>.svg hints next to the SVG at path."""
+    directory, name = os.path.split(os.path.abspath(path))
+    stem = os.path.splitext(name)[0]
+    overrides = {}
+    for candidate in os.listdir(directory):
+        match = _OVERRIDE_RE.match(candidate)
+        if match and match.group('stem') == stem:
+            overrides[int(match.group('size'))] = os.path.join(directory, candidate)
+    return overrides
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def svg_source_key(path):
+    """
+    Cache key of an SVG master: the hashes of the document and its hints,
+    the rasterizer version and SVG_VERSION.
+    """
+    digest = hashlib.sha256(_read(path))
+    for size, override in sorted(find_overrides(path).items()):
+        digest.update(f':{size}:'.encode())
+        digest.update(_read(override))
+    return f'svg{SVG_VERSION}:{rasterizer_version()}:{digest.hexdigest()}'
+
+
+@functools.lru_cache(maxsize=8)
+def _parse(data, url):
+    """The CairoSVG tree of a document, parsed once per process."""
+    from cairosvg.parser import Tree
+
+    with trace.span('parse-svg', bytes_in=len(data)):
+        return Tree(bytestring=data, url=url)
+
+
+def rasterize(data, size, url=None):
+    """
+    An RGBA image of the SVG document data drawn at size, scaled to fit it
+    (the document's preserveAspectRatio decides how). url resolves
+    relative references in the document.
+    """
+    from cairosvg.surface import PNGSurface
+    from PIL import Image
+
+    tree = _parse(data, url)
+    with trace.span('rasterize', size='{}x{}'.format(*size)):
+        # Drawing happens in the constructor; finish() would only write a PNG
+        surface = PNGSurface(tree, None, DPI, output_width=size[0], output_height=size[1]).cairo
+        surface.flush()
+        pixels = bytes(surface.get_data())
+    # Cairo's ARGB32 is premultiplied, in native byte order
+    rawmode = 'BGRa' if sys.byteorder == 'little' else 'aRGB'
+    return Image.frombuffer('RGBA', (surface.get_width(), surface.get_height()), pixels,
+                            'raw', rawmode, surface.get_stride(), 1)
+
+
+class SvgMaster:
+    """
+    An SVG document and its small-size hints ({N: path}, by default found
+    with find_overrides()), used as a Renderer master in place of an image.
+    size is nominal: every job is rasterized at its own size.
+    """
+
+    mode = 'RGBA'
+
+    def __init__(self, path, overrides=None, size=MASTER_SIZE):
+        self.path = os.path.abspath(path)
+        self.size = (size, size)
+        if overrides is None:
+            overrides = find_overrides(path)
+        self.overrides = {n: os.path.abspath(override) for n, override in sorted(overrides.items())}
+        self._documents = {None: _read(self.path)}
+        self._documents.update((n, _read(override)) for n, override in self.overrides.items())
+
+    def __repr__(self):
+        return f'SvgMaster({self.path!r}, hints={list(self.overrides)})'
+
+    @property
+    def digest(self):
+        """Hex SHA-256 of the documents, as render.image_digest() is for images."""
+        digest = hashlib.sha256()
+        for n, data in self._documents.items():
+            digest.update(f'{n}:{len(data)}:'.encode())
+            digest.update(data)
+        return digest.hexdigest()
+
+    def document_for(self, size):
+        """The N of the hint drawn at size (None for the master itself)."""
+        return next((n for n in self.overrides if max(size) <= n), None)
+
+    def rasterize(self, size):
+        """The master, or the hint for this size, drawn at size."""
+        n = self.document_for(size)
+        path = self.path if n is None else self.overrides[n]
+        return rasterize(self._documents[n], tuple(size), url=path)
+
+    def image(self):
+        """The master drawn at its nominal size, for code that needs pixels."""
+        return self.rasterize(self.size)
+
+
+def as_image(master):
+    """The master itself, or an SvgMaster drawn at its nominal size."""
+    return master.image() if isinstance(master, SvgMaster) else master
@@ -0,0 +1,184 @@
+"""
+Per-stage tracing of the icon pipeline.
+
+Pipeline stages wrap their work in span(name, **args): decode, make_square,
+resize, composite, encode, write, cache checks and every graph node. Each
+span records its wall time, the CPU time of its thread, the process and
+thread it ran on and free-form args such as the target size, bytes in and
+bytes out (set while the span is open with span.set()).
+
+Tracing is off by default and span() then returns a shared no-op object, so
+the instrumentation costs next to nothing. Worker processes trace when the
+parent does: Renderer pool tasks return their spans with their results
+(see drain() and merge()), so one trace shows every worker on its own row.
+
+tracing() enables tracing for a block and then writes any of:
+
+- a Chrome trace (chrome://tracing, https://ui.perfetto.dev) JSON file,
+- a summary table per span name (count, wall, CPU, bytes in/out),
+- a cProfile dump of the main process (view with pstats or snakeviz).
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+
+# One finished span; start and end are time.perf_counter() seconds, which
+# share one clock across processes on Linux, macOS and Windows
+Span = namedtuple('Span', ['name', 'category', 'start', 'end', 'cpu', 'pid', 'tid', 'args'])
+
+_enabled = False
+_spans = []
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self._cpu = time.thread_time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        cpu = time.thread_time() - self._cpu
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        _spans.append(Span(self.name, self.category, self._start, end, cpu,
+                           os.getpid(), threading.get_ident(), self.args))
+        return False
+
+    def set(self, **args):
+        """Add args (for example bytes_out) to the span while it is open."""
+        self.args.update(args)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    """Turn span recording on (or off) in this process."""
+    global _enabled
+    _enabled = on
+
+
+def span(name, category='stage', **args):
+    """Context manager recording one span, or a no-op while tracing is off."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def drain():
+    """Return and forget the spans recorded so far (used by worker tasks)."""
+    spans = _spans[:]
+    del _spans[:len(spans)]
+    return spans
+
+
+def merge(spans):
+    """Add spans recorded in another process."""
+    _spans.extend(spans)
+
+
+def chrome_trace(spans):
+    """Chrome trace event JSON (a dict) of spans, main process first."""
+    if not spans:
+        return {'traceEvents': []}
+    origin = min(s.start for s in spans)
+    main_pid = os.getpid()
+    pids = sorted({s.pid for s in spans}, key=lambda pid: (pid != main_pid, pid))
+
+    events = []
+    for number, pid in enumerate(pids):
+        label = 'main' if pid == main_pid else f'worker {number}'
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                       'args': {'name': f'{label} (pid {pid})'}})
+    for s in sorted(spans, key=lambda s: s.start):
+        events.append({
+            'name': s.name, 'cat': s.category, 'ph': 'X', 'pid': s.pid, 'tid': s.tid,
+            'ts': round((s.start - origin) * 1e6, 1), 'dur': round((s.end - s.start) * 1e6, 1),
+            'args': dict(s.args, cpu_ms=round(s.cpu * 1000, 3)),
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def summarize(spans):
+    """Rows of (name, count, wall s, cpu s, bytes in, bytes out), by total wall time."""
+    totals = {}
+    for s in spans:
+        row = totals.setdefault(s.name, [0, 0.0, 0.0, 0, 0])
+        row[0] += 1
+        row[1] += s.end - s.start
+        row[2] += s.cpu
+        row[3] += s.args.get('bytes_in', 0)
+        row[4] += s.args.get('bytes_out', 0)
+    return sorted(((name,) + tuple(row) for name, row in totals.items()),
+                  key=lambda row: row[2], reverse=True)
+
+
+def print_summary(spans):
+    """Print summarize() as a table."""
+    print(f"\n{'span':24s} {'count':>6s} {'wall ms':>10s} {'cpu ms':>10s} {'in KB':>10s} {'out KB':>10s}")
+    for name, count, wall, cpu, bytes_in, bytes_out in summarize(spans):
+        print(f"{name:24s} {count:>6d} {wall * 1000:>10.1f} {cpu * 1000:>10.1f} "
+              f"{bytes_in / 1024:>10.1f} {bytes_out / 1024:>10.1f}")
+    pids = {s.pid for s in spans}
+    if len(pids) > 1:
+        print(f"(spans from {len(pids)} processes; wall times of parallel spans overlap)")
+
+
+@contextlib.contextmanager
+def tracing(trace_path=None, summary=False, profile_path=None):
+    """
+    Trace the block if trace_path or summary is set, profile it with
+    cProfile if profile_path is set, and write the results afterwards, even
+    if the block raised.
+    """
+    active = bool(trace_path or summary)
+    profiler = None
+    if active:
+        drain()
+        enable()
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"Wrote cProfile stats to {profile_path}")
+        if active:
+            enable(False)
+            spans = drain()
+            if trace_path:
+                with open(trace_path, 'w') as f:
+                    json.dump(chrome_trace(spans), f)
+                print(f"Wrote {len(spans)} trace spans to {trace_path}")
+            if summary:
+                print_summary(spans)
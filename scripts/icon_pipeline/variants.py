@@ -0,0 +1,108 @@
+"""
+Variant (flavor) specs for batch icon generation.
+
+A spec file lists every flavor to build in one process:
+
+    {
+      "variants": [
+        {
+          "name": "ephenotes",
+          "source": "../assets/icon/master.png",
+          "adaptive_background": "#2196F3",
+          "android_res": "../android/app/src/main/res",
+          "play_store": "../android/PlayStore/AppIcon",
+          "ios_appiconset": "../ios/Runner/Assets.xcassets/AppIcon.appiconset",
+          "web": "../web",
+          "windows_icon": "../windows/runner/resources/app_icon.ico",
+          "macos_icon": "../macos/Runner/AppIcon.icns"
+        },
+        {
+          "name": "work",
+          "colors": {"note": "#3F51B5", "dot": "#FFC107"},
+          "android_res": "flavors/work/android/res",
+          "ios_appiconset": "flavors/work/ios/AppIcon.appiconset"
+        }
+      ]
+    }
+
+A variant uses either a source image or procedural colors for the created
+master icon (note and dot; both optional). All output roots are optional and
+a variant only builds the platforms it names. web is a directory that gets
+the web icons and manifest.json; windows_icon and macos_icon are the paths
+of the .ico and .icns files (see desktop.py). Relative paths are resolved
+against the spec file's directory. YAML specs with the same structure are
+read when PyYAML is installed.
+"""
+
+import json
+import os
+from collections import namedtuple
+
+
+Variant = namedtuple('Variant', [
+    'name', 'source', 'colors', 'adaptive_background',
+    'android_res', 'play_store', 'ios_appiconset', 'web', 'windows_icon', 'macos_icon',
+])
+
+_OUTPUT_KEYS = ('android_res', 'play_store', 'ios_appiconset', 'web', 'windows_icon', 'macos_icon')
+
+
+def _read_spec(spec_path):
+    with open(spec_path) as f:
+        if spec_path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required for YAML specs: pip install pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_variants(spec_path):
+    """Read a variant spec file, raising ValueError if it is invalid."""
+    spec = _read_spec(spec_path)
+    base_dir = os.path.dirname(os.path.abspath(spec_path))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base_dir, path)) if path else None
+
+    if not isinstance(spec, dict) or not isinstance(spec.get('variants'), list):
+        raise ValueError(f"{spec_path}: expected a top-level 'variants' list")
+
+    variants = []
+    names = set()
+    for index, entry in enumerate(spec['variants']):
+        name = entry.get('name') if isinstance(entry, dict) else None
+        if not name:
+            raise ValueError(f"{spec_path}: variant #{index + 1} has no name")
+        if name in names:
+            raise ValueError(f"{spec_path}: duplicate variant name '{name}'")
+        names.add(name)
+
+        if entry.get('source') and entry.get('colors'):
+            raise ValueError(f"{spec_path}: variant '{name}' sets both source and colors")
+        if not any(entry.get(key) for key in _OUTPUT_KEYS):
+            raise ValueError(f"{spec_path}: variant '{name}' has no output roots "
+                             f"({', '.join(_OUTPUT_KEYS)})")
+
+        variants.append(Variant(
+            name=name,
+            source=resolve(entry.get('source')),
+            colors=dict(entry.get('colors') or {}),
+            adaptive_background=entry.get('adaptive_background'),
+            android_res=resolve(entry.get('android_res')),
+            play_store=resolve(entry.get('play_store')),
+            ios_appiconset=resolve(entry.get('ios_appiconset')),
+            web=resolve(entry.get('web')),
+            windows_icon=resolve(entry.get('windows_icon')),
+            macos_icon=resolve(entry.get('macos_icon')),
+        ))
+
+    return variants
+
+
+def master_key(variant):
+    """Key identifying a variant's master, so flavors sharing one decode it once."""
+    if variant.source:
+        return ('source', variant.source)
+    return ('colors', variant.colors.get('note', ''), variant.colors.get('dot', ''))
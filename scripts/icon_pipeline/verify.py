@@ -0,0 +1,126 @@
+"""
+Verify an existing icon set without regenerating or decoding it.
+
+verify_icons() checks every expected file by reading only the PNG
+signature and the chunk headers in front of the image data: IHDR gives the
+dimensions, bit depth and color type, and a tRNS chunk marks transparency
+in palette, gray and RGB images. No pixel data is inflated, so Pillow is
+not needed. With an IconCache each file's SHA-256 is also compared with the
+one recorded in its manifest.
+
+Files are checked on a thread pool; a complete set takes a few
+milliseconds, where regenerating it takes seconds.
+"""
+
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+from .cache import file_digest
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color types and the Pillow mode of each; 4 and 6 carry alpha
+COLOR_TYPES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+
+# Bit depths the PNG spec allows for each color type that the generators
+# write: palette strategies pack small palettes into 1, 2 or 4 bits per
+# index (see encode.py), everything else is 8 bits per channel
+BIT_DEPTHS = {0: (8,), 2: (8,), 3: (1, 2, 4, 8), 4: (8,), 6: (8,)}
+
+PngHeader = namedtuple('PngHeader', ['width', 'height', 'bit_depth', 'color_type', 'transparent'])
+
+# One file an icon set must contain; opaque icons must not have alpha
+ExpectedIcon = namedtuple('ExpectedIcon', ['path', 'size', 'opaque'])
+ExpectedIcon.__new__.__defaults__ = (False,)
+
+
+def read_png_header(path):
+    """
+    Return the PngHeader of a PNG file, reading only the chunk headers
+    before its image data. Raises ValueError for anything that is not a
+    well-formed PNG up to there.
+    """
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("not a PNG file")
+        chunk = f.read(25)
+        if len(chunk) < 25:
+            raise ValueError("truncated IHDR chunk")
+        length, chunk_type = struct.unpack('>I4s', chunk[:8])
+        if chunk_type != b'IHDR' or length != 13:
+            raise ValueError("first chunk is not IHDR")
+        if zlib.crc32(chunk[4:21]) != struct.unpack('>I', chunk[21:])[0]:
+            raise ValueError("IHDR checksum mismatch")
+        width, height, bit_depth, color_type = struct.unpack('>IIBB', chunk[8:18])
+
+        # tRNS must come before the first IDAT; skip other chunks by length
+        transparent = color_type in (4, 6)
+        while not transparent:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("no image data")
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type in (b'IDAT', b'IEND'):
+                break
+            transparent = chunk_type == b'tRNS'
+            f.seek(length + 4, os.SEEK_CUR)
+
+    return PngHeader(width, height, bit_depth, color_type, transparent)
+
+
+def check_icon(expected, cache=None):
+    """Return the problems (strings) of one expected icon; empty if it is fine."""
+    try:
+        header = read_png_header(expected.path)
+    except FileNotFoundError:
+        return ["missing"]
+    except (OSError, ValueError) as e:
+        return [str(e)]
+
+    problems = []
+    if (header.width, header.height) != tuple(expected.size):
+        problems.append(f"is {header.width}x{header.height}, expected {expected.size[0]}x{expected.size[1]}")
+    mode = COLOR_TYPES.get(header.color_type)
+    if mode is None:
+        problems.append(f"invalid color type {header.color_type}")
+    elif header.bit_depth not in BIT_DEPTHS[header.color_type]:
+        allowed = ', '.join(map(str, BIT_DEPTHS[header.color_type]))
+        problems.append(f"bit depth {header.bit_depth}, expected {allowed} for {mode}")
+    if mode is not None and expected.opaque and header.transparent:
+        problems.append(f"has transparency ({mode}"
+                        f"{' + tRNS' if header.color_type not in (4, 6) else ''}), but must be opaque")
+
+    if cache is not None:
+        recorded = cache.recorded_digest(expected.path)
+        if recorded is None:
+            problems.append("not in the manifest")
+        elif file_digest(expected.path) != recorded:
+            problems.append("content differs from the manifest")
+    return problems
+
+
+def expected_icons(nodes, names=None, opaque_tag=None):
+    """
+    ExpectedIcon of every image node of a build graph (only those in names,
+    if given); nodes tagged opaque_tag must be opaque.
+    """
+    return [ExpectedIcon(node.target[1], node.target[2].canvas_size or node.target[2].size,
+                         opaque_tag in node.tags)
+            for node in nodes
+            if node.target is not None and (names is None or node.name in names)]
+
+
+def verify_icons(expected, cache=None, threads=8):
+    """
+    Check every ExpectedIcon in parallel. Returns [(path, problem), ...] in
+    the order of expected; an empty list means the set is complete.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    expected = list(expected)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda icon: check_icon(icon, cache), expected))
+    return [(icon.path, problem) for icon, problems in zip(expected, results) for problem in problems]
@@ -0,0 +1,144 @@
+"""
+Watch mode: regenerate icons whenever their inputs change.
+
+watch() keeps the generator process alive between rebuilds, so Pillow stays
+imported and the rebuild callback can keep its Renderer (decoded master,
+pyramid levels and encoded results) and worker pool warm. Inputs are watched
+with native file system notifications (inotify, FSEvents, ...) when watchdog
+is installed, otherwise by polling their size and mtime. Either way a change
+only counts once the stat of an input differs, and a burst of saves is
+collapsed into one rebuild once the inputs have been quiet for the debounce
+interval.
+
+Every cycle reports its latency: the rebuild time and the time from the
+first detected change to the finished outputs, plus which outputs were
+actually rewritten (the generators leave files with unchanged bytes alone,
+so their stat does not change).
+"""
+
+import os
+import threading
+import time
+
+try:
+    from watchdog.observers import Observer
+except ImportError:  # no native notifications: poll instead
+    Observer = None
+
+
+DEFAULT_INTERVAL = 0.1
+DEFAULT_DEBOUNCE = 0.2
+
+
+def stat_snapshot(paths):
+    """{path: (mtime_ns, size)} of each path, None for missing files."""
+    snapshot = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            snapshot[path] = None
+        else:
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+def changed_paths(before, after):
+    """Paths whose stat differs between two snapshots, in after's order."""
+    return [path for path in after if before.get(path) != after[path]]
+
+
+class _Wakeup:
+    """watchdog event handler that wakes the watch loop on any event."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def dispatch(self, event):
+        self.event.set()
+
+
+def _start_observer(paths):
+    if Observer is None:
+        return None, None
+    wakeup = _Wakeup()
+    observer = Observer()
+    for directory in sorted({os.path.dirname(os.path.abspath(path)) for path in paths}):
+        observer.schedule(wakeup, directory, recursive=False)
+    observer.start()
+    return observer, wakeup
+
+
+def wait_for_change(paths, snapshot, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, wakeup=None):
+    """
+    Block until an input changes and then stays unchanged for debounce
+    seconds. Returns (new snapshot, changed paths, time.perf_counter() of the
+    first detected change).
+    """
+    def pause(timeout):
+        if wakeup is None:
+            time.sleep(timeout)
+        elif wakeup.event.wait(timeout):
+            wakeup.event.clear()
+
+    while True:
+        pause(interval if wakeup is None else None)
+        current = stat_snapshot(paths)
+        if current != snapshot:
+            break
+    detected = time.perf_counter()
+
+    # Debounce: editors often write a file several times per save
+    settled = time.perf_counter()
+    while time.perf_counter() - settled < debounce:
+        time.sleep(min(interval, debounce))
+        latest = stat_snapshot(paths)
+        if latest != current:
+            current = latest
+            settled = time.perf_counter()
+
+    return current, changed_paths(snapshot, current), detected
+
+
+def watch(inputs, rebuild, outputs=(), interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+    """
+    Call rebuild(changed_inputs) every time one of inputs changes, until
+    interrupted with Ctrl+C.
+
+    outputs are the files the rebuild writes; the ones whose stat changed
+    are listed after each cycle. An exception in rebuild (for example a
+    source saved half-way) is reported and the next change retried.
+    """
+    inputs = list(inputs)
+    outputs = list(outputs)
+    observer, wakeup = _start_observer(inputs)
+    mode = 'file system notifications' if observer is not None else f'polling every {interval * 1000:.0f} ms'
+    print(f"\nWatching {', '.join(inputs)} ({mode}); press Ctrl+C to stop")
+
+    snapshot = stat_snapshot(inputs)
+    try:
+        while True:
+            snapshot, changed, detected = wait_for_change(inputs, snapshot, interval, debounce, wakeup)
+            print(f"\nChanged: {', '.join(changed)}")
+
+            before = stat_snapshot(outputs)
+            start = time.perf_counter()
+            try:
+                rebuild(changed)
+            except Exception as e:
+                print(f"Rebuild failed: {e}")
+                continue
+            done = time.perf_counter()
+
+            rewritten = changed_paths(before, stat_snapshot(outputs))
+            print(f"Rebuilt in {(done - start) * 1000:.0f} ms, "
+                  f"{(done - detected) * 1000:.0f} ms after the change "
+                  f"({len(rewritten)} of {len(outputs)} files rewritten)")
+            for path in rewritten:
+                print(f"  {path}")
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()